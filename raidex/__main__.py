@@ -6,9 +6,10 @@ import structlog
 from raidex.raidex_node.api.app import APIServer
 from raidex.app import App
 from raidex.message_broker.message_broker import MessageBroker
+from raidex.raidex_node.architecture.event_architecture import default_context
 from raidex.commitment_service.node import CommitmentService
 from raidex.raidex_node.bots import LiquidityProvider, RandomWalker, Manipulator
-from raidex.constants import RTT_ADDRESS, WETH_ADDRESS, CS_ADDRESS
+from raidex.constants import RTT_ADDRESS, WETH_ADDRESS, CS_ADDRESS, MATCHING_ALGORITHMS
 
 structlog.configure()
 #':WARNING,bots.manipulator:DEBUG'
@@ -34,6 +35,9 @@ def main():
                         default='localhost')
     parser.add_argument("--broker-port", type=int, help='Specify the port for the message broker, default is 5000',
                         default=5000)
+    parser.add_argument("--broker-multiplex-port", type=int, default=None,
+                        help='Carry all topics over one connection to this port of the message broker, '
+                             'instead of HTTP requests. Not supported by a partitioned broker')
     parser.add_argument("--trader-host", type=str, help='Specify the host for the trader mock, default is localhost',
                         default='localhost')
     parser.add_argument("--trader-port", type=int, help='Specify the port for the trader mock, default is 5001',
@@ -43,11 +47,20 @@ def main():
                                                   <Options:\"liquidity\", \"random\", \"manipulator\">')
     parser.add_argument('--token-address', type=str, help='Token address of token to trade against WETH on kovan',
                         default=RTT_ADDRESS)
+    parser.add_argument('--matching', type=str, choices=sorted(MATCHING_ALGORITHMS), default='limit',
+                        help='Matching algorithm for new limit orders, default is limit')
+
+    parser.add_argument('--journal-dir', type=str, default=None,
+                        help='Journal all state changes in this directory and restore the state from it on start')
+    parser.add_argument('--trace-events', action='store_true', help='Print every event and state change when handled')
 
     args = parser.parse_args()
 
+    if args.trace_events is True:
+        default_context.trace_events()
+
     if args.mock_networking is True:
-        message_broker = MessageBroker()
+        message_broker = MessageBroker(retain_offers=True)
         commitment_service = CommitmentService.build_service(message_broker, fee_rate=1)
         raidex_app = App.build_from_mocks(message_broker,
                                           commitment_service.address,
@@ -55,7 +68,8 @@ def main():
                                           quote_token_addr=WETH_ADDRESS,
                                           keyfile=args.keyfile,
                                           pw_file=args.pwfile,
-                                          offer_lifetime=args.offer_lifetime)
+                                          offer_lifetime=args.offer_lifetime,
+                                          matching_algorithm=MATCHING_ALGORITHMS[args.matching])
         commitment_service.start()
     else:
         raidex_app = App.build_default_from_config(keyfile=args.keyfile,
@@ -65,9 +79,12 @@ def main():
                                                    quote_token_addr=WETH_ADDRESS,
                                                    message_broker_host=args.broker_host,
                                                    message_broker_port=args.broker_port,
+                                                   message_broker_multiplex_port=args.broker_multiplex_port,
                                                    trader_host=args.trader_host,
                                                    trader_port=args.trader_port,
-                                                   offer_lifetime=args.offer_lifetime)
+                                                   offer_lifetime=args.offer_lifetime,
+                                                   matching_algorithm=MATCHING_ALGORITHMS[args.matching],
+                                                   journal_dir=args.journal_dir)
     raidex_app.start()
 
     if args.api is True:
@@ -12,42 +12,76 @@ from raidex.raidex_node.transport.handle_events import handle_event as transport
 from raidex.raidex_node.raidex_node import RaidexNode
 from raidex.raidex_node.trader.listener.handle_events import handle_event as raiden_listener_handle_event
 from raidex.raidex_node.trader.listener.raiden_listener import RaidenListener
-from raidex.raidex_node.architecture.event_architecture import event_dispatch, state_change_dispatch
-from raidex.raidex_node.handle_state_change import handle_state_change
+from raidex.raidex_node.architecture.event_architecture import default_context
+from raidex.raidex_node.architecture.journal import StateChangeJournal
+from raidex.raidex_node.handle_state_change import handle_state_change, handle_state_changes
 from raidex.raidex_node.trader.listener.listen_for_events import raiden_poll
+from raidex.constants import MATCHING_ALGORITHM
 
 
 class App:
+    """Connects the components of a node.
 
-    def __init__(self, trader, cs_client, transport, market, raidex_node):
+    Args:
+        dispatch (DispatchContext): where the events and state changes of the node are dispatched, the
+            `default_context` if not given. Nodes that run in the same process need a context each.
+    """
+
+    def __init__(self, trader, cs_client, transport, market, raidex_node, dispatch=None):
 
         self.trader = trader
         self.raiden_listener = RaidenListener(trader)
-        self.raiden_poll = raiden_poll(trader)
+        self.raiden_poll = None
         self.cs_client = cs_client
         self.transport = transport
         self.market = market
         self.raidex_node = raidex_node
+        self.dispatch = dispatch if dispatch is not None else default_context
+        self.raidex_node.dispatch = self.dispatch
+        # the greenlet that started the node, the tasks it spawned find their dispatch context through it
+        self._start_task = None
 
         self._setup_event_handling()
         self._setup_state_change_handling()
 
     def _setup_event_handling(self):
+        event_dispatch = self.dispatch.event_dispatch
         event_dispatch.connect_consumer(self.trader, trader_handle_event)
         event_dispatch.connect_consumer(self.cs_client, cs_handle_event)
         event_dispatch.connect_consumer(self.transport, transport_handle_event)
         event_dispatch.connect_consumer(self.raiden_listener, raiden_listener_handle_event)
 
     def _setup_state_change_handling(self):
-        state_change_dispatch.connect_consumer(self.raidex_node, handle_state_change)
+        self.dispatch.state_change_dispatch.connect_consumer(self.raidex_node, handle_state_change,
+                                                             handle_state_changes)
 
     def start(self):
+        self._start_task = self.dispatch.spawn(self._start)
+        self._start_task.get()
+
+    def _start(self):
+        # rebuild the state before any new state change is handled
+        self.raidex_node.restore()
         self.raidex_node.start()
+        self.cs_client.start()
         # start task for updating the balance of the trader:
         self.trader.start()
-        self.raiden_poll.start()
-        event_dispatch.start_consumer_tasks()
-        state_change_dispatch.start_consumer_tasks()
+        self.raiden_poll = self.start_raiden_poll()
+        self.dispatch.start_consumer_tasks()
+
+    def stop(self):
+        self.dispatch.stop_consumer_tasks()
+        if self.raiden_poll is not None:
+            self.raiden_poll.kill()
+            self.raiden_poll = None
+        self.cs_client.stop()
+        self.raidex_node.stop()
+
+    def start_raiden_poll(self):
+        """Starts the task that passes on the payments received by the trader as events"""
+        task = raiden_poll(self.trader)
+        task.start()
+        return task
 
     @classmethod
     def build_default_from_config(cls,
@@ -60,9 +94,12 @@ class App:
                                   quote_token_addr=None,
                                   message_broker_host='127.0.0.1',
                                   message_broker_port=5000,
+                                  message_broker_multiplex_port=None,
                                   trader_host='127.0.0.1',
                                   trader_port=5001,
-                                  offer_lifetime=None):
+                                  offer_lifetime=None,
+                                  matching_algorithm=MATCHING_ALGORITHM,
+                                  journal_dir=None):
 
         if keyfile is not None and pw_file is not None:
             pw = pw_file.read()
@@ -80,13 +117,16 @@ class App:
 
         trader_client = TraderClient(signer.checksum_address, host=trader_host, port=trader_port, market=token_pair)
         message_broker = MessageBrokerClient(host=message_broker_host, port=message_broker_port,
-                                             address=signer.checksum_address)
+                                             address=signer.checksum_address,
+                                             multiplex_port=message_broker_multiplex_port)
 
         transport = Transport(message_broker, signer)
 
         commitment_service_client = CommitmentServiceClient(signer, token_pair, message_broker, cs_address, fee_rate=cs_fee_rate)
 
-        raidex_node = RaidexNode(signer.address, token_pair, message_broker, trader_client)
+        journal = StateChangeJournal(journal_dir) if journal_dir is not None else None
+        raidex_node = RaidexNode(signer.address, token_pair, message_broker, trader_client, matching_algorithm,
+                                 journal)
 
         # if mock_trading_activity is True:
         #    raise NotImplementedError('Trading Mocking disabled a the moment')
@@ -100,7 +140,7 @@ class App:
     @classmethod
     def build_from_mocks(cls, message_broker, cs_address, keyfile=None, pw_file=None, privkey_seed=None,
                          cs_fee_rate=0.01, base_token_addr=None,
-                         quote_token_addr=None, offer_lifetime=None):
+                         quote_token_addr=None, offer_lifetime=None, matching_algorithm=MATCHING_ALGORITHM):
 
         if keyfile is not None and pw_file is not None:
             pw = pw_file.read()
@@ -120,7 +160,7 @@ class App:
 
         commitment_service_client = CommitmentServiceClient(signer, token_pair, message_broker, cs_address, fee_rate=cs_fee_rate)
 
-        raidex_node = RaidexNode(signer.address, token_pair, message_broker, trader_client)
+        raidex_node = RaidexNode(signer.address, token_pair, message_broker, trader_client, matching_algorithm)
 
         if offer_lifetime is not None:
             raidex_node.default_offer_lifetime = offer_lifetime
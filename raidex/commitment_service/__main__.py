@@ -20,10 +20,20 @@ def main():
                         default='localhost')
     parser.add_argument("--broker-port", type=int, help='Specify the port for the message broker, default is 5000',
                         default=5000)
+    parser.add_argument("--broker-multiplex-port", type=int, default=None,
+                        help='Carry all topics over one connection to this port of the message broker, '
+                             'instead of HTTP requests. Not supported by a partitioned broker')
     parser.add_argument("--trader-host", type=str, help='Specify the host for the trader mock, default is localhost',
                         default='localhost')
     parser.add_argument("--trader-port", type=int, help='Specify the port for the trader mock, default is 5001',
                         default=5001)
+    parser.add_argument("--parallel-verification", action='store_true',
+                        help='Recover the signers of inbound messages in a pool of native threads')
+    parser.add_argument("--verifier-threads", type=int, help='Number of signature verification threads, '
+                                                             'default is the number of cpus', default=None)
+    parser.add_argument("--store", type=str, help='Path of the database that the swaps, refunds and queued '
+                                                  'messages are kept in, to resume them after a restart',
+                        default=None)
 
     args = parser.parse_args()
 
@@ -31,9 +41,13 @@ def main():
                                                          pw_file=args.pwfile,
                                                          message_broker_host=args.broker_host,
                                                          message_broker_port=args.broker_port,
+                                                         message_broker_multiplex_port=args.broker_multiplex_port,
                                                          trader_host=args.trader_host,
                                                          trader_port=args.trader_port,
-                                                         fee_rate=0)
+                                                         fee_rate=0,
+                                                         parallel_verification=args.parallel_verification,
+                                                         verifier_threads=args.verifier_threads,
+                                                         store_path=args.store)
     commitment_service.start()
 
     stop_event.wait()
@@ -1,3 +1,4 @@
+import gevent
 import structlog
 from gevent.queue import PriorityQueue, Queue
 
@@ -5,6 +6,8 @@ from raidex.raidex_node.transport.client import MessageBrokerClient
 from raidex.raidex_node.trader.client import TraderClient
 from raidex.account import Account
 from raidex.signing import Signer
+from raidex.commitment_service.store import CommitmentServiceStore
+from raidex.commitment_service.swap import SwapFactory
 from raidex.commitment_service.tasks import (
     RefundTask,
     MessageSenderTask,
@@ -40,7 +43,7 @@ class CommitmentMismatch(RaidexException):
 
 class CommitmentService(object):
 
-    def __init__(self, signer, message_broker, trader_client, fee_rate=None):
+    def __init__(self, signer, message_broker, trader_client, fee_rate=None, store=None):
         self._sign = signer.sign
         self.address = signer.address
         self.swaps = dict()  # offer_hash -> CommitmentTuple
@@ -49,16 +52,47 @@ class CommitmentService(object):
         self.fee_rate = fee_rate
         self.message_broker = message_broker
         self.refund_queue = PriorityQueue()  # type: (TransferReceipt, substract_fee <bool>)
-        self.message_queue = Queue()  # type: (messages.Signed, recipient (str) or None)
+        # type: (messages.Signed, recipient (str) or None, key in the store or None)
+        self.message_queue = Queue()
+        self.store = store  # type: CommitmentServiceStore
+        self._tasks = list()
 
     def start(self):
+        if self.store is not None:
+            self.resume()
         self.trader_client.start()
-        CommitmentTask(self.swaps, self.refund_queue, self.message_queue, self.message_broker, self.address).start()
-        CancellationRequestTask(self.swaps, self.message_broker, self.address).start()
-        SwapExecutionTask(self.swaps, self.message_broker, self.address).start()
-        TransferReceivedTask(self.swaps, self.trader_client).start()
-        RefundTask(self.trader_client, self.refund_queue, KOVAN_RTT_ADDRESS, self.fee_rate).start()
-        MessageSenderTask(self.message_broker, self.message_queue, self._sign).start()
+        self._tasks = [
+            CommitmentTask(self.swaps, self.refund_queue, self.message_queue, self.message_broker, self.address,
+                           self.store),
+            CancellationRequestTask(self.swaps, self.message_broker, self.address),
+            SwapExecutionTask(self.swaps, self.message_broker, self.address),
+            TransferReceivedTask(self.swaps, self.trader_client),
+            RefundTask(self.trader_client, self.refund_queue, KOVAN_RTT_ADDRESS, self.fee_rate, self.store),
+            MessageSenderTask(self.message_broker, self.message_queue, self._sign, self.store),
+        ]
+        for task in self._tasks:
+            task.start()
+
+    def resume(self):
+        """Restores the swaps, pending refunds and queued messages of the store and re-arms the swap timeouts"""
+        swap_records, refunds, queued_messages = self.store.load()
+        factory = SwapFactory(self.swaps, self.refund_queue, self.message_queue, self.store)
+        for record in swap_records:
+            factory.restore_swap(record)
+        for refund in refunds:
+            self.refund_queue.put(refund)
+        for queued_message in queued_messages:
+            self.message_queue.put(queued_message)
+        log.info('Resumed from store', swaps=len(swap_records), refunds=len(refunds),
+                 messages=len(queued_messages))
+
+    def stop(self):
+        gevent.killall(self._tasks)
+        self._tasks = list()
+        for swap in self.swaps.values():
+            swap.cancel_timeout()
+        if self.store is not None:
+            self.store.close()
 
     @property
     def checksum_address(self):
@@ -70,20 +104,30 @@ class CommitmentService(object):
                       pw_file=None,
                       message_broker_host='127.0.0.1',
                       message_broker_port=5000,
+                      message_broker_multiplex_port=None,
                       trader_host='127.0.0.1',
                       trader_port=5003,
-                      fee_rate=None):
+                      fee_rate=None,
+                      parallel_verification=False,
+                      verifier_threads=None,
+                      store_path=None):
 
         pw = pw_file.read()
         if pw != '':
             pw = pw.splitlines()[0]
         acc = Account.load(file=keyfile, password=pw)
         signer = Signer.from_account(acc)
-        message_broker_client = MessageBrokerClient(host=message_broker_host, port=message_broker_port)
+        message_broker_client = MessageBrokerClient(host=message_broker_host,
+                                                    port=message_broker_port,
+                                                    multiplex_port=message_broker_multiplex_port,
+                                                    parallel_verification=parallel_verification,
+                                                    verifier_threads=verifier_threads)
         trader_client = TraderClient(signer.canonical_address,
                                      host=trader_host,
                                      port=trader_port,
                                      api_version='v1',
                                      commitment_amount=10)
 
-        return cls(signer, message_broker_client, trader_client, fee_rate)
+        store = CommitmentServiceStore(store_path) if store_path is not None else None
+
+        return cls(signer, message_broker_client, trader_client, fee_rate, store)
@@ -11,6 +11,8 @@ class Refund(object):
         self.receipt = receipt
         self.priority = priority
         self.claim_fee = claim_fee
+        # key of the refund in the `CommitmentServiceStore`
+        self.key = None
 
     def __eq__(self, other):
         if self.priority == other.priority:
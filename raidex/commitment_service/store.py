@@ -0,0 +1,161 @@
+import os
+import pickle
+import sqlite3
+
+import gevent
+import structlog
+from gevent.lock import Semaphore
+
+log = structlog.get_logger('commitment_service.store')
+
+# commit the recorded changes at most this many seconds after they were recorded
+DEFAULT_COMMIT_INTERVAL = 0.05
+# ... or as soon as this many changes are waiting
+DEFAULT_MAX_UNCOMMITTED = 1000
+
+TABLES = ('swaps', 'refunds', 'messages')
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, data BLOB NOT NULL)'.format(table) for table in TABLES
+]
+
+
+class CommitmentServiceStore(object):
+    """Embedded SQLite store of the swaps, the pending refunds and the queued outbound messages of a commitment
+    service, that `CommitmentService.start` resumes from.
+
+    A swap is recorded after each of its transitions and deleted when it is processed. A refund or a message is
+    recorded when it is queued and deleted when it went out.
+
+    The changes are kept in memory and committed in groups (group commit), in one transaction on a thread of the
+    hub's threadpool: after `commit_interval` seconds, or as soon as `max_uncommitted` changes are waiting. Repeated
+    changes of the same record within a group are written once. A crash can lose the changes of the last
+    `commit_interval`.
+
+    Args:
+        path (str): the SQLite database file
+    """
+
+    def __init__(self, path, commit_interval=DEFAULT_COMMIT_INTERVAL, max_uncommitted=DEFAULT_MAX_UNCOMMITTED):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.max_uncommitted = max_uncommitted
+        self._connection = None
+        self._pending = {table: dict() for table in TABLES}  # key -> pickled data, None for a deletion
+        self._uncommitted = 0
+        self._next_key = 0
+        self._commit_task = None
+        self._commit_lock = Semaphore()
+
+    def load(self):
+        """Opens the store.
+
+        Returns:
+            (list, list, list): the recorded swaps as returned by `SwapCommitment.to_record`, the `Refund`s and
+            the (message, recipient, key) tuples of the queued messages
+        """
+        assert self._connection is None, 'store already loaded'
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._connection:
+            for statement in SCHEMA:
+                self._connection.execute(statement)
+
+        loaded = dict()
+        for table in TABLES:
+            rows = self._connection.execute('SELECT key, data FROM {} ORDER BY rowid'.format(table)).fetchall()
+            loaded[table] = [(key, pickle.loads(data)) for key, data in rows]
+        keys = [int(key) for table in ('refunds', 'messages') for key, _ in loaded[table]]
+        self._next_key = max(keys) + 1 if keys else 0
+
+        refunds = list()
+        for key, refund in loaded['refunds']:
+            refund.key = key
+            refunds.append(refund)
+        messages = [(msg, recipient, key) for key, (msg, recipient) in loaded['messages']]
+        return [record for _, record in loaded['swaps']], refunds, messages
+
+    def _new_key(self):
+        key = str(self._next_key)
+        self._next_key += 1
+        return key
+
+    def _put(self, table, key, data):
+        self._pending[table][key] = data
+        self._uncommitted += 1
+        if self._uncommitted == self.max_uncommitted:
+            # a referenced commit task hasn't started yet, see `_commit_later`
+            if self._commit_task is not None:
+                self._commit_task.kill(block=False)
+            self._commit_task = gevent.spawn(self._commit_later)
+        elif self._commit_task is None:
+            self._commit_task = gevent.spawn_later(self.commit_interval, self._commit_later)
+
+    def update_swap(self, swap):
+        """Records the swap's current state, a processed swap is deleted"""
+        if swap.state == 'processed':
+            self._put('swaps', str(swap.offer_id), None)
+        else:
+            self._put('swaps', str(swap.offer_id), pickle.dumps(swap.to_record(), pickle.HIGHEST_PROTOCOL))
+
+    def add_refund(self, refund):
+        refund.key = self._new_key()
+        self._put('refunds', refund.key, pickle.dumps(refund, pickle.HIGHEST_PROTOCOL))
+
+    def remove_refund(self, refund):
+        if refund.key is not None:
+            self._put('refunds', refund.key, None)
+
+    def add_message(self, msg, recipient):
+        key = self._new_key()
+        self._put('messages', key, pickle.dumps((msg, recipient), pickle.HIGHEST_PROTOCOL))
+        return key
+
+    def remove_message(self, key):
+        if key is not None:
+            self._put('messages', key, None)
+
+    def _commit_later(self):
+        self._commit_task = None
+        self.commit()
+
+    def commit(self):
+        """Writes the waiting changes in one transaction, off the hub"""
+        with self._commit_lock:
+            self._commit_pending()
+
+    def _commit_pending(self):
+        # with the commit lock held
+        if not self._uncommitted or self._connection is None:
+            return
+        pending = self._pending
+        self._pending = {table: dict() for table in TABLES}
+        self._uncommitted = 0
+        gevent.get_hub().threadpool.apply(self._write, (pending,))
+        log.debug('Committed', changes=sum(len(changes) for changes in pending.values()))
+
+    def _write(self, pending):
+        with self._connection:
+            for table, changes in pending.items():
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO {} (key, data) VALUES (?, ?)'.format(table),
+                    [(key, data) for key, data in changes.items() if data is not None])
+                self._connection.executemany(
+                    'DELETE FROM {} WHERE key = ?'.format(table),
+                    [(key,) for key, data in changes.items() if data is None])
+
+    def close(self):
+        """Commits the waiting changes and closes the database, after the commit that is under way if any"""
+        # a referenced commit task hasn't started yet, see `_commit_later`. A running commit isn't referenced,
+        # it holds the commit lock until its transaction is written
+        if self._commit_task is not None:
+            self._commit_task.kill()
+            self._commit_task = None
+        with self._commit_lock:
+            if self._connection is None:
+                return
+            self._commit_pending()
+            self._connection.close()
+            self._connection = None
@@ -8,21 +8,33 @@ from raidex.commitment_service.swap_state_machine import SwapStateMachine
 
 class SwapFactory(object):
 
-    def __init__(self, swaps, refund_queue, message_queue):
+    def __init__(self, swaps, refund_queue, message_queue, store=None):
         self.swaps = swaps
         self.refund_queue = refund_queue
         self.message_queue = message_queue
+        self.store = store
 
     def make_swap(self, offer_id):
         swap = None
         if not self.id_collides(offer_id):
-            swap = SwapCommitment(offer_id, send_func=self._queue_send, refund_func=self._queue_refund,
-                                  cleanup_func=lambda id_=offer_id: self.cleanup_swap(id_))
-
+            swap = self._new_swap(offer_id)
             self.swaps[offer_id] = swap
 
         return swap
 
+    def restore_swap(self, record):
+        """Rebuilds a swap from its record in the `CommitmentServiceStore` and re-arms its timeout"""
+        swap = self._new_swap(record['offer_id'])
+        swap.restore(record)
+        self.swaps[swap.offer_id] = swap
+        swap.resume_timeout()
+        return swap
+
+    def _new_swap(self, offer_id):
+        record_func = self.store.update_swap if self.store is not None else None
+        return SwapCommitment(offer_id, send_func=self._queue_send, refund_func=self._queue_refund,
+                              cleanup_func=lambda id_=offer_id: self.cleanup_swap(id_), record_func=record_func)
+
     def cleanup_swap(self, offer_id):
         del self.swaps[offer_id]
 
@@ -31,18 +43,38 @@ class SwapFactory(object):
 
     def _queue_refund(self, transfer_receipt, priority, claim_fee):
         refund = Refund(transfer_receipt, priority, claim_fee)
+        if self.store is not None:
+            self.store.add_refund(refund)
         self.refund_queue.put(refund)
 
     def _queue_send(self, msg, topic):
-        self.message_queue.put((msg, topic))
+        key = self.store.add_message(msg, topic) if self.store is not None else None
+        self.message_queue.put((msg, topic, key))
 
 
 class SwapCommitment(object):
 
-    def __init__(self, offer_id, send_func, refund_func, cleanup_func=None, auto_spawn_timeout=True):
+    # the fields that are recorded in the `CommitmentServiceStore`, besides the state
+    RECORD_FIELDS = [
+        'offer_id',
+        'maker_commitment_msg',
+        'taker_commitment_msg',
+        'maker_commitment_proof',
+        'maker_swap_execution_msg',
+        'taker_swap_execution_msg',
+        'maker_transfer_receipt',
+        'taker_transfer_receipt',
+        'terminated_state',
+        'secret',
+        'secret_hash',
+    ]
+
+    def __init__(self, offer_id, send_func, refund_func, cleanup_func=None, auto_spawn_timeout=True,
+                 record_func=None):
         self._send_func = send_func
         self._refund_func = refund_func
         self._cleanup_func = cleanup_func
+        self._record_func = record_func
 
         self.offer_id = offer_id
         self.maker_commitment_msg = None
@@ -91,24 +123,51 @@ class SwapCommitment(object):
     def queue_refund(self, transfer_receipt, priority=1, claim_fee=False):
         self._refund_func(transfer_receipt, priority, claim_fee)
 
+    def to_record(self):
+        record = {name: getattr(self, name) for name in self.RECORD_FIELDS}
+        record['state'] = self._state_machine.state
+        record['taker_commitment_pool'] = self._state_machine.taker_commitment_pool
+        return record
+
+    def restore(self, record):
+        for name in self.RECORD_FIELDS:
+            setattr(self, name, record[name])
+        self._state_machine.set_state(record['state'])
+        self._state_machine.taker_commitment_pool = record['taker_commitment_pool']
+
+    def resume_timeout(self):
+        """Re-arms the timeout of a restored swap, that was spawned with the maker commitment"""
+        if self._state_machine.auto_spawn_timeout and self.maker_commitment_msg is not None \
+                and self.terminated_state is None:
+            self._state_machine.arm_timeout(self.maker_commitment_msg.timeout)
+
+    def _trigger(self, trigger, **kwargs):
+        changed = self._state_machine.trigger(trigger, **kwargs)
+        if changed and self._record_func is not None:
+            self._record_func(self)
+        return changed
+
+    def cancel_timeout(self):
+        self._state_machine.cancel_timeout()
+
     def trigger_timeout(self):
-        self._state_machine.timeout()
+        self._trigger('timeout')
 
     def hand_swap_execution_msg(self, message):
         print("hand swap execution message")
-        self._state_machine.swap_execution_msg(msg=message)
+        self._trigger('swap_execution_msg', msg=message)
 
     def hand_maker_commitment_msg(self, message):
         print("hand_maker_commitment")
-        self._state_machine.maker_commitment_msg(msg=message)
+        self._trigger('maker_commitment_msg', msg=message)
 
     def hand_taker_commitment_msg(self, message):
         print("hand_taker_commitment")
-        self._state_machine.taker_commitment_msg(msg=message)
+        self._trigger('taker_commitment_msg', msg=message)
 
     def hand_transfer_receipt(self, transfer_receipt):
         # TODO check here if offer_id's match?
-        self._state_machine.transfer_receipt(receipt=transfer_receipt)
+        self._trigger('transfer_receipt', receipt=transfer_receipt)
 
     def send_offer_taken(self):
         offer_taken_msg = messages.OfferTaken(self.offer_id)
@@ -153,7 +212,7 @@ class SwapCommitment(object):
         self.queue_refund(self.taker_transfer_receipt, claim_fee=True)
 
     def hand_cancellation_msg(self):
-        self._state_machine.timeout()
+        self._trigger('timeout')
 
     #def __repr__(self):
     #    return '<%s(%s)>' % (self.__class__.__name__, )
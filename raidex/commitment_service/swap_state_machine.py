@@ -1,9 +1,12 @@
+from collections import namedtuple
+
 import gevent
-from functools import wraps
-from transitions import Machine
+import structlog
 
 from raidex.utils import timestamp
 
+log = structlog.get_logger('commitment_service.swap_state_machine')
+
 SWAP_BASE_STATES = [
     'initializing',
     'wait_for_maker',
@@ -20,195 +23,241 @@ SWAP_BASE_STATES = [
 
 SWAP_INITIAL_STATE = 'initializing'
 
+# the destination of a transition that stays in its source state
+SAME_STATE = '='
 
-def swap_setup_state_transitions(fsm, auto_spawn_timeout):
-    fsm.add_transition('timeout', 'wait_for_taker', 'untraded',
-                       after=[omit_args_and_kwargs(fsm.swap.refund_maker), 'finalize'])
-    fsm.add_transition('timeout', ['initializing', 'wait_for_maker'], 'uncommitted',
-                       after='finalize')
-    fsm.add_transition('maker_commitment_msg', 'initializing', 'wait_for_maker',
-                       after=[fsm.set_maker_commitment])
-    fsm.add_transition('transfer_receipt', 'wait_for_maker', 'wait_for_taker',
-                       conditions=[fsm.sender_is_maker],
-                       after=[fsm.set_maker_transfer_receipt,
-                              omit_args_and_kwargs(fsm.swap.send_maker_commitment_proof)])
-    # TODO check if before is the right place to execute
-    fsm.add_transition('taker_commitment_msg', 'wait_for_taker', '=', before=[fsm.queue_commitment])
-    fsm.add_transition('transfer_receipt', 'wait_for_taker', 'wait_for_execution',
-                       conditions=[fsm.sender_sent_taker_commitment],
-                       after=[fsm.accept_taker_commitment_from_receipt, fsm.set_taker_transfer_receipt,
-                              omit_args_and_kwargs(fsm.swap.send_offer_taken),
-                              omit_args_and_kwargs(fsm.swap.send_taker_commitment_proof)])
-
-    fsm.add_transition('swap_execution_msg', 'wait_for_execution', 'wait_for_taker_execution',
-                       conditions=[fsm.sender_is_maker],
-                       after=[fsm.set_maker_execution])
-
-    fsm.add_transition('swap_execution_msg', 'wait_for_execution', 'wait_for_maker_execution',
-                       conditions=[fsm.sender_is_taker],
-                       after=[fsm.set_taker_execution])
-
-    fsm.add_transition('swap_execution_msg', 'wait_for_taker_execution', 'traded',
-                       conditions=[fsm.sender_is_taker],
-                       after=[fsm.set_taker_execution,
-                              omit_args_and_kwargs(fsm.swap.send_swap_completed),
-                              omit_args_and_kwargs(fsm.swap.refund_maker_with_fee),
-                              omit_args_and_kwargs(fsm.swap.refund_taker_with_fee),
-                              'finalize'])
-    fsm.add_transition('swap_execution_msg', 'wait_for_maker_execution', 'traded',
-                       conditions=[fsm.sender_is_maker],
-                       after=[fsm.set_maker_execution,
-                              omit_args_and_kwargs(fsm.swap.send_swap_completed),
-                              omit_args_and_kwargs(fsm.swap.refund_maker_with_fee),
-                              omit_args_and_kwargs(fsm.swap.refund_taker_with_fee),
-                              'finalize'])
-
-    fsm.add_transition('timeout', ['wait_for_execution', 'wait_for_taker_execution', 'wait_for_maker_execution'],
-                       'failed',
-                       after=[omit_args_and_kwargs(fsm.swap.punish_maker),
-                              omit_args_and_kwargs(fsm.swap.punish_taker), 'finalize'])
-
-    fsm.add_transition('finalize', ['traded', 'untraded', 'failed', 'uncommitted'], 'processed',
-                       after=[fsm.set_terminated_state, omit_args_and_kwargs(fsm.swap.cleanup)])
-
-    # refund transfers that don't trigger any action
-    # TODO check if after is right
-    fsm.add_transition('transfer_receipt', 'wait_for_taker', '=',
-                       unless=[fsm.sender_sent_taker_commitment],
-                       after=[fsm.refund_unsuccessful_transfer])
-    fsm.add_transition('transfer_receipt', 'wait_for_maker', '=',
-                       unless=[fsm.sender_is_maker],
-                       after=[fsm.refund_unsuccessful_transfer]
-                       )
-    fsm.add_transition('transfer_receipt',
-                       ['wait_for_execution', 'wait_for_taker_execution', 'wait_for_maker_execution',
-                         'failed', 'traded', 'uncommitted', 'untraded'],
-                        '=',
-                       after=[fsm.refund_unsuccessful_transfer])
-
-    if auto_spawn_timeout is True:
-        fsm.remove_transition(source='initializing', dest='wait_for_maker', trigger='maker_commitment_msg')
-        fsm.add_transition(source='initializing', dest='wait_for_maker', trigger='maker_commitment_msg',
-                            after=[fsm.set_maker_commitment, fsm.spawn_timeout])
-
+# A transition of the compiled table. The guards are checked in order, `conditions` have to be true and `unless`
+# false. The actions are called with (machine, source state, trigger kwargs), `before` ahead of the state change.
+Transition = namedtuple('Transition', 'dest conditions unless before after')
 
-def event_get_success(event):
-    return event.result
 
+def msg_kwarg(kwargs):
+    return kwargs.get('msg')
 
-def event_get_receipt_kwarg(event):
-    receipt = event.kwargs.get('receipt')
-    return receipt
 
-
-def event_get_msg_kwarg(event):
-    msg = event.kwargs.get('msg')
-    return msg
+def receipt_kwarg(kwargs):
+    return kwargs.get('receipt')
 
 
 # FIXME errors
-def event_get_msg_or_receipt_kwarg(event):
-    msg = event.kwargs.get('msg')
-    receipt = event.kwargs.get('receipt')
+def msg_or_receipt_kwarg(kwargs):
+    msg = kwargs.get('msg')
+    receipt = kwargs.get('receipt')
     if msg and receipt:
         raise ValueError("ambigous arguments, either provide a msg or a receipt")
     if not msg and not receipt:
         raise ValueError("incorrect arguments")
-    data = None
-    if msg and not receipt:
-        data = msg
-    if receipt and not msg:
-        data = receipt
+    data = msg if msg else receipt
     if not hasattr(data, 'initiator') and not hasattr(data, 'sender'):
         # TODO better error
         raise AttributeError()
     return data
 
 
-# FIXME mocking is not easy when a swap-method is wrapped with this
-def omit_args_and_kwargs(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        func()
-    return wrapper
-
-
-class SwapStateMachine(Machine):
-
-    def __init__(self, swap, auto_spawn_timeout=True):
-        # TODO evaluate if queued_transition is better
-        super(SwapStateMachine, self).__init__(self, states=SWAP_BASE_STATES, initial=SWAP_INITIAL_STATE,
-                                               send_event=True)
-        self.taker_commitment_pool = dict()
-        self.swap = swap
-
-        self._setup_transitions(auto_spawn_timeout)
-
-    def _setup_transitions(self, auto_spawn_timeout):
-        swap_setup_state_transitions(self, auto_spawn_timeout)
-
-    def spawn_timeout(self, event):
-        maker_commitment_msg = event_get_msg_kwarg(event)
-        seconds_to_timeout = timestamp.seconds_to_timeout(maker_commitment_msg.timeout)
-        print("SECONDS TO TIMEOUT: {}".format(seconds_to_timeout))
-        gevent.spawn_later(seconds_to_timeout, self.swap.trigger_timeout)
-
-    def refund_unsuccessful_transfer(self, event):
-        transfer_receipt = event_get_receipt_kwarg(event)
-        success = event_get_success(event)
-        # refund every receipt that didn't successfully trigger a state change
-        if success is False:
-            self.swap.queue_refund(transfer_receipt, priority=1, claim_fee=False)
+def swap_action(name):
+    """Action that calls the swap's method without arguments, looked up when called"""
+    def action(machine, source, kwargs):
+        getattr(machine.swap, name)()
+    action.__name__ = name
+    return action
 
-    def set_terminated_state(self, event):
-        self.swap.terminated_state = event.transition.source
 
-    def set_taker_execution(self, event):
-        swap_execution_msg = event_get_msg_kwarg(event)
-        self.swap.taker_swap_execution_msg = swap_execution_msg
+class SwapStateMachine(object):
+    """The state of one swap, driven by the shared transition table `SWAP_TRANSITIONS`.
 
-    def set_maker_execution(self, event):
-        swap_execution_msg = event_get_msg_kwarg(event)
-        self.swap.maker_swap_execution_msg = swap_execution_msg
+    A trigger looks up the transitions of (state, trigger) in the table and executes the first one whose guards
+    pass. If no guard passes, the trigger returns False. A trigger that isn't defined for the current state,
+    e.g. a timeout after the swap was processed, is logged and ignored.
+    """
 
-    def set_maker_transfer_receipt(self, event):
-        transfer_receipt = event_get_receipt_kwarg(event)
-        self.swap.maker_transfer_receipt = transfer_receipt
+    __slots__ = [
+        'swap',
+        'state',
+        'taker_commitment_pool',
+        'auto_spawn_timeout',
+        'timeout_task',
+    ]
 
-    def set_taker_transfer_receipt(self, event):
-        transfer_receipt = event_get_receipt_kwarg(event)
-        self.swap.taker_transfer_receipt = transfer_receipt
-
-    def set_maker_commitment(self, event):
-        maker_commitment_msg = event_get_msg_kwarg(event)
-        self.swap.maker_commitment_msg = maker_commitment_msg
-
-    def accept_taker_commitment_from_receipt(self, event):
-        transfer_receipt = event_get_receipt_kwarg(event)
-        taker_commitment = self.taker_commitment_pool[transfer_receipt.initiator]
-        self.swap.taker_commitment_msg = taker_commitment
-
-    def sender_is_maker(self, event):
-        msg_or_receipt = event_get_msg_or_receipt_kwarg(event)
+    def __init__(self, swap, auto_spawn_timeout=True):
+        self.swap = swap
+        self.state = SWAP_INITIAL_STATE
+        self.taker_commitment_pool = dict()
+        self.auto_spawn_timeout = auto_spawn_timeout
+        self.timeout_task = None
+
+    def trigger(self, trigger_name, **kwargs):
+        source = self.state
+        transitions = SWAP_TRANSITIONS.get((source, trigger_name))
+        if transitions is None:
+            log.debug('Ignoring trigger {} in state {} of swap {}'.format(trigger_name, source, self.swap.offer_id))
+            return False
+
+        for transition in transitions:
+            if not all(condition(self, kwargs) for condition in transition.conditions):
+                continue
+            if any(condition(self, kwargs) for condition in transition.unless):
+                continue
+            for action in transition.before:
+                action(self, source, kwargs)
+            if transition.dest is not SAME_STATE:
+                self.state = transition.dest
+            for action in transition.after:
+                action(self, source, kwargs)
+            return True
+        return False
+
+    def set_state(self, state):
+        assert state in SWAP_BASE_STATES
+        self.state = state
+
+    def timeout(self, **kwargs):
+        return self.trigger('timeout', **kwargs)
+
+    def maker_commitment_msg(self, **kwargs):
+        return self.trigger('maker_commitment_msg', **kwargs)
+
+    def taker_commitment_msg(self, **kwargs):
+        return self.trigger('taker_commitment_msg', **kwargs)
+
+    def transfer_receipt(self, **kwargs):
+        return self.trigger('transfer_receipt', **kwargs)
+
+    def swap_execution_msg(self, **kwargs):
+        return self.trigger('swap_execution_msg', **kwargs)
+
+    def finalize(self, **kwargs):
+        return self.trigger('finalize', **kwargs)
+
+    def spawn_timeout(self, source, kwargs):
+        if not self.auto_spawn_timeout:
+            return
+        maker_commitment_msg = msg_kwarg(kwargs)
+        self.arm_timeout(maker_commitment_msg.timeout)
+
+    def arm_timeout(self, timeout):
+        seconds_to_timeout = max(0, timestamp.seconds_to_timeout(timeout))
+        self.timeout_task = gevent.spawn_later(seconds_to_timeout, self.swap.trigger_timeout)
+
+    def cancel_timeout(self):
+        if self.timeout_task is not None:
+            self.timeout_task.kill(block=False)
+            self.timeout_task = None
+
+    def finalize_action(self, source, kwargs):
+        self.finalize()
+
+    def refund_unsuccessful_transfer(self, source, kwargs):
+        # a receipt that doesn't move the swap forward is paid back
+        self.swap.queue_refund(receipt_kwarg(kwargs), priority=1, claim_fee=False)
+
+    def set_terminated_state(self, source, kwargs):
+        self.swap.terminated_state = source
+        self.cancel_timeout()
+
+    def set_taker_execution(self, source, kwargs):
+        self.swap.taker_swap_execution_msg = msg_kwarg(kwargs)
+
+    def set_maker_execution(self, source, kwargs):
+        self.swap.maker_swap_execution_msg = msg_kwarg(kwargs)
+
+    def set_maker_transfer_receipt(self, source, kwargs):
+        self.swap.maker_transfer_receipt = receipt_kwarg(kwargs)
+
+    def set_taker_transfer_receipt(self, source, kwargs):
+        self.swap.taker_transfer_receipt = receipt_kwarg(kwargs)
+
+    def set_maker_commitment(self, source, kwargs):
+        self.swap.maker_commitment_msg = msg_kwarg(kwargs)
+
+    def accept_taker_commitment_from_receipt(self, source, kwargs):
+        transfer_receipt = receipt_kwarg(kwargs)
+        self.swap.taker_commitment_msg = self.taker_commitment_pool[transfer_receipt.initiator]
+
+    def sender_is_maker(self, kwargs):
+        msg_or_receipt = msg_or_receipt_kwarg(kwargs)
         if hasattr(msg_or_receipt, 'initiator'):
             return self.swap.is_maker(msg_or_receipt.initiator)
         return self.swap.is_maker(msg_or_receipt.sender)
 
-    def sender_is_taker(self, event):
-        msg_or_receipt = event_get_msg_or_receipt_kwarg(event)
+    def sender_is_taker(self, kwargs):
+        msg_or_receipt = msg_or_receipt_kwarg(kwargs)
         if hasattr(msg_or_receipt, 'initiator'):
             return self.swap.is_taker(msg_or_receipt.initiator)
         return self.swap.is_taker(msg_or_receipt.sender)
 
-    def sender_sent_taker_commitment(self, event):
-        msg_or_receipt = event_get_msg_or_receipt_kwarg(event)
-        return msg_or_receipt.initiator in self.taker_commitment_pool
+    def sender_sent_taker_commitment(self, kwargs):
+        return msg_or_receipt_kwarg(kwargs).initiator in self.taker_commitment_pool
 
-    def queue_commitment(self, event):
-        commitment_msg = event_get_msg_kwarg(event)
+    def queue_commitment(self, source, kwargs):
+        commitment_msg = msg_kwarg(kwargs)
         if commitment_msg.sender not in self.taker_commitment_pool:
             self.taker_commitment_pool[commitment_msg.sender] = commitment_msg
         else:
             # TODO
             # sent another message... what should we allow here? replace, ignore?
             pass
+
+
+def compile_transitions(definitions):
+    """Builds the table (source state, trigger) -> transitions, in the order they are defined"""
+    table = dict()
+    for trigger, sources, dest, options in definitions:
+        if isinstance(sources, str):
+            sources = [sources]
+        transition = Transition(
+            dest,
+            tuple(options.get('conditions', ())),
+            tuple(options.get('unless', ())),
+            tuple(options.get('before', ())),
+            tuple(options.get('after', ())),
+        )
+        for source in sources:
+            assert source in SWAP_BASE_STATES and (dest is SAME_STATE or dest in SWAP_BASE_STATES)
+            table[(source, trigger)] = table.get((source, trigger), ()) + (transition,)
+    return table
+
+
+S = SwapStateMachine
+SWAP_COMPLETED_ACTIONS = [swap_action('send_swap_completed'), swap_action('refund_maker_with_fee'),
+                          swap_action('refund_taker_with_fee'), S.finalize_action]
+
+SWAP_TRANSITIONS = compile_transitions([
+    ('timeout', 'wait_for_taker', 'untraded',
+     dict(after=[swap_action('refund_maker'), S.finalize_action])),
+    ('timeout', ['initializing', 'wait_for_maker'], 'uncommitted',
+     dict(after=[S.finalize_action])),
+    ('maker_commitment_msg', 'initializing', 'wait_for_maker',
+     dict(after=[S.set_maker_commitment, S.spawn_timeout])),
+    ('transfer_receipt', 'wait_for_maker', 'wait_for_taker',
+     dict(conditions=[S.sender_is_maker],
+          after=[S.set_maker_transfer_receipt, swap_action('send_maker_commitment_proof')])),
+    # TODO check if before is the right place to execute
+    ('taker_commitment_msg', 'wait_for_taker', SAME_STATE,
+     dict(before=[S.queue_commitment])),
+    ('transfer_receipt', 'wait_for_taker', 'wait_for_execution',
+     dict(conditions=[S.sender_sent_taker_commitment],
+          after=[S.accept_taker_commitment_from_receipt, S.set_taker_transfer_receipt,
+                 swap_action('send_offer_taken'), swap_action('send_taker_commitment_proof')])),
+    ('swap_execution_msg', 'wait_for_execution', 'wait_for_taker_execution',
+     dict(conditions=[S.sender_is_maker], after=[S.set_maker_execution])),
+    ('swap_execution_msg', 'wait_for_execution', 'wait_for_maker_execution',
+     dict(conditions=[S.sender_is_taker], after=[S.set_taker_execution])),
+    ('swap_execution_msg', 'wait_for_taker_execution', 'traded',
+     dict(conditions=[S.sender_is_taker], after=[S.set_taker_execution] + SWAP_COMPLETED_ACTIONS)),
+    ('swap_execution_msg', 'wait_for_maker_execution', 'traded',
+     dict(conditions=[S.sender_is_maker], after=[S.set_maker_execution] + SWAP_COMPLETED_ACTIONS)),
+    ('timeout', ['wait_for_execution', 'wait_for_taker_execution', 'wait_for_maker_execution'], 'failed',
+     dict(after=[swap_action('punish_maker'), swap_action('punish_taker'), S.finalize_action])),
+    ('finalize', ['traded', 'untraded', 'failed', 'uncommitted'], 'processed',
+     dict(after=[S.set_terminated_state, swap_action('cleanup')])),
+    # refund transfers that don't trigger any action
+    # TODO check if after is right
+    ('transfer_receipt', 'wait_for_taker', SAME_STATE,
+     dict(unless=[S.sender_sent_taker_commitment], after=[S.refund_unsuccessful_transfer])),
+    ('transfer_receipt', 'wait_for_maker', SAME_STATE,
+     dict(unless=[S.sender_is_maker], after=[S.refund_unsuccessful_transfer])),
+    ('transfer_receipt', ['wait_for_execution', 'wait_for_taker_execution', 'wait_for_maker_execution',
+                          'failed', 'traded', 'uncommitted', 'untraded'], SAME_STATE,
+     dict(after=[S.refund_unsuccessful_transfer])),
+])
+del S
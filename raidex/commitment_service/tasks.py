@@ -37,11 +37,12 @@ class QueueListenerTask(gevent.Greenlet):
 
 
 class RefundTask(QueueListenerTask):
-    def __init__(self, trader_client, refund_queue, commitment_token_address, fee_rate=None):
+    def __init__(self, trader_client, refund_queue, commitment_token_address, fee_rate=None, store=None):
         self.refund_queue = refund_queue
         self.trader_client = trader_client
         self.commitment_token_address = commitment_token_address
         self.fee_rate = fee_rate
+        self.store = store
         super(RefundTask, self).__init__(refund_queue)
 
     def process(self, data):
@@ -60,6 +61,8 @@ class RefundTask(QueueListenerTask):
 
             if success.status_code == 200:
                 log_trader.debug('Refund successful {}'.format(refund_))
+                if self.store is not None:
+                    self.store.remove_refund(refund_)
             else:
                 queue.put(refund_)
                 log_trader.debug('Refunding failed for {}, retrying'.format(refund_))
@@ -70,25 +73,33 @@ class RefundTask(QueueListenerTask):
 
 class MessageSenderTask(QueueListenerTask):
 
-    def __init__(self, message_broker, message_queue, sign_func):
+    def __init__(self, message_broker, message_queue, sign_func, store=None):
         self.message_broker = message_broker
         self._sign_func = sign_func
+        self.store = store
         super(MessageSenderTask, self).__init__(message_queue)
 
     def process(self, data):
-        msg, recipient = data
+        msg, recipient, key = data
         self._sign_func(msg)
         # FIXME make async
         # recipient == None is indicating a broadcast
-        if recipient is None:
-            success = self.message_broker.broadcast(msg)
-            if success is True:
-                log_messaging.debug('Broadcast successful: {}'.format(msg))
-        else:
+        try:
+            if recipient is None:
+                success = self.message_broker.broadcast(msg)
+                if success is True:
+                    log_messaging.debug('Broadcast successful: {}'.format(msg))
+            else:
 
-            success = self.message_broker.send(topic=recipient, message=msg)
-            if success is True:
-                log_messaging.debug('Sending successful: {} // recipient={}'.format(msg, pex(recipient)))
+                success = self.message_broker.send(topic=recipient, message=msg)
+                if success is True:
+                    log_messaging.debug('Sending successful: {} // recipient={}'.format(msg, pex(recipient)))
+        except OSError as e:
+            # the message broker is unreachable or didn't acknowledge, the task goes on with the next message
+            log_messaging.debug('Sending failed: {}'.format(e))
+        # the message is sent at most once, like before a restart
+        if self.store is not None:
+            self.store.remove_message(key)
 
 
 class TransferReceivedTask(ListenerTask):
@@ -140,9 +151,9 @@ class CancellationRequestTask(ListenerTask):
 
 class CommitmentTask(ListenerTask):
 
-    def __init__(self, swaps, refund_queue, message_queue, message_broker, self_address):
+    def __init__(self, swaps, refund_queue, message_queue, message_broker, self_address, store=None):
         self.swaps = swaps
-        self.factory = SwapFactory(swaps, refund_queue, message_queue)
+        self.factory = SwapFactory(swaps, refund_queue, message_queue, store)
         super(CommitmentTask, self).__init__(CommitmentListener(message_broker, topic=self_address))
 
     def process(self, data):
@@ -1,5 +1,5 @@
 from eth_utils import keccak
-from raidex.raidex_node.matching.matching_algorithm import match_limit
+from raidex.raidex_node.matching.matching_algorithm import match_limit, match_limit_price_time
 
 EMPTY_SECRET = bytes(32)
 EMPTY_SECRET_KECCAK = keccak(EMPTY_SECRET)
@@ -11,7 +11,12 @@ OFFER_THRESHOLD_TIME = 10
 
 RAIDEN_POLL_INTERVAL = 0.75
 
-MATCHING_ALGORITHM = match_limit
+MATCHING_ALGORITHMS = {
+    'limit': match_limit,
+    'price_time': match_limit_price_time,
+}
+
+MATCHING_ALGORITHM = MATCHING_ALGORITHMS['limit']
 
 
 DEFAULT_TESTNET = 'GOERLI'
@@ -0,0 +1,231 @@
+"""Multi-node harness, that runs several raidex nodes and a commitment service in one process.
+
+The nodes and the commitment service talk through an in-process `MessageBroker` and make their transfers with the
+in-process mock `Trader`. Every node dispatches its events and state changes within a `DispatchContext` of its own.
+The nodes trade in pairs, each pair in a market of its own: the maker of a pair sells, then its taker buys at the
+same price. Nodes of one market would compete for the same best offers, here every buy order takes a sell offer.
+The aggregate order throughput of all pairs is reported.
+
+    python -m raidex.harness --nodes 4 --orders 200
+"""
+import argparse
+import time
+from collections import namedtuple
+
+import gevent
+from gevent import Greenlet
+from gevent.event import AsyncResult
+
+from raidex.app import App
+from raidex.commitment_service.node import CommitmentService
+from raidex.constants import WETH_ADDRESS
+from raidex.message_broker.message_broker import MessageBroker
+from raidex.raidex_node.architecture.event_architecture import DispatchContext, dispatch_events
+from raidex.raidex_node.architecture.state_change import NewLimitOrderStateChange
+from raidex.raidex_node.commitment_service.client import CommitmentServiceClient
+from raidex.raidex_node.market import TokenPair
+from raidex.raidex_node.raidex_node import RaidexNode
+from raidex.raidex_node.trader.client import TraderClient
+from raidex.raidex_node.trader.listener.events import PaymentReceivedEvent
+from raidex.raidex_node.transport.transport import Transport
+from raidex.signing import Signer
+from raidex.trader_mock.trader import Trader
+from raidex.utils.address import binary_address, encode_topic
+
+TransferResult = namedtuple('TransferResult', 'status_code')
+
+
+class LocalMessageBrokerClient(object):
+    """`MessageBrokerClient` interface to an in-process `MessageBroker`"""
+
+    def __init__(self, message_broker, address):
+        self.message_broker = message_broker
+        self.address = address
+
+    def send(self, topic, message):
+        return self.message_broker.send(encode_topic(topic), message)
+
+    def send_async(self, topic, message):
+        result_async = AsyncResult()
+        result_async.set(self.send(topic, message))
+        return result_async
+
+    def broadcast(self, message):
+        return self.message_broker.broadcast(message)
+
+    def listen_on(self, topic, transform=None, message_types=None):
+        return self.message_broker.listen_on(encode_topic(topic), transform, message_types)
+
+    def stop_listen(self, listener):
+        self.message_broker.stop_listen(listener)
+
+
+class LocalTraderClient(TraderClient):
+    """`TraderClient` that transfers with an in-process mock `Trader` instead of a raiden node"""
+
+    def __init__(self, address, trader, market=None, commitment_amount=10):
+        super(LocalTraderClient, self).__init__(address, market=market, commitment_amount=commitment_amount)
+        self.trader = trader
+
+    def transfer(self, token_address, target_address, amount, identifier, secret=None, secret_hash=None):
+        # the mock trader doesn't distinguish tokens
+        successful = self.trader.transfer(binary_address(self.address), binary_address(target_address), amount,
+                                          identifier)
+        if successful:
+            self.commitment_balance -= amount
+        return TransferResult(200 if successful else 404)
+
+    def listen_for_events(self, transform=None):
+        return self.trader.listen_for_events(binary_address(self.address), transform)
+
+    def stop_listen(self, listener):
+        self.trader.stop_listen(listener)
+
+
+class PaymentEventTask(Greenlet):
+    """Passes the payments received by the trader client on as events, like `raiden_poll` does for a raiden node"""
+
+    def __init__(self, trader_client):
+        Greenlet.__init__(self)
+        self.trader_client = trader_client
+
+    def _run(self):
+        listener = self.trader_client.listen_for_events()
+        try:
+            while True:
+                payment = listener.event_queue_async.get()
+                dispatch_events([PaymentReceivedEvent(binary_address(payment.initiator), payment.amount,
+                                                      payment.identifier)])
+        finally:
+            self.trader_client.stop_listen(listener)
+
+
+class LocalApp(App):
+
+    def start_raiden_poll(self):
+        task = PaymentEventTask(self.trader)
+        task.start()
+        return task
+
+
+def market_of_pair(index):
+    """The market of the index-th pair of nodes, the base token address is derived from the index"""
+    return TokenPair(base_token=(index + 1).to_bytes(20, 'big'), base_decimal=3,
+                     quote_token=binary_address(WETH_ADDRESS), quote_decimal=18)
+
+
+class MultiNodeHarness(object):
+    """Node 2k buys and node 2k + 1 sells in the k-th market"""
+
+    def __init__(self, nof_nodes, fee_rate=0.01, offer_lifetime=60):
+        assert nof_nodes >= 2 and nof_nodes % 2 == 0, 'the nodes trade in pairs'
+        self.message_broker = MessageBroker(retain_offers=True)
+        self.trader = Trader()
+        self.offer_lifetime = offer_lifetime
+
+        cs_signer = Signer.from_seed('harness-commitment-service')
+        self.commitment_service = CommitmentService(
+            cs_signer,
+            LocalMessageBrokerClient(self.message_broker, cs_signer.checksum_address),
+            LocalTraderClient(cs_signer.checksum_address, self.trader),
+            fee_rate,
+        )
+        self.apps = list()
+        for i in range(nof_nodes):
+            token_pair = market_of_pair(i // 2)
+            self.apps.append(self.build_app(Signer.from_seed('harness-node-{}'.format(i)), token_pair, fee_rate))
+
+    def build_app(self, signer, token_pair, fee_rate):
+        message_broker = LocalMessageBrokerClient(self.message_broker, signer.checksum_address)
+        trader_client = LocalTraderClient(signer.checksum_address, self.trader, token_pair)
+        cs_client = CommitmentServiceClient(signer, token_pair, message_broker,
+                                            self.commitment_service.checksum_address, fee_rate)
+        raidex_node = RaidexNode(signer.address, token_pair, message_broker, trader_client)
+        raidex_node.default_offer_lifetime = self.offer_lifetime
+        return LocalApp(trader_client, cs_client, Transport(message_broker, signer), token_pair, raidex_node,
+                        dispatch=DispatchContext())
+
+    def start(self):
+        self.commitment_service.start()
+        for app in self.apps:
+            app.start()
+
+    def stop(self):
+        for app in self.apps:
+            app.stop()
+        self.commitment_service.stop()
+
+    @property
+    def makers(self):
+        return self.apps[1::2]
+
+    @property
+    def takers(self):
+        return self.apps[0::2]
+
+    def submit_orders(self, apps, order_type, nof_orders, amount=10, price=100):
+        """Submits the orders round-robin to the nodes"""
+        for i in range(nof_orders):
+            data = {
+                'order_id': '{}-{}'.format(order_type, i),
+                'order_type': order_type,
+                'amount': amount,
+                'price': price,
+                'lifetime': self.offer_lifetime,
+            }
+            apps[i % len(apps)].dispatch.dispatch_state_changes([NewLimitOrderStateChange(data)])
+
+    def orders(self):
+        return [order for app in self.apps for order in app.raidex_node.data_manager.orders.values()]
+
+    def _wait(self, condition, deadline):
+        while not condition():
+            if time.perf_counter() > deadline:
+                return False
+            gevent.sleep(0.01)
+        return True
+
+    def run(self, nof_orders, timeout=60):
+        """Trades `nof_orders` pairs of orders and waits until all of them completed, or the timeout passed.
+
+        The makers sell first, the takers buy once the offers reached their offer books.
+        """
+        start = time.perf_counter()
+        deadline = start + timeout
+
+        self.submit_orders(self.makers, 'SELL', nof_orders)
+        nof_pairs = len(self.takers)
+        self._wait(lambda: all(len(app.raidex_node.offer_book.sells) >= len(range(k, nof_orders, nof_pairs))
+                               for k, app in enumerate(self.takers)), deadline)
+        published = time.perf_counter()
+
+        self.submit_orders(self.takers, 'BUY', nof_orders)
+        self._wait(lambda: all(order.completed for order in self.orders()), deadline)
+        elapsed = time.perf_counter() - start
+
+        orders = self.orders()
+        completed = sum(1 for order in orders if order.completed)
+        return dict(
+            nodes=len(self.apps),
+            orders=len(orders),
+            completed=completed,
+            seconds_to_publish=round(published - start, 3),
+            seconds=round(elapsed, 3),
+            completed_orders_per_second=round(completed / elapsed, 1) if elapsed else None,
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=4, help='Number of raidex nodes, an even number')
+    parser.add_argument('--orders', type=int, default=100,
+                        help='Number of sell orders and of buy orders, spread over the nodes')
+    parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait for the orders to complete')
+    args = parser.parse_args()
+
+    harness = MultiNodeHarness(args.nodes)
+    harness.start()
+    try:
+        print(harness.run(args.orders, args.timeout))
+    finally:
+        harness.stop()
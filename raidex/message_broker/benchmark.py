@@ -0,0 +1,59 @@
+"""Counter based benchmark of the broker's broadcast fan-out.
+
+Broadcasts messages to a number of subscribers of both stream formats, the way the broker server does,
+and reports the encodings and time spent per message and per subscriber.
+
+    python -m raidex.message_broker.benchmark --subscribers 500 --messages 100
+"""
+import argparse
+import time
+
+from raidex.messages import BinaryEnvelope
+from raidex.message_broker.message_broker import MessageBroker
+from raidex.message_broker.listeners import MessageListener
+from raidex.message_broker.wire import WireMessage, iter_json_lines, iter_frames, encoding_stats
+
+
+def benchmark_broadcast(nof_subscribers, nof_messages, payload='x' * 200):
+    message_broker = MessageBroker()
+    streams = list()
+
+    for i in range(nof_subscribers):
+        listener = MessageListener(message_broker, 'broadcast')
+        listener.start()
+        # half of the subscribers negotiated the json stream, the other half the frame stream
+        streams.append(iter_json_lines(listener) if i % 2 == 0 else iter_frames(listener))
+
+    frame = BinaryEnvelope.envelop(payload)
+    encoding_stats.clear()
+    start = time.perf_counter()
+
+    for _ in range(nof_messages):
+        message_broker.broadcast(WireMessage(frame=frame))
+        for stream in streams:
+            next(stream)
+
+    elapsed = time.perf_counter() - start
+    deliveries = nof_subscribers * nof_messages
+    return dict(
+        subscribers=nof_subscribers,
+        messages=nof_messages,
+        encodings=sum(encoding_stats.values()),
+        encodings_per_message=sum(encoding_stats.values()) / nof_messages,
+        encodings_per_delivery=sum(encoding_stats.values()) / deliveries,
+        microseconds_per_delivery=elapsed / deliveries * 1e6,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--subscribers', type=int, default=500)
+    parser.add_argument('--messages', type=int, default=100)
+    args = parser.parse_args()
+
+    for key, value in benchmark_broadcast(args.subscribers, args.messages).items():
+        print('{}: {}'.format(key, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -16,6 +16,10 @@ def listener_context(listener_task):
 class MessageListener(object):
     """Represents a listener currently listening for new messages"""
 
+    # the message classes the listener is interested in, None for all messages.
+    # Other messages are discarded by the message broker before they are decoded and transformed
+    message_types = None
+
     def __init__(self, message_broker, topic='broadcast'):
         # type: (MessageBroker, str) -> None
         self.message_broker = message_broker
@@ -40,13 +44,14 @@ class MessageListener(object):
     def start(self):
         """Starts listening for new messages"""
 
-        self.listener = self.message_broker.listen_on(self.topic, self._transform)
+        self.listener = self.message_broker.listen_on(self.topic, self._transform, self.message_types)
         print(f"LISTEN ON TOPIC: {self.topic} , {self.__class__.__name__}")
 
     def stop(self):
         """Stops listening for new messages"""
         if self.listener is not None:
             self.message_broker.stop_listen(self.listener)
+            self.listener = None
 
     def _transform(self, message):
         return message
@@ -55,6 +60,8 @@ class MessageListener(object):
 class TakerListener(MessageListener):
     """Listens for the Taker of the offer"""
 
+    message_types = (messages.ProvenOffer,)
+
     def __init__(self, offer, message_broker):
         self.offer = offer
         MessageListener.__init__(self, message_broker, message_broker.address)
@@ -69,6 +76,8 @@ class TakerListener(MessageListener):
 
 class CancellationListener(MessageListener):
 
+    message_types = (messages.CancellationProof,)
+
     def __init__(self, offer, message_broker):
         self.offer = offer
         MessageListener.__init__(self, message_broker, message_broker.address)
@@ -84,6 +93,8 @@ class CancellationListener(MessageListener):
 class OfferListener(MessageListener):
     """Listens for new offers"""
 
+    message_types = (messages.ProvenOffer,)
+
     def __init__(self, market, message_broker, topic='broadcast'):
         self.market = market
         MessageListener.__init__(self, message_broker, topic)
@@ -103,7 +114,8 @@ class OfferListener(MessageListener):
         elif type_ is OfferType.SELL:
             base_amount, quote_amount = offer_msg.bid_amount, offer_msg.ask_amount
         else:
-            raise AssertionError("unknown market pair")
+            # an offer of another market on the shared broadcast
+            return None
 
         offer = BasicOffer(offer_id=offer_msg.offer_id,
                            offer_type=type_,
@@ -113,12 +125,14 @@ class OfferListener(MessageListener):
 
         commitment_proof = message.commitment_proof
         initiator = message.sender
-        return OfferBookEntry(offer, initiator, commitment_proof)
+        return OfferBookEntry(offer, initiator, commitment_proof, self.market.price_decimal)
 
 
 class OfferTakenListener(MessageListener):
     """Listens for Taken Messages"""
 
+    message_types = (messages.OfferTaken,)
+
     def _transform(self, message):
         if not isinstance(message, messages.OfferTaken):
             return None
@@ -127,6 +141,8 @@ class OfferTakenListener(MessageListener):
 
 class SwapExecutionListener(MessageListener):
 
+    message_types = (messages.SwapExecution,)
+
     def _transform(self, message):
         if not isinstance(message, messages.SwapExecution):
             return None
@@ -135,6 +151,8 @@ class SwapExecutionListener(MessageListener):
 
 class TakerCommitmentListener(MessageListener):
 
+    message_types = (messages.Commitment,)
+
     def _transform(self, message):
         if not isinstance(message, messages.Commitment):
             return None
@@ -142,6 +160,8 @@ class TakerCommitmentListener(MessageListener):
 
 class CancellationListener(MessageListener):
 
+    message_types = (messages.Cancellation,)
+
     def _transform(self, message):
         if not isinstance(message, messages.Cancellation):
             return None
@@ -150,6 +170,8 @@ class CancellationListener(MessageListener):
 
 class CommitmentListener(MessageListener):
 
+    message_types = (messages.Commitment,)
+
     def _transform(self, message):
         if not isinstance(message, messages.Commitment):
             return None
@@ -159,6 +181,8 @@ class CommitmentListener(MessageListener):
 class SwapCompletedListener(MessageListener):
     """ Listens for Completed Swaps to fill the Trade-book"""
 
+    message_types = (messages.SwapCompleted,)
+
     def _transform(self, message):
         if not isinstance(message, messages.SwapCompleted):
             return None
@@ -167,6 +191,8 @@ class SwapCompletedListener(MessageListener):
 
 class CommitmentProofListener(MessageListener):
 
+    message_types = (messages.CommitmentProof, messages.CancellationProof)
+
     def _transform(self, message):
         if not isinstance(message, (messages.CommitmentProof, messages.CancellationProof)):
             return None
@@ -1,17 +1,94 @@
-from collections import namedtuple, defaultdict
-from eth_utils import encode_hex
+from collections import namedtuple, defaultdict, Counter
+from enum import Enum
+import gevent
 import structlog
-from gevent.queue import Queue
+from gevent.queue import Queue, Full, Empty
+
+from raidex.message_broker.retained import RetainedOffers
 
 log = structlog.get_logger('message_broker.global')
 
-Listener = namedtuple('Listener', 'topic message_queue_async transform')
+Listener = namedtuple('Listener', 'topic message_queue_async transform message_types')
+# message_types: tuple of the message classes the listener wants, None for all
+Listener.__new__.__defaults__ = (None,)
 
 
-class MessageBroker(object):
+class OverflowPolicy(Enum):
+    """What happens to a message for a listener whose queue is full"""
+    DROP_OLDEST = 'drop-oldest'  # make room by discarding the oldest queued message
+    DROP_NEWEST = 'drop-newest'  # discard the new message
+    DISCONNECT = 'disconnect'  # stop the listener and hand it DISCONNECTED instead of further messages
+
+
+class Disconnected(object):
+
+    def __repr__(self):
+        return '<Disconnected>'
+
+
+# put on the queue of a listener that was disconnected for being too slow
+DISCONNECTED = Disconnected()
+
+# the retained offers that are streamed to a new listener, see `MessageBroker.listen_on_broadcast`
+Replay = namedtuple('Replay', 'backlog task')
+
+
+def accepts(listener, message_type):
+    return listener.message_types is None or issubclass(message_type, listener.message_types)
+
+
+class TopicListeners(object):
+    """The listeners of one topic, indexed by the message classes they accept.
+
+    Looking up the listeners for a message is a dict lookup by its class. Listeners without
+    `message_types` receive every message and filter it in their transform.
+    """
 
     def __init__(self):
-        self.listeners = defaultdict(list)
+        self._listeners = list()
+        self._by_type = dict()
+
+    def append(self, listener):
+        self._listeners.append(listener)
+        self._by_type.clear()
+
+    def remove(self, listener):
+        self._listeners.remove(listener)
+        self._by_type.clear()
+
+    def for_type(self, message_type):
+        try:
+            return self._by_type[message_type]
+        except KeyError:
+            listeners = [listener for listener in self._listeners if accepts(listener, message_type)]
+            self._by_type[message_type] = listeners
+            return listeners
+
+    def __iter__(self):
+        return iter(self._listeners)
+
+    def __len__(self):
+        return len(self._listeners)
+
+
+class MessageBroker(object):
+    """
+    Args:
+        max_queue_size (int): bound of the message queue of each listener, None for unbounded queues
+        overflow_policy (OverflowPolicy): how to handle a message for a listener whose queue is full
+        retain_offers (bool): keep the live offers of the broadcast and replay them to new broadcast listeners.
+            A replay that doesn't fit into the listener's queue is streamed into it as the listener takes messages,
+            the messages broadcast meanwhile wait behind it in a backlog of the same bound.
+    """
+
+    def __init__(self, max_queue_size=None, overflow_policy=OverflowPolicy.DROP_OLDEST, retain_offers=False):
+        self.listeners = defaultdict(TopicListeners)
+        self.retained_offers = RetainedOffers() if retain_offers else None
+        self.max_queue_size = max_queue_size
+        self.overflow_policy = overflow_policy
+        self.dropped = Counter()  # topic -> number of dropped messages
+        self.disconnected = Counter()  # topic -> number of disconnected listeners
+        self._replays = dict()  # listener -> Replay, while the retained offers are streamed to it
 
     def send(self, topic, message):
         # HACK, allow 'broadcast' as non-binary input, everything else should be
@@ -25,42 +102,125 @@ class MessageBroker(object):
         # DEBUGGING check - provide log output to easily check if an expected listener is not listening
         # this is not always harmful but can help debugging
         if not queues:
-            log.debug('DEBUG-CODE: no listener waiting on topic {}, msg={}'.format(topic, message))
+            log.debug('DEBUG-CODE: no listener waiting on topic', topic=topic, message_type=type(message).__name__)
             # XXX: in the mock implementation we know if someone is listening or not,
             # even if it's a broadcasting scheme but in real life we don't know that
             # TODO: use direct communication without message-broker later on
             return False
-        for listener in queues:
-            topic, message_queue_async, transform = listener
-            transformed_message = message
-            if transform is not None:
-                transformed_message = transform(transformed_message)
-            if transformed_message is not None:
-                if not isinstance(topic, str):
-                    encode_hex(topic)
-                log.debug('Sending message: msg={}, topic={}'.format(message, topic))
-                message_queue_async.put(transformed_message)
+        # log once per message, not once per listener, broadcasts can have many listeners. The message isn't
+        # rendered into the event, that would cost a str() per send even if debug output is filtered
+        log.debug('Sending message', topic=topic, message_type=type(message).__name__)
+        for listener in queues.for_type(type(message)):
+            self._deliver(listener, message)
         return True
 
-    def listen_on(self, topic, transform=None):
+    def _deliver(self, listener, message):
+        transformed_message = message
+        if listener.transform is not None:
+            transformed_message = listener.transform(transformed_message)
+        if transformed_message is not None:
+            self._put(listener, transformed_message)
+
+    def _put(self, listener, message):
+        queue = listener.message_queue_async
+        if self._replays:
+            replay = self._replays.get(listener)
+            if replay is not None:
+                queue = replay.backlog
+        try:
+            queue.put_nowait(message)
+            return
+        except Full:
+            pass
+
+        topic = listener.topic
+        if self.overflow_policy is OverflowPolicy.DROP_NEWEST:
+            self.dropped[topic] += 1
+        elif self.overflow_policy is OverflowPolicy.DROP_OLDEST:
+            try:
+                queue.get_nowait()
+            except Empty:
+                pass
+            self.dropped[topic] += 1
+            queue.put_nowait(message)
+        else:
+            log.debug('Disconnecting slow listener on topic {}'.format(topic))
+            self.dropped[topic] += queue.qsize() + 1
+            self.disconnected[topic] += 1
+            self.stop_listen(listener)
+            queue = listener.message_queue_async
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(DISCONNECTED)
+
+    def listen_on(self, topic, transform=None, message_types=None):
         # HACK, allow 'broadcast' as non-binary input, everything else should be
         # binary data/ decoded addresses
         if topic == 'broadcast':
-            return self.listen_on_broadcast(transform)
-        return self._listen_on(topic, transform)
+            return self.listen_on_broadcast(transform, message_types)
+        return self._listen_on(topic, transform, message_types)
 
-    def _listen_on(self, topic, transform=None):
-        message_queue_async = Queue()
+    def _listen_on(self, topic, transform=None, message_types=None):
+        message_queue_async = Queue(self.max_queue_size)
 
-        listener = Listener(topic, message_queue_async, transform)
+        listener = Listener(topic, message_queue_async, transform, message_types)
         self.listeners[topic].append(listener)
         return listener
 
     def broadcast(self, message):
+        if self.retained_offers is not None:
+            self.retained_offers.update(message)
         return self._send('broadcast', message)
 
-    def listen_on_broadcast(self, transform=None):
-        return self._listen_on('broadcast', transform)
+    def listen_on_broadcast(self, transform=None, message_types=None):
+        listener = self._listen_on('broadcast', transform, message_types)
+        if self.retained_offers is not None:
+            # the snapshot is queued ahead of all messages broadcast from now on
+            snapshot = [message for message in self.retained_offers.snapshot() if accepts(listener, type(message))]
+            if self.max_queue_size is None or len(snapshot) <= self.max_queue_size:
+                for message in snapshot:
+                    self._deliver(listener, message)
+            else:
+                task = gevent.spawn(self._stream_replay, listener, snapshot)
+                self._replays[listener] = Replay(Queue(self.max_queue_size), task)
+        return listener
+
+    def _stream_replay(self, listener, snapshot):
+        """Puts the snapshot into the listener's queue, waiting while it is full, then the backlog of the messages
+        that were broadcast meanwhile
+        """
+        queue = listener.message_queue_async
+        try:
+            for message in snapshot:
+                if listener.transform is not None:
+                    message = listener.transform(message)
+                if message is not None:
+                    queue.put(message)
+            backlog = self._replays[listener].backlog
+            while not backlog.empty():
+                queue.put(backlog.get_nowait())
+        finally:
+            self._replays.pop(listener, None)
 
     def stop_listen(self, listener):
-        self.listeners[listener.topic].remove(listener)
+        topic_listeners = self.listeners[listener.topic]
+        if listener in topic_listeners:
+            topic_listeners.remove(listener)
+        replay = self._replays.pop(listener, None)
+        if replay is not None:
+            replay.task.kill(block=False)
+
+    def metrics(self):
+        """Queue depth and drops of the listeners, per topic"""
+        topics = set(self.dropped) | set(topic for topic, listeners in self.listeners.items() if listeners)
+        metrics = dict()
+        for topic in topics:
+            depths = [listener.message_queue_async.qsize() for listener in self.listeners.get(topic, ())]
+            metrics[topic] = dict(
+                listeners=len(depths),
+                queue_depth=sum(depths),
+                max_queue_depth=max(depths, default=0),
+                dropped=self.dropped[topic],
+                disconnected=self.disconnected[topic],
+            )
+        return metrics
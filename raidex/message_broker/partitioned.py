@@ -0,0 +1,132 @@
+"""Partitioned message broker, that spreads the topics over several worker processes.
+
+Every worker is a complete broker server process (`raidex.message_broker.server`) that owns a hash range of the
+topics, the 'broadcast' topic with its large fan-out gets a worker of its own. The front door doesn't carry any
+messages, it redirects the requests of a topic to the worker that owns it, so the streaming responses are served
+by the workers directly.
+
+The workers serve HTTP only. A multiplexed connection (`MessageBrokerClient(multiplex_port=...)`) carries all
+topics of a client to one broker and can't be redirected per topic, the clients of a partitioned broker use HTTP.
+
+    python -m raidex.message_broker.partitioned --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import zlib
+
+from flask import Flask, jsonify, redirect, request
+
+import structlog
+
+log = structlog.get_logger('message_broker.partitioned')
+
+BROADCAST_TOPIC = 'broadcast'
+DEFAULT_WORKER_BASE_PORT = 5100
+
+
+def partition_for(topic, nof_partitions):
+    """Partition of the topic, stable across processes unlike `hash`"""
+    return zlib.crc32(topic.encode('utf-8')) % nof_partitions
+
+
+class PartitionMap(object):
+    """Maps the topics to the workers.
+
+    The broadcast worker listens on `base_port`, the worker of partition i on `base_port + 1 + i`.
+    """
+
+    def __init__(self, nof_partitions, host='localhost', base_port=DEFAULT_WORKER_BASE_PORT):
+        assert nof_partitions > 0
+        self.nof_partitions = nof_partitions
+        self.host = host
+        self.base_port = base_port
+
+    @property
+    def ports(self):
+        return [self.base_port + i for i in range(self.nof_partitions + 1)]
+
+    def port_for(self, topic):
+        if topic == BROADCAST_TOPIC:
+            return self.base_port
+        return self.base_port + 1 + partition_for(topic, self.nof_partitions)
+
+    def url_for(self, topic):
+        return 'http://{}:{}/api/topics/{}'.format(self.host, self.port_for(topic), topic)
+
+    def to_dict(self):
+        return {
+            'broadcast': 'http://{}:{}/api'.format(self.host, self.base_port),
+            'partitions': ['http://{}:{}/api'.format(self.host, port) for port in self.ports[1:]],
+        }
+
+
+def create_front_door(partition_map):
+    app = Flask(__name__)
+
+    @app.route('/api/topics/<string:topic>', methods=['GET', 'POST'])
+    def route_topic(topic):
+        url = partition_map.url_for(topic)
+        if request.query_string:
+            url = '{}?{}'.format(url, request.query_string.decode('utf-8'))
+        # 307 keeps the method and body of a POST
+        return redirect(url, code=307)
+
+    @app.route('/api/partitions', methods=['GET'])
+    def partitions():
+        return jsonify({'data': partition_map.to_dict()})
+
+    return app
+
+
+def worker_command(port, log_dir=None, extra_args=()):
+    if any(arg.startswith('--multiplex-port') for arg in extra_args):
+        raise ValueError('The workers of a partitioned broker serve HTTP only, multiplexed connections are not '
+                         'redirected to them')
+    command = [sys.executable, '-m', 'raidex.message_broker.server', '--port', str(port), '--multiplex-port', '0']
+    if log_dir is not None:
+        command += ['--log-dir', os.path.join(log_dir, str(port))]
+    return command + list(extra_args)
+
+
+def start_workers(partition_map, log_dir=None, extra_args=()):
+    workers = list()
+    for port in partition_map.ports:
+        workers.append(subprocess.Popen(worker_command(port, log_dir, extra_args)))
+    return workers
+
+
+def main():
+    from gevent import monkey; monkey.patch_all()
+    from gevent.pywsgi import WSGIServer
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=5000, help='Port of the front door')
+    parser.add_argument('--workers', type=int, default=max(multiprocessing.cpu_count() - 1, 1),
+                        help='Number of topic partitions, an additional worker serves the broadcast')
+    parser.add_argument('--worker-base-port', type=int, default=DEFAULT_WORKER_BASE_PORT,
+                        help='The workers listen on the following ports, starting with the broadcast worker')
+    parser.add_argument('--worker-host', type=str, default='localhost',
+                        help='Host of the workers, as reachable by the clients')
+    parser.add_argument('--log-dir', type=str, default=None, help='Keep a durable topic log per worker')
+    # everything else, like --queue-size, is passed on to the workers
+    args, worker_args = parser.parse_known_args()
+    try:
+        worker_command(args.worker_base_port, extra_args=worker_args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    partition_map = PartitionMap(args.workers, args.worker_host, args.worker_base_port)
+    workers = start_workers(partition_map, args.log_dir, worker_args)
+    log.info('Started {} partition workers and the broadcast worker'.format(args.workers))
+    try:
+        WSGIServer(('', args.port), create_front_door(partition_map)).serve_forever()
+    finally:
+        for worker in workers:
+            worker.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import struct
+from collections import OrderedDict
+from heapq import heappush, heappop
+
+from rlp.exceptions import RLPException
+
+from raidex import messages
+from raidex.utils import timestamp
+
+
+class RetainedOffers(object):
+    """The live `ProvenOffer`s of the broadcast, that are replayed to late subscribers.
+
+    Offers are retained in the order they were broadcast, until they are taken or timed out. Cancellations are
+    only sent to the maker, a cancelled offer is retained until its timeout.
+    Received messages can be message instances, or wrappers like `WireMessage` and `LazyMessage`, that
+    expose `message_type` and the decoded `message`. Wrappers are only decoded for the message types that
+    change the retained state, and the wrappers themselves are replayed.
+    """
+
+    def __init__(self):
+        self._offers = OrderedDict()  # offer_id -> received message
+        self._timeouts = list()  # heap of (timeout, offer_id)
+
+    def update(self, received):
+        now = timestamp.time_int()
+        self._prune(now)
+        try:
+            self._update(received, now)
+        except (ValueError, RLPException, struct.error):
+            # malformed messages are still passed on, they just don't change the retained offers
+            pass
+
+    def _update(self, received, now):
+        message_type = getattr(received, 'message_type', type(received))
+
+        if issubclass(message_type, messages.ProvenOffer):
+            offer = getattr(received, 'message', received).offer
+            if offer.timed_out(now):
+                return
+            self._offers[offer.offer_id] = received
+            heappush(self._timeouts, (offer.timeout, offer.offer_id))
+        elif issubclass(message_type, messages.OfferTaken):
+            self._offers.pop(getattr(received, 'message', received).offer_id, None)
+
+    def _prune(self, now):
+        while self._timeouts and self._timeouts[0][0] < now:
+            _, offer_id = heappop(self._timeouts)
+            received = self._offers.get(offer_id)
+            # the offer could have been re-broadcast with a later timeout
+            if received is not None and getattr(received, 'message', received).offer.timed_out(now):
+                del self._offers[offer_id]
+
+    def snapshot(self):
+        self._prune(timestamp.time_int())
+        return list(self._offers.values())
+
+    def __len__(self):
+        self._prune(timestamp.time_int())
+        return len(self._offers)
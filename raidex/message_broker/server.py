@@ -2,35 +2,58 @@
 
 from gevent import monkey; monkey.patch_all()
 
-import json
+import argparse
 
 from flask import Flask, jsonify, request, Response
 from gevent.pywsgi import WSGIServer
+from gevent.server import StreamServer
 
 from eth_utils import decode_hex
-from raidex.message_broker.message_broker import MessageBroker
-from raidex.message_broker.listeners import MessageListener
+from raidex.message_broker.message_broker import MessageBroker, OverflowPolicy
+from raidex.message_broker.topic_log import TopicLog
+from raidex.messages import BinaryEnvelope
+from raidex.message_broker.wire import (
+    WireMessage,
+    is_well_formed,
+    publish,
+    subscribe,
+    iter_json_lines,
+    iter_frames,
+    multiplex_handler,
+    DEFAULT_MULTIPLEX_PORT,
+)
 
 import structlog
 
 log = structlog.get_logger('message_broker.server')
 
+# a frozen subscriber must not make the broker's memory grow without bounds
+SUBSCRIBER_QUEUE_SIZE = 1000
+
 app = Flask(__name__)
-message_broker = MessageBroker()
+# new broadcast subscribers get the live offers first, instead of waiting for them to be broadcast again
+message_broker = MessageBroker(max_queue_size=SUBSCRIBER_QUEUE_SIZE, overflow_policy=OverflowPolicy.DROP_OLDEST,
+                               retain_offers=True)
+# optional durable log of all topics, see --log-dir
+topic_log = None
 
 nof_listeners = 0
 
 
+def accepts_frames():
+    return BinaryEnvelope.content_type in request.headers.get('Accept', '')
+
+
 @app.route('/api/topics/<string:topic>', methods=['GET'])
 def messages_for(topic):
     global nof_listeners
 
-    listener = MessageListener(message_broker, topic)
-    listener.start()
+    # resume from an offset of the topic log, the offsets are part of the json stream.
+    # The stream isn't reconnected by the client, a subscriber that wants to resume has to pass the offset itself
+    from_offset = request.args.get('from_offset', type=int)
+    listener, replayed = subscribe(message_broker, topic_log, topic, from_offset)
 
-    def generate():
-        while True:
-            yield json.dumps({'data': listener.get()}) + '\n'
+    binary = accepts_frames()
 
     def on_close():  # stop listener on closed connection
         global nof_listeners
@@ -38,7 +61,10 @@ def messages_for(topic):
         print('Nof-listeners: {}'.format(nof_listeners))
         listener.stop()
 
-    r = Response(generate(), content_type='application/x-json-stream')
+    if binary:
+        r = Response(iter_frames(listener, replayed), content_type=BinaryEnvelope.content_type)
+    else:
+        r = Response(iter_json_lines(listener, replayed), content_type='application/x-json-stream')
     nof_listeners += 1
     print('Nof-listeners: {} new for topic: {}'.format(nof_listeners, topic))
     r.call_on_close(on_close)
@@ -48,11 +74,22 @@ def messages_for(topic):
 @app.route('/api/topics/<string:topic>', methods=['POST'])
 def send_message(topic):
 
-    message = request.json.get('message')
-    status = message_broker.send(topic, message)
+    if request.content_type == BinaryEnvelope.content_type:
+        frame = request.get_data()
+        if not is_well_formed(frame):
+            return make_error(400, 'Malformed frame')
+        message = WireMessage(frame=frame)
+    else:
+        message = WireMessage(json_data=request.json.get('message'))
+    status = publish(message_broker, topic_log, topic, message)
     return jsonify({'data': status})
 
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    return jsonify({'data': message_broker.metrics()})
+
+
 def make_error_obj(status_code, message):
     return {
         'status': status_code,
@@ -77,5 +114,28 @@ def internal_error(error):
                       'The server encountered an internal error and was unable to complete your request: ' + str(error))
 
 if __name__ == '__main__':
-    http_server = WSGIServer(('', 5000), app)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=5000, help='Port of the http api')
+    parser.add_argument('--multiplex-port', type=int, default=DEFAULT_MULTIPLEX_PORT,
+                        help='Port of the multiplexed connections, 0 to disable them')
+    parser.add_argument('--queue-size', type=int, default=SUBSCRIBER_QUEUE_SIZE,
+                        help='Maximum number of queued messages per subscriber, 0 for unbounded queues')
+    parser.add_argument('--overflow-policy', type=OverflowPolicy, choices=list(OverflowPolicy),
+                        default=OverflowPolicy.DROP_OLDEST, help='What to do when a subscriber queue is full')
+    parser.add_argument('--log-dir', type=str, default=None,
+                        help='Keep a durable log of all topics in this directory, subscribers can resume by offset')
+    parser.add_argument('--log-sync', action='store_true', help='Flush the topic log to disk after every message')
+    parser.add_argument('--log-retention-segments', type=int, default=None,
+                        help='Number of log segments kept per topic, older segments are deleted. Default: keep all')
+    args = parser.parse_args()
+    message_broker.max_queue_size = args.queue_size or None
+    message_broker.overflow_policy = args.overflow_policy
+    if args.log_dir is not None:
+        topic_log = TopicLog(args.log_dir, sync=args.log_sync, retention_segments=args.log_retention_segments)
+
+    # subscriptions and publishes of many topics over one persistent connection per client
+    if args.multiplex_port:
+        multiplex_server = StreamServer(('', args.multiplex_port), multiplex_handler(message_broker, topic_log))
+        multiplex_server.start()
+    http_server = WSGIServer(('', args.port), app)
     http_server.serve_forever()
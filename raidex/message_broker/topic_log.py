@@ -0,0 +1,242 @@
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from urllib.parse import quote
+
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+# a new segment file starts with this size and doubles when it is full, up to the segment size
+DEFAULT_INITIAL_SEGMENT_SIZE = 64 * 1024
+# the segments of at most this many topics are mapped, the least recently used topics are closed
+DEFAULT_MAX_OPEN_TOPICS = 256
+
+record_header = struct.Struct('>I')
+
+
+class Segment(object):
+    """A memory-mapped file of length-prefixed records.
+
+    Record:
+        length = uint32 <big endian, number of bytes of data, never 0>
+        data = <the appended bytes>
+
+    The unused rest of the file is zeroed, so a length of 0 marks the end of the records. The data of a record is
+    written before its length, so a record that was cut off by a crash ends the records, instead of being read
+    with zeroed data. The file starts with `initial_size` bytes and doubles when a record doesn't fit, up to
+    `max_size`. When the next segment is started, the file is truncated to its records (`seal`).
+    """
+
+    def __init__(self, path, base_offset, max_size, initial_size=DEFAULT_INITIAL_SEGMENT_SIZE):
+        self.path = path
+        self.base_offset = base_offset
+        self.positions = array('Q')  # offset - base_offset -> position of the record
+
+        exists = os.path.exists(path)
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        # an empty file can't be mapped, e.g. a crash came between creating and sizing it
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(min(initial_size, max_size))
+        self.size = os.fstat(self._file.fileno()).st_size
+        self.max_size = max(max_size, self.size)
+        self._mmap = mmap.mmap(self._file.fileno(), self.size)
+        self.end = self._scan()
+
+    def _scan(self):
+        position = 0
+        while position + record_header.size <= self.size:
+            length, = record_header.unpack_from(self._mmap, position)
+            if length == 0 or position + record_header.size + length > self.size:
+                break
+            self.positions.append(position)
+            position += record_header.size + length
+        return position
+
+    @property
+    def next_offset(self):
+        return self.base_offset + len(self.positions)
+
+    @property
+    def closed(self):
+        return self._mmap is None
+
+    def fits(self, data):
+        return self.end + record_header.size + len(data) <= self.max_size
+
+    def _resize(self, size):
+        self._mmap.close()
+        self._file.truncate(size)
+        self.size = size
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+
+    def append(self, data):
+        position = self.end
+        end = position + record_header.size + len(data)
+        if end > self.size:
+            self._resize(min(self.max_size, max(2 * self.size, end)))
+        self._mmap[position + record_header.size:end] = data
+        record_header.pack_into(self._mmap, position, len(data))
+        self.positions.append(position)
+        self.end = end
+        return self.base_offset + len(self.positions) - 1
+
+    def read(self, offset):
+        position = self.positions[offset - self.base_offset]
+        length, = record_header.unpack_from(self._mmap, position)
+        start = position + record_header.size
+        return self._mmap[start:start + length]
+
+    def flush(self):
+        self._mmap.flush()
+
+    def seal(self):
+        """Gives the unused rest of the file back, no more records are appended"""
+        self._mmap.flush()
+        if 0 < self.end < self.size:
+            self._resize(self.end)
+        self.max_size = self.size
+
+    def close(self):
+        if self._mmap is None:
+            return
+        self._mmap.flush()
+        self._mmap.close()
+        self._mmap = None
+        self._file.close()
+
+    def delete(self):
+        self.close()
+        os.remove(self.path)
+
+
+class TopicLog(object):
+    """Durable, append-only log of the messages of every topic.
+
+    Each topic is stored in its own directory as a sequence of memory-mapped segments, the file name of a
+    segment is the offset of its first record. Offsets count the messages of a topic from 0. The offset index
+    of a segment is kept in memory and rebuilt by scanning the segment when the topic is opened.
+
+    A topic is opened on its first use. Only the `max_open_topics` most recently used topics stay mapped, the
+    others are closed and opened again when they are used. With `retention_segments`, the oldest segments of a
+    topic are deleted as new ones are started; the messages before `first_offset` can't be replayed anymore.
+
+    Subscribers resume by passing the offset after the last message they received. `MultiplexedConnection` does
+    so by itself when it reconnects. The HTTP stream subscription doesn't reconnect, an HTTP subscriber has to
+    pass `from_offset` itself.
+
+    Args:
+        directory (str): where the topic directories are kept
+        segment_size (int): maximum size of a segment file, a new segment is started when a record doesn't fit
+        initial_segment_size (int): size a new segment file starts with
+        sync (bool): flush the segment to disk after each append, otherwise the OS writes it back
+        retention_segments (int): number of segments kept per topic, None keeps all
+        max_open_topics (int): number of topics whose segments are kept mapped
+    """
+
+    def __init__(self, directory, segment_size=DEFAULT_SEGMENT_SIZE, initial_segment_size=DEFAULT_INITIAL_SEGMENT_SIZE,
+                 sync=False, retention_segments=None, max_open_topics=DEFAULT_MAX_OPEN_TOPICS):
+        assert retention_segments is None or retention_segments > 0
+        self.directory = directory
+        self.segment_size = segment_size
+        self.initial_segment_size = initial_segment_size
+        self.sync = sync
+        self.retention_segments = retention_segments
+        self.max_open_topics = max_open_topics
+        self._segments = OrderedDict()  # topic -> [Segment], ordered by base offset. Least recently used first
+        os.makedirs(directory, exist_ok=True)
+
+    def _topic_directory(self, topic):
+        return os.path.join(self.directory, quote(topic, safe=''))
+
+    def _open_segment(self, topic, base_offset):
+        path = os.path.join(self._topic_directory(topic), '{:020d}.log'.format(base_offset))
+        return Segment(path, base_offset, self.segment_size, self.initial_segment_size)
+
+    def _topic_segments(self, topic):
+        segments = self._segments.get(topic)
+        if segments is not None:
+            self._segments.move_to_end(topic)
+            return segments
+
+        directory = self._topic_directory(topic)
+        os.makedirs(directory, exist_ok=True)
+        base_offsets = sorted(int(name[:-len('.log')]) for name in os.listdir(directory) if name.endswith('.log'))
+        segments = [self._open_segment(topic, base_offset) for base_offset in base_offsets]
+        if not segments:
+            segments.append(self._open_segment(topic, 0))
+        self._segments[topic] = segments
+        while len(self._segments) > self.max_open_topics:
+            self.close_topic(next(iter(self._segments)))
+        return segments
+
+    def _retire_segments(self, segments):
+        while self.retention_segments is not None and len(segments) > self.retention_segments:
+            segments.pop(0).delete()
+
+    def append(self, topic, data):
+        """Appends the bytes to the log of the topic and returns their offset"""
+        assert data, 'empty records are not supported'
+        segments = self._topic_segments(topic)
+        segment = segments[-1]
+        if not segment.fits(data):
+            if record_header.size + len(data) > self.segment_size:
+                raise ValueError('Record of {} bytes exceeds the segment size'.format(len(data)))
+            segment.seal()
+            segment = self._open_segment(topic, segment.next_offset)
+            segments.append(segment)
+            self._retire_segments(segments)
+        offset = segment.append(data)
+        if self.sync:
+            segment.flush()
+        return offset
+
+    def next_offset(self, topic):
+        """The offset the next appended message of the topic will get"""
+        return self._topic_segments(topic)[-1].next_offset
+
+    def first_offset(self, topic):
+        """The offset of the oldest message of the topic that is retained"""
+        return self._topic_segments(topic)[0].base_offset
+
+    def _segment_of(self, topic, offset):
+        segments = self._topic_segments(topic)
+        index = bisect_right([segment.base_offset for segment in segments], offset) - 1
+        if index < 0 or offset >= segments[-1].next_offset:
+            raise IndexError('No message at offset {} of topic {}'.format(offset, topic))
+        return segments[index]
+
+    def read(self, topic, offset):
+        return self._segment_of(topic, offset).read(offset)
+
+    def iter_from(self, topic, offset, end=None):
+        """Yields (offset, bytes) of the topic, from `offset` up to (excluding) `end` or the current end.
+
+        The messages before `first_offset` are skipped, also if they are retired while iterating.
+        """
+        if end is None:
+            end = self.next_offset(topic)
+        current = offset
+        segment = None
+        while current < end:
+            # the topic can be closed or its segments retired, while the caller holds on to the iterator
+            if segment is None or segment.closed or current >= segment.next_offset:
+                current = max(current, self.first_offset(topic))
+                if current >= end:
+                    return
+                segment = self._segment_of(topic, current)
+            yield current, segment.read(current)
+            current += 1
+
+    def flush(self):
+        for segments in self._segments.values():
+            segments[-1].flush()
+
+    def close_topic(self, topic):
+        """Unmaps the segments of the topic, it is opened again on its next use"""
+        for segment in self._segments.pop(topic, ()):
+            segment.close()
+
+    def close(self):
+        for topic in list(self._segments):
+            self.close_topic(topic)
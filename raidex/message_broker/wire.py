@@ -0,0 +1,280 @@
+import json
+import socket
+import struct
+from collections import Counter
+
+import gevent
+import structlog
+from gevent.queue import Queue
+
+from raidex.messages import BinaryEnvelope
+from raidex.message_broker.listeners import MessageListener
+from raidex.message_broker.message_broker import DISCONNECTED
+
+log = structlog.get_logger('message_broker.wire')
+
+DEFAULT_MULTIPLEX_PORT = 5010
+
+# number of encodings done by the broker, by kind. Stays constant per message, no matter how many subscribers
+encoding_stats = Counter()
+
+# multiplexed connection operations
+SUBSCRIBE = 1
+UNSUBSCRIBE = 2
+PUBLISH = 3
+ACK = 4
+DELIVER = 5
+ERROR = 6
+
+# length of everything after the length field, op, request id, length of the topic
+frame_header = struct.Struct('>IBQH')
+
+
+def encode_frame(op, topic='', payload=b'', request_id=0):
+    """Frame of the multiplexed connection protocol.
+
+    Frame:
+        length = uint32 <big endian, number of bytes following the length field>
+        op = uint8 <SUBSCRIBE, UNSUBSCRIBE, PUBLISH, ACK, DELIVER or ERROR>
+        request_id = uint64 <PUBLISH and its ACK share the id, DELIVER carries the log offset + 1 (0 if not logged),
+                             as wide as the offset, so it doesn't overflow on long-lived topics>
+        topic_length = uint16
+        topic = <utf-8 encoded topic>
+        payload = <a `BinaryEnvelope` frame for PUBLISH and DELIVER, the status byte for ACK,
+                   optionally the uint64 offset to resume from for SUBSCRIBE,
+                   the utf-8 encoded reason for the ERROR answer to a rejected PUBLISH>
+    """
+    topic_bytes = topic.encode('utf-8')
+    length = frame_header.size - 4 + len(topic_bytes) + len(payload)
+    return frame_header.pack(length, op, request_id, len(topic_bytes)) + topic_bytes + payload
+
+
+def is_well_formed(frame):
+    """If the `BinaryEnvelope` frame is as long as its length field says"""
+    header = BinaryEnvelope.header
+    return len(frame) >= header.size and header.unpack_from(frame)[0] == len(frame) - 4
+
+
+def read_frame(read):
+    """Read one frame with `read(size)`, returns (op, request_id, topic, payload) or None when the stream is closed.
+    """
+    header = read(frame_header.size)
+    if len(header) < frame_header.size:
+        return None
+    length, op, request_id, topic_length = frame_header.unpack(header)
+    body_length = length - (frame_header.size - 4)
+    body = read(body_length)
+    if len(body) < body_length:
+        return None
+    return op, request_id, body[:topic_length].decode('utf-8'), body[topic_length:]
+
+
+class WireMessage(object):
+    """A posted message, transcoded on demand into the envelope every subscriber negotiated.
+
+    The same `WireMessage` is put on the queue of every subscriber. The outgoing bytes are encoded at most once
+    per format and then shared by all subscribers, so the cost of a broadcast doesn't grow with the number
+    of subscribers beyond the queue operations and socket writes.
+    """
+
+    def __init__(self, json_data=None, frame=None):
+        assert json_data is not None or frame is not None
+        self._json_data = json_data
+        self._frame = frame
+        self._json_line = None
+        self._deliver_frames = dict()
+        self._message = None
+        # position in the topic log, if the broker keeps one
+        self.offset = None
+
+    @property
+    def json_data(self):
+        if self._json_data is None:
+            encoding_stats['json_data'] += 1
+            self._json_data = BinaryEnvelope.to_json(self._frame)
+        return self._json_data
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            encoding_stats['frame'] += 1
+            self._frame = BinaryEnvelope.from_json(self._json_data)
+        return self._frame
+
+    @property
+    def json_line(self):
+        """The line of a json stream response"""
+        if self._json_line is None:
+            encoding_stats['json_line'] += 1
+            line = {'data': self.json_data}
+            if self.offset is not None:
+                line['offset'] = self.offset
+            self._json_line = (json.dumps(line) + '\n').encode('utf-8')
+        return self._json_line
+
+    def deliver_frame(self, topic):
+        """The DELIVER frame of a multiplexed connection"""
+        try:
+            return self._deliver_frames[topic]
+        except KeyError:
+            encoding_stats['deliver_frame'] += 1
+            frame = encode_frame(DELIVER, topic, self.frame, 0 if self.offset is None else self.offset + 1)
+            self._deliver_frames[topic] = frame
+            return frame
+
+    @property
+    def message_type(self):
+        return BinaryEnvelope.message_type(self.frame)
+
+    @property
+    def message(self):
+        """The decoded message, decoded at most once"""
+        if self._message is None:
+            self._message = BinaryEnvelope.open(self.frame)
+        return self._message
+
+    def __str__(self):
+        return self.json_data
+
+
+def publish(message_broker, topic_log, topic, message):
+    """Sends the `WireMessage` to the listeners of the topic, after appending it to the topic log if there is one.
+
+    Returns:
+        bool: if the message reached a listener or was logged
+    """
+    logged = False
+    if topic_log is not None:
+        message.offset = topic_log.append(topic, message.frame)
+        logged = True
+    return message_broker.send(topic, message) or logged
+
+
+def subscribe(message_broker, topic_log, topic, from_offset=None):
+    """Starts a listener on the topic.
+
+    Returns:
+        (MessageListener, iterable): the listener and the logged messages from `from_offset` on, that were sent
+        before the listener was started. They have to be passed on before the messages of the listener.
+    """
+    listener = MessageListener(message_broker, topic)
+    listener.start()
+    if topic_log is None or from_offset is None:
+        return listener, ()
+
+    def replay(end):
+        for offset, data in topic_log.iter_from(topic, from_offset, end):
+            message = WireMessage(frame=bytes(data))
+            message.offset = offset
+            yield message
+
+    # everything after `end` arrives through the listener
+    return listener, replay(topic_log.next_offset(topic))
+
+
+class MultiplexSession(object):
+    """Serves one multiplexed connection: any number of topic subscriptions and publishes over one socket.
+
+    Outgoing frames are written by a single writer greenlet, so deliveries of different topics and
+    acknowledgements never interleave on the socket.
+    """
+
+    def __init__(self, message_broker, socket, topic_log=None):
+        self.message_broker = message_broker
+        self.socket = socket
+        self.topic_log = topic_log
+        self.subscriptions = dict()  # topic -> (MessageListener, forwarding greenlet)
+        # bounded like the listener queues, so a slow connection backs up into them and their overflow policy applies
+        self.outbox = Queue(message_broker.max_queue_size)
+
+    def serve(self):
+        writer = gevent.spawn(self._write)
+        reader = self.socket.makefile('rb')
+        try:
+            while True:
+                frame = read_frame(reader.read)
+                if frame is None:
+                    break
+                self.handle(*frame)
+        finally:
+            for topic in list(self.subscriptions):
+                self.unsubscribe(topic)
+            writer.kill()
+            reader.close()
+            self.socket.close()
+
+    def handle(self, op, request_id, topic, payload):
+        if op == SUBSCRIBE:
+            from_offset = struct.unpack('>Q', payload)[0] if payload else None
+            self.subscribe(topic, from_offset)
+        elif op == UNSUBSCRIBE:
+            self.unsubscribe(topic)
+        elif op == PUBLISH:
+            if not is_well_formed(payload):
+                self.outbox.put(encode_frame(ERROR, topic, b'Malformed frame', request_id))
+                return
+            status = publish(self.message_broker, self.topic_log, topic, WireMessage(frame=payload))
+            self.outbox.put(encode_frame(ACK, topic, b'\x01' if status else b'\x00', request_id))
+        else:
+            log.debug('Unknown operation {} on multiplexed connection'.format(op))
+
+    def subscribe(self, topic, from_offset=None):
+        if topic in self.subscriptions:
+            return
+        listener, replayed = subscribe(self.message_broker, self.topic_log, topic, from_offset)
+        self.subscriptions[topic] = listener, gevent.spawn(self._forward, topic, listener, replayed)
+
+    def unsubscribe(self, topic):
+        subscription = self.subscriptions.pop(topic, None)
+        if subscription is None:
+            return
+        listener, forwarder = subscription
+        listener.stop()
+        forwarder.kill()
+
+    def _forward(self, topic, listener, replayed=()):
+        for message in replayed:
+            self.outbox.put(message.deliver_frame(topic))
+        while True:
+            message = listener.get()
+            if message is DISCONNECTED:
+                # the connection is too slow, closing it ends `serve`
+                self.socket.shutdown(socket.SHUT_RDWR)
+                return
+            self.outbox.put(message.deliver_frame(topic))
+
+    def _write(self):
+        while True:
+            self.socket.sendall(self.outbox.get())
+
+
+def iter_json_lines(listener, replayed=()):
+    """Body of a json stream response, ends when the listener gets disconnected"""
+    for message in replayed:
+        yield message.json_line
+    while True:
+        message = listener.get()
+        if message is DISCONNECTED:
+            return
+        yield message.json_line
+
+
+def iter_frames(listener, replayed=()):
+    """Body of a frame stream response, ends when the listener gets disconnected"""
+    for message in replayed:
+        yield message.frame
+    while True:
+        message = listener.get()
+        if message is DISCONNECTED:
+            return
+        yield message.frame
+
+
+def multiplex_handler(message_broker, topic_log=None):
+    """Returns a connection handler for a `gevent.server.StreamServer`"""
+
+    def handle(socket, address):
+        log.debug('New multiplexed connection from {}'.format(address))
+        MultiplexSession(message_broker, socket, topic_log).serve()
+
+    return handle
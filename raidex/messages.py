@@ -1,5 +1,7 @@
 import json
 import base64
+import struct
+from functools import lru_cache
 
 from copy import deepcopy
 import rlp
@@ -27,18 +29,67 @@ def sign(messagedata, private_key):
     return privkey_instance.sign_msg(messagedata).to_bytes()
 
 
+def _field_names(klass):
+    names = klass.__dict__.get('_field_names')
+    if names is None:
+        names = frozenset(field for field, _ in klass.fields)
+        setattr(klass, '_field_names', names)
+    return names
+
+
+SENDER_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=SENDER_CACHE_SIZE)
+def recover_sender(hash_without_signature, signature):
+    """Recovers the address that signed `hash_without_signature`.
+
+    The same messages (e.g. a `CommitmentProof` embedded in every `ProvenOffer` of an offer) are decoded
+    over and over, so the results of the expensive public key recovery are kept in a process wide LRU cache.
+    Hits and misses are available from `recover_sender.cache_info()`.
+    """
+    signature_obj = keys.Signature(signature_bytes=signature)
+    pub = signature_obj.recover_public_key_from_msg(hash_without_signature)
+    return decode_hex(pub.to_address())
+
+
 class RLPHashable(rlp.Serializable):
     # _cached_rlp caches serialized object
+    # _cached_hash caches keccak(_cached_rlp)
+    # both are only filled while the object is immutable and dropped as soon as it is mutated
 
     _mutable = True
+    _cached_hash = None
+    _cache_attributes = ('_cached_rlp', '_cached_hash')
 
     priority = 0
 
     fields = [('cmdid', int32)]
 
+    def __setattr__(self, attr, value):
+        super(RLPHashable, self).__setattr__(attr, value)
+        if attr in _field_names(self.__class__) or (attr == '_mutable' and value):
+            self._invalidate_cache()
+
+    def _invalidate_cache(self):
+        for attr in self._cache_attributes:
+            self.__dict__.pop(attr, None)
+
+    @property
+    def encoded(self):
+        if self.is_mutable():
+            return rlp.encode(self)
+        if self._cached_rlp is None:
+            self._cached_rlp = rlp.encode(self)
+        return self._cached_rlp
+
     @property
     def hash(self):
-        return keccak(rlp.encode(self))  # this was `cached=True`, but made the obj immutable e.g. on every comparison
+        if self.is_mutable():
+            return keccak(rlp.encode(self))
+        if self._cached_hash is None:
+            self._cached_hash = keccak(self.encoded)
+        return self._cached_hash
 
     def __eq__(self, other):
         return isinstance(other, self.__class__) and self.hash == other.hash
@@ -67,6 +118,8 @@ class SignatureMissingError(Exception):
 class Signed(RLPHashable):
 
     _sender = ''
+    _cached_hash_without_signature = None
+    _cache_attributes = RLPHashable._cache_attributes + ('_cached_hash_without_signature', '_sender')
     # signature = ''
     fields = [('signature', sig65)] + RLPHashable.fields
 
@@ -75,7 +128,7 @@ class Signed(RLPHashable):
     #    super(Signed, self).__init__(sender=sender)
 
     def __len__(self):
-        return len(rlp.encode(self))
+        return len(self.encoded)
 
     @property
     def hash(self):
@@ -85,13 +138,19 @@ class Signed(RLPHashable):
 
     @property
     def _hash_without_signature(self):
-        return keccak(rlp.encode(self, self.__class__.exclude(['signature'])))
+        if self.is_mutable():
+            return keccak(rlp.encode(self, self.__class__.exclude(['signature'])))
+        if self._cached_hash_without_signature is None:
+            self._cached_hash_without_signature = keccak(rlp.encode(self, self.__class__.exclude(['signature'])))
+        return self._cached_hash_without_signature
 
     def sign(self, privkey):
         assert self.is_mutable()
         assert isinstance(privkey, bytes) and len(privkey) == 32
-        self.signature = sign(self._hash_without_signature, privkey)
+        hash_without_signature = self._hash_without_signature
+        self.signature = sign(hash_without_signature, privkey)
         self.make_immutable()
+        self._cached_hash_without_signature = hash_without_signature
         return self
 
     @property
@@ -107,11 +166,10 @@ class Signed(RLPHashable):
             if not self.signature:
                 raise SignatureMissingError()
             if isinstance(self.signature, bytes):
-                signature_obj = keys.Signature(signature_bytes=self.signature)
+                signature = self.signature
             else:
-                signature_obj = self.signature
-            pub = signature_obj.recover_public_key_from_msg(self._hash_without_signature)
-            self._sender = decode_hex(pub.to_address())
+                signature = self.signature.to_bytes()
+            self._sender = recover_sender(self._hash_without_signature, signature)
         return self._sender
 
     @classmethod
@@ -441,6 +499,9 @@ msg_cmdid_map = dict(
         )
 
 
+cmdid_msg_map = {value: key for key, value in msg_cmdid_map.items()}
+
+
 def get_cmdid_for_class(klass):
     msg = types_msg_map[klass]
     cmdid = msg_cmdid_map[msg]
@@ -475,15 +536,27 @@ class Envelope(object):
         except ValueError:
             raise ValueError("JSON-Envelope could not be decoded")
 
-        if envelope['version'] != cls.version:
-            raise ValueError("Message version mismatch! want:{} got:{}".format(
-                Envelope.version, envelope['msg']))
+        return cls.open_envelope(envelope)
 
-        klass = msg_types_map[envelope['msg']]
+    @classmethod
+    def open_envelope(cls, envelope):
+        """Return the message instance of an already parsed envelope.
+        """
+        klass = cls.message_type(envelope)
         message = klass.deserialize(cls.decode(envelope['data']))
 
         return message
 
+    @classmethod
+    def message_type(cls, envelope):
+        """Return the message class of an already parsed envelope, without decoding its data.
+        """
+        if envelope['version'] != cls.version:
+            raise ValueError("Message version mismatch! want:{} got:{}".format(
+                Envelope.version, envelope['msg']))
+
+        return msg_types_map[envelope['msg']]
+
     @classmethod
     def envelop(cls, message):
         """Wrap the message in a json envelope.
@@ -492,6 +565,155 @@ class Envelope(object):
         envelope = dict(
                 version=Envelope.version,
                 msg=types_msg_map[message.__class__],
-                data=cls.encode(message.serialize(message)),
+                data=base64.encodebytes(message.encoded).decode(encoding="utf-8"),
                 )
         return json.dumps(envelope)
+
+
+class BinaryEnvelope(object):
+    """Packs messages in length-prefixed binary frames, without the JSON and base64 layers of the `Envelope`.
+
+    Frame:
+        length = uint32 <big endian, number of bytes following the length field>
+        cmdid = uint8 <cmdid of the message class, 0 for plain text>
+        data = <raw rlp of the message, or the utf-8 encoded text>
+
+    The JSON `Envelope` stays the format for the web UI, both formats can be transcoded
+    into each other without decoding the rlp data.
+    """
+
+    version = 2
+    content_type = 'application/x-raidex-frames'
+
+    TEXT_CMDID = 0
+    header = struct.Struct('>IB')
+
+    @classmethod
+    def _frame(cls, cmdid, data):
+        return cls.header.pack(len(data) + 1, cmdid) + data
+
+    @classmethod
+    def envelop(cls, message):
+        """Pack a message instance or a plain string in a frame.
+        """
+        if isinstance(message, str):
+            return cls._frame(cls.TEXT_CMDID, message.encode('utf-8'))
+        assert isinstance(message, RLPHashable)
+        return cls._frame(get_cmdid_for_class(message.__class__), message.encoded)
+
+    @classmethod
+    def open(cls, frame):
+        """Unpack a frame and return the message instance, or the plain string.
+        """
+        length, _ = cls.header.unpack_from(frame)
+        if length != len(frame) - 4:
+            raise ValueError("Frame length mismatch! want:{} got:{}".format(length, len(frame) - 4))
+        data = frame[cls.header.size:]
+
+        klass = cls.message_type(frame)
+        if klass is str:
+            return data.decode('utf-8')
+
+        message = klass.deserialize(rlp.decode(data))
+        # the deserialized message is immutable, so the received rlp can be reused for hashing
+        message._cached_rlp = data
+        return message
+
+    @classmethod
+    def message_type(cls, frame):
+        """Return the message class (or `str`) of a frame, without decoding its data.
+        """
+        _, cmdid = cls.header.unpack_from(frame)
+        if cmdid == cls.TEXT_CMDID:
+            return str
+        try:
+            return msg_types_map[cmdid_msg_map[cmdid]]
+        except KeyError:
+            raise ValueError("Unknown cmdid {}".format(cmdid))
+
+    @classmethod
+    def read(cls, read):
+        """Read one frame with `read(size)`, returns None when the stream is closed.
+        """
+        length_bytes = read(4)
+        if len(length_bytes) < 4:
+            return None
+        length, = struct.unpack('>I', length_bytes)
+        body = read(length)
+        if len(body) < length:
+            return None
+        return length_bytes + body
+
+    @classmethod
+    def from_json(cls, data):
+        """Transcode the data of a JSON `Envelope` (or a plain string) into a frame.
+        """
+        try:
+            envelope = json.loads(data)
+            assert isinstance(envelope, dict)
+            cmdid = msg_cmdid_map[envelope['msg']]
+            payload = base64.decodebytes(envelope['data'].encode(encoding='utf-8'))
+        except (ValueError, AssertionError, KeyError, TypeError):
+            return cls._frame(cls.TEXT_CMDID, data.encode('utf-8'))
+        return cls._frame(cmdid, payload)
+
+    @classmethod
+    def to_json(cls, frame):
+        """Transcode a frame into the data of a JSON `Envelope` (or the plain string).
+        """
+        _, cmdid = cls.header.unpack_from(frame)
+        data = frame[cls.header.size:]
+
+        if cmdid == cls.TEXT_CMDID:
+            return data.decode('utf-8')
+        envelope = dict(
+                version=Envelope.version,
+                msg=cmdid_msg_map[cmdid],
+                data=base64.encodebytes(data).decode(encoding="utf-8"),
+                )
+        return json.dumps(envelope)
+
+
+class LazyMessage(object):
+    """A received message of which only the envelope header has been read.
+
+    `message_type` is known without decoding the rlp data, so listeners can discard messages they are
+    not interested in for free. The message itself is decoded on first access of `message`, at most once.
+    Received data that is no envelope is passed on as plain string, with `message_type` `str`.
+    """
+
+    __slots__ = ('_frame', '_envelope', '_text', 'message_type', '_message')
+
+    def __init__(self, frame=None, envelope=None, text=None, message_type=str):
+        self._frame = frame
+        self._envelope = envelope
+        self._text = text
+        self.message_type = message_type
+        self._message = None
+
+    @classmethod
+    def from_frame(cls, frame):
+        return cls(frame=frame, message_type=BinaryEnvelope.message_type(frame))
+
+    @classmethod
+    def from_json(cls, data):
+        try:
+            envelope = json.loads(data)
+            assert isinstance(envelope, dict)
+            return cls(envelope=envelope, message_type=Envelope.message_type(envelope))
+        except (ValueError, AssertionError, KeyError):
+            return cls(text=data)
+
+    @property
+    def message(self):
+        if self._message is None:
+            if self._frame is not None:
+                self._message = BinaryEnvelope.open(self._frame)
+            elif self._envelope is not None:
+                self._message = Envelope.open_envelope(self._envelope)
+            else:
+                self._message = self._text
+        return self._message
+
+    def __repr__(self):
+        return '<LazyMessage({})>'.format(self.message_type.__name__)
@@ -3,6 +3,7 @@ from flask.views import MethodView
 
 from raidex.raidex_node.raidex_node import RaidexNode
 from raidex.raidex_node.handle_api_call import on_api_call
+from raidex.raidex_node.offer_grouping import PRICE_GROUP_PRECISION
 
 # API-Resources - the json encoding and decoding is handled manually for simplicity and readability
 # Type-checking, encoding/decoding and error-responses are kept very basic
@@ -14,9 +15,16 @@ class Offers(MethodView):
         self.raidex_node = raidex_node
 
     def get(self):
+        price_group_precision = request.args.get('precision', default=PRICE_GROUP_PRECISION, type=int)
+        # a precision that isn't an int falls back to the default above, it is rejected like one out of range
+        if 'precision' in request.args and request.args.get('precision', type=int) is None:
+            abort(400, 'Invalid precision')
+        # digits after the decimal point, at most the resolution of the fixed-point prices
+        if not 0 <= price_group_precision <= self.raidex_node.offer_book.price_decimal:
+            abort(400, 'Invalid precision')
         # the grouped offers are sorted, with lowest price first
-        buys = self.raidex_node.grouped_buys()
-        sells = reversed(self.raidex_node.grouped_sells())
+        buys = self.raidex_node.grouped_buys(price_group_precision)
+        sells = reversed(self.raidex_node.grouped_sells(price_group_precision))
         dict_ = dict(
             data=dict(
                 buys=[
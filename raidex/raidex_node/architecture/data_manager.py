@@ -13,11 +13,11 @@ logger = structlog.get_logger('StateChangeHandler')
 
 class DataManager:
 
-    def __init__(self, offer_book, market):
+    def __init__(self, offer_book, market, matching_algorithm=MATCHING_ALGORITHM):
 
         self.offer_manager = OfferManager()
         self.market = market
-        self.matching_engine = MatchingEngine(offer_book, MATCHING_ALGORITHM)
+        self.matching_engine = MatchingEngine(offer_book, matching_algorithm)
         self.orders = dict()
         self.matches = dict()
         self.timeout_handler = TimeoutHandler()
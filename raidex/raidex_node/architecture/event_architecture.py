@@ -1,5 +1,14 @@
+import time
+from contextlib import contextmanager
+
+import gevent
+from gevent import getcurrent
 from gevent.greenlet import Greenlet
-from gevent.queue import Queue
+from gevent.local import local
+from gevent.queue import Queue, Empty
+
+# maximum number of queued events a consumer hands to its handler at once
+DEFAULT_MAX_BATCH_SIZE = 100
 
 
 class Processor:
@@ -9,59 +18,264 @@ class Processor:
 
 
 class Consumer(Greenlet):
+    """Takes the events of its queue in batches and hands them to the handlers of the processor.
+
+    After the first event of a batch arrived, up to `max_batch_size` events are drained from the queue: the ones
+    that are already queued, or if `batch_timeout` is set, the ones that arrive within that many seconds.
+    A batch is passed to `on_batch(processor, events)` if given, otherwise to `on_event(processor, event)`
+    event by event.
+    """
     __slots__ = [
         'processor',
         'queue',
-        'on_event'
+        'on_event',
+        'on_batch',
+        'max_batch_size',
+        'batch_timeout',
+        'trace',
+        'dispatch_context',
     ]
 
-    def __init__(self, queue: Queue, processor: Processor, on_event):
+    def __init__(self, queue: Queue, processor: Processor, on_event, on_batch=None,
+                 max_batch_size=DEFAULT_MAX_BATCH_SIZE, batch_timeout=0, trace=False):
         Greenlet.__init__(self)
         self.queue = queue
         self.processor = processor
         self.on_event = on_event
+        self.on_batch = on_batch
+        self.max_batch_size = max_batch_size
+        self.batch_timeout = batch_timeout
+        # print every consumed event
+        self.trace = trace
+        # the `DispatchContext` of the handlers, set when connected to a `Dispatch`
+        self.dispatch_context = None
+
+    def _drain(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.batch_timeout
+        while len(batch) < self.max_batch_size:
+            try:
+                if self.batch_timeout:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except Empty:
+                break
+        return batch
 
     def _run(self):
         while True:
-            event = self.queue.get()
-            print(f'EVENT: {event.__class__.__name__}, {self.processor.__class__.__name__}')
-            self.on_event(self.processor, event)
+            self.handle_batch(self._drain())
+
+    def handle_batch(self, batch):
+        if self.trace:
+            for event in batch:
+                print(f'EVENT: {event.__class__.__name__}, {self.processor.__class__.__name__}')
+        if self.on_batch is not None:
+            self.on_batch(self.processor, batch)
+        else:
+            for event in batch:
+                self.on_event(self.processor, event)
 
     def get_types(self):
         return self.processor.event_types
 
 
+class EventRouter:
+    """Routes events to the handler functions registered for their type or one of its base classes.
+
+    The handlers of an event class are looked up along its MRO once and cached, so routing an event is a
+    dict lookup. All matching handlers are called, in the order they were registered.
+    """
+
+    def __init__(self, routes=()):
+        self._handlers = list()  # (event_type, handler)
+        self._routes = dict()  # concrete event class -> tuple of handlers
+        for event_type, handler in routes:
+            self.register(event_type, handler)
+
+    def register(self, event_type, handler):
+        self._handlers.append((event_type, handler))
+        self._routes.clear()
+
+    def handlers_for(self, event_class):
+        try:
+            return self._routes[event_class]
+        except KeyError:
+            mro = event_class.__mro__
+            handlers = tuple(handler for event_type, handler in self._handlers if event_type in mro)
+            self._routes[event_class] = handlers
+            return handlers
+
+    def handle(self, event, *args):
+        """Calls handler(*args, event) for every handler of the event"""
+        for handler in self.handlers_for(event.__class__):
+            handler(*args, event)
+
+
 class Dispatch:
+    """The consumers of one kind of events, events are put on the queues of the consumers handling their type"""
+
+    # default of new consumers, see `trace_events`
+    trace = False
+
+    def __init__(self, context=None):
+        self.consumer_tasks = list()
+        # concrete event class -> consumers, whose processor handles it
+        self._routes = dict()
+        # the `DispatchContext` the consumers run in
+        self.context = context
 
-    consumer_tasks = list()
+    def connect_consumer(self, consumer: Processor, handle_event, handle_events=None, **kwargs):
+        """Connects the processor, `handle_events` is the optional batch-aware handler, see `Consumer`"""
+        kwargs.setdefault('trace', self.trace)
+        task = Consumer(Queue(), consumer, handle_event, handle_events, **kwargs)
+        task.dispatch_context = self.context
+        self.consumer_tasks.append(task)
+        self._routes.clear()
 
-    @staticmethod
-    def connect_consumer(consumer: Processor, handle_event):
-        Dispatch.consumer_tasks.append(Consumer(Queue(), consumer, handle_event))
+    def trace_events(self, enabled=True):
+        """Prints every event when it is consumed"""
+        self.trace = enabled
+        for consumer in self.consumer_tasks:
+            consumer.trace = enabled
 
-    @staticmethod
-    def start_consumer_tasks():
-        for consumer in Dispatch.consumer_tasks:
+    def consumers_for(self, event_class):
+        try:
+            return self._routes[event_class]
+        except KeyError:
+            consumers = tuple(consumer for consumer in self.consumer_tasks
+                              if issubclass(event_class, consumer.get_types()))
+            self._routes[event_class] = consumers
+            return consumers
+
+    def start_consumer_tasks(self):
+        for consumer in self.consumer_tasks:
             consumer.start()
 
+    def stop_consumer_tasks(self):
+        gevent.killall(self.consumer_tasks)
+
+
+class DispatchContext:
+    """The event and state change dispatch of one node.
+
+    Every `App` dispatches within its own context, so several nodes can run in one process without receiving each
+    other's events. The module level `dispatch_events` and `dispatch_state_changes` dispatch within the context of
+    the calling greenlet: the one it was bound to with `spawn`, or else the one of the greenlet that spawned it.
+    Greenlets outside of any context use the `default_context`.
+    """
+
+    def __init__(self):
+        self.event_dispatch = Dispatch(self)
+        self.state_change_dispatch = Dispatch(self)
+
+    def dispatch_events(self, events):
+        if _replay.active:
+            return
+        _dispatch(self.event_dispatch, events)
+
+    def dispatch_state_changes(self, state_changes):
+        _dispatch(self.state_change_dispatch, state_changes)
+
+    def start_consumer_tasks(self):
+        self.event_dispatch.start_consumer_tasks()
+        self.state_change_dispatch.start_consumer_tasks()
+
+    def stop_consumer_tasks(self):
+        self.event_dispatch.stop_consumer_tasks()
+        self.state_change_dispatch.stop_consumer_tasks()
+
+    def trace_events(self, enabled=True):
+        self.event_dispatch.trace_events(enabled)
+        self.state_change_dispatch.trace_events(enabled)
+
+    def spawn(self, function, *args, **kwargs):
+        """Runs the function in a new greenlet bound to this context"""
+        greenlet = Greenlet(function, *args, **kwargs)
+        greenlet.dispatch_context = self
+        greenlet.start()
+        return greenlet
+
+
+default_context = DispatchContext()
+# the dispatch of the default context, for the nodes that don't run in a context of their own
+event_dispatch = default_context.event_dispatch
+state_change_dispatch = default_context.state_change_dispatch
+
+
+def current_context():
+    """The `DispatchContext` of the calling greenlet, see `DispatchContext`"""
+    current = getcurrent()
+    greenlet = current
+    context = None
+    while greenlet is not None:
+        context = getattr(greenlet, 'dispatch_context', None)
+        if context is not None:
+            break
+        spawning_greenlet = getattr(greenlet, 'spawning_greenlet', None)
+        greenlet = spawning_greenlet() if spawning_greenlet is not None else None
+    if context is None:
+        context = default_context
+    if isinstance(current, Greenlet):
+        # the spawning greenlets are only weakly referenced, remember the context while it can be found
+        current.dispatch_context = context
+    return context
+
+
+class _Replay(local):
+    # while the greenlet replays recorded state changes, their events were already handled when they were recorded
+    active = False
+    # the actions deferred until the replay is done
+    deferred = None
+
+
+_replay = _Replay()
+
+
+@contextmanager
+def replaying():
+    """Drops the events dispatched by the greenlet while it replays state changes, so that replaying has no side
+    effects. The actions passed to `defer_while_replaying` run when the outermost replay is done.
+    """
+    if _replay.active:
+        yield
+        return
+    _replay.active = True
+    _replay.deferred = list()
+    try:
+        yield
+    finally:
+        deferred = _replay.deferred
+        _replay.active = False
+        _replay.deferred = None
+    for action in deferred:
+        action()
+
 
-event_dispatch = Dispatch()
-state_change_dispatch = Dispatch()
+def defer_while_replaying(action):
+    """Defers the action until the greenlet's replay is done, returns False if it isn't replaying"""
+    if not _replay.active:
+        return False
+    _replay.deferred.append(action)
+    return True
 
 
 def dispatch_events(events):
-    _dispatch(event_dispatch, events)
+    current_context().dispatch_events(events)
 
 
 def dispatch_state_changes(state_changes):
-    _dispatch(state_change_dispatch, state_changes)
+    current_context().dispatch_state_changes(state_changes)
 
 
 def _dispatch(handler, events):
     for state_change in events:
-        for consumer in handler.consumer_tasks:
-            if isinstance(state_change, consumer.get_types()):
-                consumer.queue.put(state_change)
+        for consumer in handler.consumers_for(state_change.__class__):
+            consumer.queue.put(state_change)
 
 
 
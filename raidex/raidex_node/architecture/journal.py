@@ -0,0 +1,247 @@
+import os
+import pickle
+import random
+import struct
+from collections import namedtuple
+from contextlib import contextmanager
+
+import gevent
+import structlog
+from gevent.lock import Semaphore
+
+from raidex.utils import timestamp
+from raidex.utils.random import seeded_ids
+
+log = structlog.get_logger('node.journal')
+
+# flush the recorded state changes to disk at most this many seconds after they were recorded
+DEFAULT_SYNC_INTERVAL = 0.05
+# ... or as soon as this many state changes are waiting
+DEFAULT_MAX_UNSYNCED = 1000
+# number of state changes after which a snapshot is taken
+DEFAULT_SNAPSHOT_INTERVAL = 10000
+
+record_header = struct.Struct('>I')
+
+JournalEntry = namedtuple('JournalEntry', ['timestamp', 'seed', 'state_change'])
+
+
+def new_entry(state_change):
+    """Entry of a state change that is handled now, the seed makes the ids created while handling it reproducible"""
+    return JournalEntry(timestamp.time(), random.getrandbits(64), state_change)
+
+
+@contextmanager
+def deterministic(entry):
+    """Handles the entry's state change at the recorded time and with the recorded ids"""
+    with timestamp.frozen_time(entry.timestamp), seeded_ids(entry.seed):
+        yield
+
+
+def _off_hub(func, *args):
+    """Runs the blocking file operation on a thread of the hub's threadpool, the other greenlets keep running"""
+    return gevent.get_hub().threadpool.apply(func, args)
+
+
+def _write_snapshot(path, data, old_paths):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+    for old_path in old_paths:
+        os.remove(old_path)
+
+
+def _sync_and_close(file):
+    os.fsync(file.fileno())
+    file.close()
+
+
+def read_records(path):
+    """Yields (end position, bytes) of the complete records of a journal file.
+
+    Record:
+        length = uint32 <big endian, number of bytes of data>
+        data = <pickled `JournalEntry`>
+
+    A record that was cut off by a crash while it was written ends the journal.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    position = 0
+    while position + record_header.size <= len(data):
+        length, = record_header.unpack_from(data, position)
+        end = position + record_header.size + length
+        if end > len(data):
+            break
+        yield end, data[position + record_header.size:end]
+        position = end
+
+
+class StateChangeJournal(object):
+    """Append-only journal of the state changes of a node, with periodic snapshots of its state.
+
+    The journal is a sequence of segment files, a new segment is started with every snapshot. The number in the
+    file names of a snapshot and of a segment is the number of state changes recorded before it, so a restart
+    loads the latest snapshot and replays the segments that follow it. Older files are deleted after a snapshot.
+
+    Recorded state changes are written right away, but flushed to disk in groups (group commit): after
+    `sync_interval` seconds, or as soon as `max_unsynced` state changes are waiting. A crash can lose the
+    state changes of the last `sync_interval`. The fsyncs and the snapshot files are written on a thread of the
+    hub's threadpool.
+
+    Args:
+        directory (str): where the snapshots and segments are kept
+        snapshot_interval (int): number of state changes between snapshots, 0 for no snapshots
+    """
+
+    def __init__(self, directory, sync_interval=DEFAULT_SYNC_INTERVAL, max_unsynced=DEFAULT_MAX_UNSYNCED,
+                 snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL):
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.max_unsynced = max_unsynced
+        self.snapshot_interval = snapshot_interval
+        # number of state changes recorded since the journal was started
+        self.sequence = 0
+        self._file = None
+        self._unsynced = 0
+        self._since_snapshot = 0
+        self._sync_task = None
+        self._sync_lock = Semaphore()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, kind, sequence):
+        extension = 'pickle' if kind == 'snapshot' else 'log'
+        return os.path.join(self.directory, '{}-{:020d}.{}'.format(kind, sequence, extension))
+
+    def _files(self, kind):
+        files = list()
+        for name in os.listdir(self.directory):
+            if name.startswith(kind + '-') and not name.endswith('.tmp'):
+                files.append((int(name[len(kind) + 1:].split('.')[0]), os.path.join(self.directory, name)))
+        return sorted(files)
+
+    def read(self):
+        """Reads the journal without opening it for recording.
+
+        Returns:
+            (object, list): the state of the latest snapshot, or None if there is none, and the `JournalEntry`s
+            recorded after it, that have to be replayed on top of it
+        """
+        state, entries, _ = self._read()
+        return state, entries
+
+    def _read(self):
+        state = None
+        base = 0
+
+        snapshots = self._files('snapshot')
+        if snapshots:
+            base, path = snapshots[-1]
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+
+        entries = list()
+        segments = list()  # (path, end of the complete records)
+        for sequence, path in self._files('journal'):
+            # segments before the snapshot are left over from a crash during the snapshot
+            if sequence < base:
+                continue
+            valid_end = 0
+            for valid_end, data in read_records(path):
+                entries.append(pickle.loads(data))
+            segments.append((path, valid_end))
+
+        self.sequence = base + len(entries)
+        self._since_snapshot = len(entries)
+        if not segments:
+            segments.append((self._path('journal', base), 0))
+        return state, entries, segments
+
+    def load(self):
+        """Reads the journal, see `read`, and opens it for recording"""
+        assert self._file is None, 'journal already loaded'
+        state, entries, segments = self._read()
+
+        for path, valid_end in segments:
+            if os.path.exists(path) and valid_end < os.path.getsize(path):
+                log.warning('Dropping incomplete record at the end of the journal', path=path)
+                with open(path, 'r+b') as f:
+                    f.truncate(valid_end)
+
+        self._file = open(segments[-1][0], 'ab')
+        return state, entries
+
+    def record(self, state_changes):
+        """Appends the state changes to the journal, before they are handled.
+
+        Returns:
+            list: the `JournalEntry`s, the state changes have to be handled with `deterministic(entry)`
+        """
+        assert self._file is not None, 'journal not loaded'
+        entries = [new_entry(state_change) for state_change in state_changes]
+        records = list()
+        for entry in entries:
+            data = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+            records.append(record_header.pack(len(data)))
+            records.append(data)
+        self._file.write(b''.join(records))
+
+        self.sequence += len(entries)
+        self._since_snapshot += len(entries)
+        self._unsynced += len(entries)
+        if self._unsynced >= self.max_unsynced:
+            self.sync()
+        elif self._sync_task is None:
+            self._sync_task = gevent.spawn_later(self.sync_interval, self._sync_later)
+        return entries
+
+    def _sync_later(self):
+        self._sync_task = None
+        self.sync()
+
+    def sync(self):
+        with self._sync_lock:
+            if self._unsynced and self._file is not None:
+                self._file.flush()
+                self._unsynced = 0
+                _off_hub(os.fsync, self._file.fileno())
+
+    @property
+    def snapshot_due(self):
+        return bool(self.snapshot_interval) and self._since_snapshot >= self.snapshot_interval
+
+    def snapshot(self, state):
+        """Writes the state, that includes all recorded state changes, and starts a new segment.
+
+        The state is pickled and the new segment started before the first file operation yields, the state changes
+        that are recorded while the snapshot is written go to the new segment. The old files are deleted once the
+        snapshot is on disk.
+        """
+        with self._sync_lock:
+            sequence = self.sequence
+            data = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+            old_file = self._file
+            old_file.flush()
+            self._file = open(self._path('journal', sequence), 'ab')
+            self._since_snapshot = 0
+
+            _off_hub(_sync_and_close, old_file)
+            old_paths = [old_path for kind in ('snapshot', 'journal') for old_sequence, old_path in self._files(kind)
+                         if old_sequence < sequence]
+            _off_hub(_write_snapshot, self._path('snapshot', sequence), data, old_paths)
+        log.debug('Snapshot written', sequence=sequence)
+
+    def close(self):
+        # a referenced sync task hasn't started yet, see `_sync_later`
+        if self._sync_task is not None:
+            self._sync_task.kill()
+            self._sync_task = None
+        if self._file is not None:
+            self.sync()
+            with self._sync_lock:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
@@ -0,0 +1,79 @@
+"""Deterministic throughput benchmark of the node's state machine, by replaying a recorded journal.
+
+Replays the state changes recorded by a `StateChangeJournal`, e.g. one of a node run with --journal-dir, and
+reports the state changes handled per second. Every run of the same journal handles the same state changes
+at the same recorded times, so runs are comparable across changes of the handlers.
+
+    python -m raidex.raidex_node.benchmark --journal-dir /tmp/journal --generate 20000
+    python -m raidex.raidex_node.benchmark --journal-dir /tmp/journal
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from raidex.raidex_node.architecture.data_manager import DataManager
+from raidex.raidex_node.architecture.journal import StateChangeJournal
+from raidex.raidex_node.architecture.state_change import NewLimitOrderStateChange, OfferPublishedStateChange
+from raidex.raidex_node.handle_state_change import handle_state_changes, replay
+from raidex.raidex_node.offer_book import OfferBook, OfferBookEntry
+from raidex.raidex_node.order.offer import BasicOffer, OfferType
+from raidex.utils.timestamp import time_plus
+
+
+def generate_journal(directory, nof_state_changes, seed=0, batch_size=20):
+    """Records a journal of published offers and limit orders, that partially match them"""
+    rng = random.Random(seed)
+    journal = StateChangeJournal(directory, snapshot_interval=0)
+    journal.load()
+
+    node = SimpleNamespace(data_manager=DataManager(OfferBook(), None), journal=journal)
+
+    batch = list()
+    for i in range(nof_state_changes):
+        price = rng.randint(90, 110)
+        offer_type = rng.choice(['BUY', 'SELL'])
+        if rng.random() < 0.8:
+            offer = BasicOffer(rng.getrandbits(32), OfferType[offer_type], 10, 10 * price, time_plus(seconds=600))
+            batch.append(OfferPublishedStateChange(OfferBookEntry(offer, b'\x00' * 20, None)))
+        else:
+            batch.append(NewLimitOrderStateChange({'order_id': i, 'order_type': offer_type, 'amount': 30,
+                                                   'price': price, 'lifetime': 600}))
+        if len(batch) == batch_size:
+            handle_state_changes(node, batch)
+            batch = list()
+    if batch:
+        handle_state_changes(node, batch)
+    journal.close()
+
+
+def benchmark_replay(directory):
+    snapshot, entries = StateChangeJournal(directory).read()
+    data_manager = snapshot if snapshot is not None else DataManager(OfferBook(), None)
+
+    start = time.perf_counter()
+    replay(data_manager, entries)
+    elapsed = time.perf_counter() - start
+    offer_book = data_manager.matching_engine.offer_book
+
+    return dict(
+        state_changes=len(entries),
+        seconds=round(elapsed, 3),
+        state_changes_per_second=round(len(entries) / elapsed) if elapsed else None,
+        orders=len(data_manager.orders),
+        offer_book=len(offer_book.buys) + len(offer_book.sells),
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--journal-dir', type=str, required=True)
+    parser.add_argument('--generate', type=int, default=0,
+                        help='Record a synthetic journal of this many state changes, instead of replaying')
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_journal(args.journal_dir, args.generate)
+        print('Recorded {} state changes in {}'.format(args.generate, args.journal_dir))
+    else:
+        print(benchmark_replay(args.journal_dir))
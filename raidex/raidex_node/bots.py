@@ -139,21 +139,14 @@ class LiquidityProvider(Greenlet):
     def integrate_offers_until(self, market_price, check_point):
         """Sum the amount of offers with prices between `market_price` and `check_point`."""
         if check_point >= market_price:
-            # integrate sell offers (from low to high prices)
+            # integrate sell offers
             offers = self.raidex_node.offer_book.sells
         else:
-            # integrate buy offers (from high to low prices)
-            offers = reversed(list(self.raidex_node.offer_book.buys))
-        low = min(market_price, check_point)
-        high = max(market_price, check_point)
-        s = 0
-        for _, offer_id in offers:
-            offer = self.raidex_node.offer_book.get_offer_by_id(offer_id)
-            if low <= offer.price <= high:
-                s += offer.amount
-            else:
-                break
-        return s
+            # integrate buy offers
+            offers = self.raidex_node.offer_book.buys
+        low = self.raidex_node.offer_book.to_fixed_point(min(market_price, check_point))
+        high = self.raidex_node.offer_book.to_fixed_point(max(market_price, check_point))
+        return sum(offer.base_amount for offer in offers.get_offers_in_price_range(low, high))
 
     def cancel_unattractive_orders(self, market_price):
         """Cancel orders that have prices with unrealistic prices."""
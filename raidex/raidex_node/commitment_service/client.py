@@ -39,8 +39,16 @@ class CommitmentServiceClient(Processor):
         self.message_broker = message_broker
         self.commitment_amount = 1
         self.market = market
+        self._proof_task = None
 
-        CommitmentProofTask(CommitmentProofListener(self.message_broker, topic=self.node_address)).start()
+    def start(self):
+        self._proof_task = CommitmentProofTask(CommitmentProofListener(self.message_broker, topic=self.node_address))
+        self._proof_task.start()
+
+    def stop(self):
+        if self._proof_task is not None:
+            self._proof_task.kill()
+            self._proof_task = None
 
     def commit(self, offer: Offer):
 
@@ -3,19 +3,28 @@ from gevent import spawn
 from raidex.raidex_node.commitment_service.client import CommitmentServiceClient
 from raidex.raidex_node.commitment_service.events import *
 from raidex.message_broker.listeners import TakerListener, listener_context
-from raidex.raidex_node.architecture.event_architecture import dispatch_state_changes
+from raidex.raidex_node.architecture.event_architecture import dispatch_state_changes, EventRouter
 from raidex.raidex_node.architecture.state_change import TakerCallStateChange
 
 
 def handle_event(commitment_service: CommitmentServiceClient, event):
-    if isinstance(event, CommitEvent):
-        commitment_service.commit(event.offer)
-    if isinstance(event, CommitmentProvedEvent):
-        spawn(wait_for_taker, event, commitment_service.message_broker)
-    if isinstance(event, ReceivedInboundEvent):
-        commitment_service.received_inbound_from_swap(event.offer.offer_id)
-    if isinstance(event, CancellationRequestEvent):
-        commitment_service.request_cancellation(event.offer)
+    event_router.handle(event, commitment_service)
+
+
+def handle_commit(commitment_service: CommitmentServiceClient, event: CommitEvent):
+    commitment_service.commit(event.offer)
+
+
+def handle_commitment_proved(commitment_service: CommitmentServiceClient, event: CommitmentProvedEvent):
+    spawn(wait_for_taker, event, commitment_service.message_broker)
+
+
+def handle_received_inbound(commitment_service: CommitmentServiceClient, event: ReceivedInboundEvent):
+    commitment_service.received_inbound_from_swap(event.offer.offer_id)
+
+
+def handle_cancellation_request(commitment_service: CommitmentServiceClient, event: CancellationRequestEvent):
+    commitment_service.request_cancellation(event.offer)
 
 
 def wait_for_taker(event, message_broker):
@@ -26,4 +35,12 @@ def wait_for_taker(event, message_broker):
         proven_commitment_state_change = TakerCallStateChange(proven_commitment.offer.offer_id,
                                                               proven_commitment.sender,
                                                               proven_commitment.commitment_proof)
-        dispatch_state_changes(proven_commitment_state_change)
\ No newline at end of file
+        dispatch_state_changes(proven_commitment_state_change)
+
+
+event_router = EventRouter([
+    (CommitEvent, handle_commit),
+    (CommitmentProvedEvent, handle_commitment_proved),
+    (ReceivedInboundEvent, handle_received_inbound),
+    (CancellationRequestEvent, handle_cancellation_request),
+])
@@ -1,8 +1,11 @@
+from contextlib import contextmanager
+
 import structlog
 
 from raidex.raidex_node.architecture.state_change import *
 from raidex.raidex_node.order.limit_order import LimitOrder
-from raidex.raidex_node.architecture.event_architecture import dispatch_events
+from raidex.raidex_node.architecture.event_architecture import dispatch_events, EventRouter, replaying
+from raidex.raidex_node.architecture.journal import deterministic
 from raidex.raidex_node.transport.events import SendProvenOfferEvent
 from raidex.raidex_node.matching.match import MatchFactory
 from raidex.raidex_node.architecture.data_manager import DataManager
@@ -13,35 +16,87 @@ logger = structlog.get_logger('StateChangeHandler')
 
 
 def handle_state_change(raidex_node, state_change):
+    handle_state_changes(raidex_node, [state_change])
+
+
+def handle_state_changes(raidex_node, state_changes):
+    """Batch-aware handler, records the state changes in the node's journal if it has one and applies them"""
+
+    journal = raidex_node.journal
+
+    if journal is None:
+        # nothing is replayed, so the state changes are handled without a recorded time and seed
+        apply_state_changes(raidex_node.data_manager, state_changes)
+        return
+
+    entries = journal.record(state_changes)
+    apply_state_changes(raidex_node.data_manager, state_changes, entries)
+
+    if journal.snapshot_due:
+        journal.snapshot(raidex_node.data_manager)
+
+
+def replay(data_manager: DataManager, entries):
+    """Applies recorded `JournalEntry`s again, without dispatching any events.
+
+    The entries are recorded before they are applied, an entry that failed when it was recorded fails again and
+    is logged and skipped. The timeouts set while replaying are scheduled when the replay is done.
+    """
+    with replaying():
+        apply_state_changes(data_manager, [entry.state_change for entry in entries], entries, skip_failed=True)
+
+
+def apply_state_changes(data_manager: DataManager, state_changes, entries=None, skip_failed=False):
+    """Applies runs of consecutive `OfferPublishedStateChange`s to the offer book in one pass.
+
+    If the state changes are journaled, `entries` are their `JournalEntry`s and every state change is handled
+    at its recorded time and with its recorded seed.
+    """
+
+    start = None  # index of the first state change of the current run of published offers
+
+    for index, state_change in enumerate(state_changes):
+        if state_change.__class__ is OfferPublishedStateChange:
+            if start is None:
+                start = index
+            continue
+        if start is not None:
+            _apply_published(data_manager, state_changes, entries, start, index, skip_failed)
+            start = None
+        with entry_context(entries, index), skipping_failure(skip_failed, state_change):
+            state_change_router.handle(state_change, data_manager)
+
+    if start is not None:
+        _apply_published(data_manager, state_changes, entries, start, len(state_changes), skip_failed)
+
+
+def _apply_published(data_manager, state_changes, entries, start, end, skip_failed):
+    published = state_changes[start:end]
+    with skipping_failure(skip_failed, published):
+        handle_offers_published(data_manager, published, None if entries is None else entries[start:end])
 
-    data_manager = raidex_node.data_manager
 
-    if isinstance(state_change, OfferStateChange):
-        handle_offer_state_change(data_manager, state_change)
-    if isinstance(state_change, OfferTimeoutStateChange):
-        handle_offer_timeout(data_manager, state_change)
-    if isinstance(state_change, NewLimitOrderStateChange):
-        handle_new_limit_order(data_manager, state_change)
-    if isinstance(state_change, CancelLimitOrderStateChange):
-        handle_cancel_limit_order(data_manager, state_change)
-    if isinstance(state_change, OfferPublishedStateChange):
-        handle_offer_published(data_manager, state_change)
-    if isinstance(state_change, TakerCallStateChange):
-        handle_taker_call(data_manager, state_change)
-    if isinstance(state_change, TransferReceivedStateChange):
-        handle_transfer_received(data_manager, state_change)
+@contextmanager
+def skipping_failure(enabled, state_change):
+    """Logs and swallows the exception of the state change's handler, if enabled"""
+    if not enabled:
+        yield
+        return
+    try:
+        yield
+    except Exception:
+        logger.exception('Skipping state change that failed to apply', state_change=state_change)
 
 
 def handle_offer_state_change(data_manager: DataManager, state_change: OfferStateChange):
     offer = data_manager.offer_manager.get_offer(state_change.offer_id)
 
-    if isinstance(state_change, CommitmentProofStateChange):
-        handle_commitment_proof(data_manager, offer, state_change)
-    if isinstance(state_change, PaymentFailedStateChange):
-        offer.payment_failed()
-        logger.info(f'Offer Payment Failed: {offer.offer_id}')
-    if isinstance(state_change, CancellationProofStateChange):
-        handle_cancellation_proof(offer, state_change)
+    offer_state_change_router.handle(state_change, data_manager, offer)
+
+
+def handle_payment_failed(data_manager: DataManager, offer, state_change: PaymentFailedStateChange):
+    offer.payment_failed()
+    logger.info(f'Offer Payment Failed: {offer.offer_id}')
 
 
 def handle_offer_timeout(data_manager: DataManager, state_change: OfferTimeoutStateChange):
@@ -77,6 +132,44 @@ def handle_offer_published(data_manager: DataManager, event: OfferPublishedState
         data_manager.timeout_handler.create_new_timeout(offer_book_entry.offer, OFFER_THRESHOLD_TIME)
 
 
+def handle_offers_published(data_manager: DataManager, events, entries=None):
+    """Handles a run of `OfferPublishedStateChange`s, with their `JournalEntry`s if they are journaled.
+
+    The offers are handled in the context of their entries, only the insertion into the offer book is done in one
+    pass, it depends neither on the time nor on the seed.
+    """
+    new_entries = list()
+
+    for index, event in enumerate(events):
+        offer_id = event.offer_entry.offer.offer_id
+        if data_manager.offer_manager.has_offer(offer_id):
+            with entry_context(entries, index):
+                data_manager.offer_manager.get_offer(offer_id).received_offer()
+        else:
+            new_entries.append((index, event.offer_entry))
+
+    data_manager.matching_engine.offer_book.insert_offers([offer_book_entry for _, offer_book_entry in new_entries])
+    for index, offer_book_entry in new_entries:
+        with entry_context(entries, index):
+            data_manager.timeout_handler.create_new_timeout(offer_book_entry.offer, OFFER_THRESHOLD_TIME)
+
+
+def entry_context(entries, index):
+    return deterministic(entries[index]) if entries is not None else _NO_CONTEXT
+
+
+class _NoContext(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_CONTEXT = _NoContext()
+
+
 def handle_commitment_proof(data_manager: DataManager, offer, state_change: CommitmentProofStateChange):
     commitment_proof = state_change.commitment_proof
 
@@ -93,7 +186,7 @@ def handle_commitment_proof(data_manager: DataManager, offer, state_change: Comm
     logger.info(f'Received Commitment Proof: {offer.offer_id}')
 
 
-def handle_cancellation_proof(offer, state_change: CancellationProofStateChange):
+def handle_cancellation_proof(data_manager: DataManager, offer, state_change: CancellationProofStateChange):
     cancellation_proof = state_change.cancellation_proof
 
     offer.receive_cancellation_proof(cancellation_proof)
@@ -118,5 +211,20 @@ def handle_transfer_received(data_manager: DataManager, state_change: TransferRe
 
     if match.offer.state == 'completed':
         data_manager.timeout_handler.clean_up_timeout(offer_id)
-        from raidex.raidex_node.order import fsm_offer
-        fsm_offer.remove_model(match.offer)
+
+
+state_change_router = EventRouter([
+    (OfferStateChange, handle_offer_state_change),
+    (OfferTimeoutStateChange, handle_offer_timeout),
+    (NewLimitOrderStateChange, handle_new_limit_order),
+    (CancelLimitOrderStateChange, handle_cancel_limit_order),
+    (OfferPublishedStateChange, handle_offer_published),
+    (TakerCallStateChange, handle_taker_call),
+    (TransferReceivedStateChange, handle_transfer_received),
+])
+
+offer_state_change_router = EventRouter([
+    (CommitmentProofStateChange, handle_commitment_proof),
+    (PaymentFailedStateChange, handle_payment_failed),
+    (CancellationProofStateChange, handle_cancellation_proof),
+])
@@ -18,9 +18,13 @@ class ListenerTask(gevent.Greenlet):
 
     def _run(self):
         self.listener.start()
-        while True:
-            data = self.listener.get()
-            self.process(data)
+        try:
+            while True:
+                data = self.listener.get()
+                self.process(data)
+        finally:
+            # also when the task is killed
+            self.listener.stop()
 
     def process(self, data):
         raise NotImplementedError
@@ -1,6 +1,7 @@
 from eth_utils import is_binary_address, to_checksum_address
 from raidex.raidex_node.order.offer import OfferType
 from raidex.utils import pex
+from raidex.utils.price import fixed_point_price, to_fixed_point, from_fixed_point
 
 
 class TokenPair(object):
@@ -22,6 +23,20 @@ class TokenPair(object):
         else:
             return None
 
+    @property
+    def price_decimal(self):
+        # prices are stored with the resolution of the quote token
+        return self.quote_decimal
+
+    def fixed_point_price(self, base_amount, quote_amount):
+        return fixed_point_price(base_amount, quote_amount, self.price_decimal)
+
+    def to_fixed_point(self, price):
+        return to_fixed_point(price, self.price_decimal)
+
+    def from_fixed_point(self, price_int):
+        return from_fixed_point(price_int, self.price_decimal)
+
     @property
     def checksum_base_address(self):
         return to_checksum_address(self.base_token)
@@ -2,7 +2,8 @@
 
 def match_limit(offer_book, order):
 
-    matching_offers = offer_book.get_offers_by_price(order.price, order.order_type)
+    price = offer_book.to_fixed_point(order.price)
+    matching_offers = offer_book.get_offers_by_price(price, order.order_type)
     matching_offers.sort(key=lambda x: x.base_amount, reverse=True)
     amount_left = order.amount
     take_offers = list()
@@ -14,3 +15,25 @@ def match_limit(offer_book, order):
             amount_left -= offer.base_amount
 
     return take_offers, amount_left
+
+
+def match_limit_price_time(offer_book, order):
+    """
+    Sweeps the opposite side of the book from the best price up to the limit price of the order.
+    Offers are taken in price-time priority, an offer that is bigger than the amount left is skipped,
+    since offers can only be taken as a whole.
+    """
+
+    price = offer_book.to_fixed_point(order.price)
+    amount_left = order.amount
+    take_offers = list()
+
+    for _, offers in offer_book.iter_crossing_price_levels(price, order.order_type):
+        for offer in offers:
+            if amount_left >= offer.base_amount:
+                take_offers.append(offer)
+                amount_left -= offer.base_amount
+        if amount_left == 0:
+            break
+
+    return take_offers, amount_left
@@ -1,17 +1,23 @@
 from __future__ import print_function
 import random
+from itertools import count, islice
 
 from sortedcontainers import SortedDict
 import structlog
 from raidex.utils import pex
 from raidex.utils.timestamp import to_str_repr
+from raidex.utils.price import DEFAULT_PRICE_DECIMAL, fixed_point_price, to_fixed_point
 from raidex.raidex_node.order.offer import OfferType
+from raidex.raidex_node.offer_grouping import DepthLadder, group_offers, PRICE_GROUP_PRECISION
 
 from eth_utils import int_to_big_endian
 
 
 log = structlog.get_logger('node.offer_book')
 
+# compares greater than every arrival sequence number, used as upper bound for the keys of one price level
+_MAX_KEY_SUFFIX = float('inf')
+
 
 def generate_random_offer_id():
     # generate random offer-id in the 32byte int range
@@ -75,10 +81,13 @@ class OfferDeprecated(object):
 
 class OfferBookEntry:
 
-    def __init__(self, offer, initiator, commitment_proof):
+    def __init__(self, offer, initiator, commitment_proof, price_decimal=DEFAULT_PRICE_DECIMAL):
         self.offer = offer
         self.initiator = initiator
         self.commitment_proof = commitment_proof
+        # fixed-point price with `price_decimal` fractional digits, the key of the entry in the OfferView
+        self.price_decimal = price_decimal
+        self.price_int = fixed_point_price(offer.base_amount, offer.quote_amount, price_decimal)
 
     @property
     def offer_id(self):
@@ -106,50 +115,144 @@ class OfferView(object):
     Holds a collection of Offers in an RBTree for faster search.
     One OfferView instance holds either BUYs or SELLs
 
+    The entries are keyed by (price_int, sequence), where price_int is the fixed-point price of the entry
+    and sequence is the arrival number of the offer, so that iterating one price level yields its offers
+    in time priority. All prices taken and returned by the queries are fixed-point prices.
+
+    For every configured price-group precision, a DepthLadder with the grouped offers is kept up to date.
+
     """
 
-    def __init__(self):
+    def __init__(self, price_group_precisions=()):
         self.offer_entries = SortedDict()
         self.offer_entries_by_id = dict()
+        self.depth_ladders = {precision: DepthLadder(precision) for precision in price_group_precisions}
+        self._keys_by_id = dict()
+        self._sequence = count()
 
     def add_offer(self, entry):
         assert isinstance(entry, OfferBookEntry)
 
         offer_id = entry.offer_id
-        offer_price = entry.price
+
+        # an offer that is added again loses its time priority
+        self.remove_offer(offer_id)
+        key = (entry.price_int, next(self._sequence))
 
         # inserts in the SortedDict
-        self.offer_entries[(offer_price, offer_id)] = entry
+        self.offer_entries[key] = entry
+        self._keys_by_id[offer_id] = key
 
         # inserts in the dict for retrieval by offer_id
         self.offer_entries_by_id[offer_id] = entry
 
+        for depth_ladder in self.depth_ladders.values():
+            depth_ladder.add(entry)
+
         return offer_id
 
+    def add_offers(self, entries):
+        """Adds many entries at once, with the same result as adding them one after another"""
+        latest = dict()
+        for entry in entries:
+            assert isinstance(entry, OfferBookEntry)
+            # a repeated offer is added in the position of its last occurrence
+            latest.pop(entry.offer_id, None)
+            latest[entry.offer_id] = entry
+
+        for offer_id in latest:
+            self.remove_offer(offer_id)
+
+        items = list()
+        for offer_id, entry in latest.items():
+            key = (entry.price_int, next(self._sequence))
+            items.append((key, entry))
+            self._keys_by_id[offer_id] = key
+
+        # one bulk update of the SortedDict instead of an insert per entry
+        self.offer_entries.update(items)
+        self.offer_entries_by_id.update(latest)
+
+        for depth_ladder in self.depth_ladders.values():
+            for entry in latest.values():
+                depth_ladder.add(entry)
+
+        return list(latest)
+
     def remove_offer(self, offer_id):
         if offer_id in self.offer_entries_by_id:
-            entry = self.offer_entries_by_id[offer_id]
 
             # remove from the SortedDict
-            del self.offer_entries[(entry.price, entry.offer_id)]
+            del self.offer_entries[self._keys_by_id.pop(offer_id)]
 
             # remove from the dict
-            del self.offer_entries_by_id[offer_id]
+            entry = self.offer_entries_by_id.pop(offer_id)
+
+            for depth_ladder in self.depth_ladders.values():
+                depth_ladder.remove(entry)
 
     def get_offer_by_id(self, offer_id):
         return self.offer_entries_by_id.get(offer_id)
 
+    def grouped(self, price_group_precision):
+        # grouped offers with lowest price first, served from the depth ladder if one is configured
+        depth_ladder = self.depth_ladders.get(price_group_precision)
+        if depth_ladder is None:
+            return group_offers(self.values(), price_group_precision)
+        return depth_ladder.levels()
+
     def get_offers_by_price(self, price):
+        # all offers of exactly one price level, in time priority
+        return self.get_offers_in_price_range(price, price)
+
+    def get_offers_in_price_range(self, low, high, reverse=False):
+        """
+        Returns all offers with `low <= price_int <= high`, sorted by (price_int, sequence).
+        Only the keys inside the range are visited, the lookup of the range boundaries is O(log n).
+        """
+        keys = self.offer_entries.irange(minimum=(low,), maximum=(high, _MAX_KEY_SUFFIX), reverse=reverse)
+        return [self.offer_entries[key] for key in keys]
+
+    def iter_price_levels(self, reverse=False, limit=None):
+        """
+        Lazily yields (price, [offers]) tuples, one per distinct price level, starting with the lowest
+        price (or the highest price if `reverse` is set). The offers of a level are in time priority.
+        Iteration stops at the first level beyond `limit`. Every level costs O(log n) to locate.
+        """
+        price = self.max_price if reverse else self.min_price
+
+        while price is not None:
+            if limit is not None and (price < limit if reverse else price > limit):
+                return
+            yield price, self.get_offers_by_price(price)
+            price = self._next_price(price, reverse)
+
+    def _next_price(self, price, reverse=False):
+        if reverse:
+            keys = self.offer_entries.irange(maximum=(price,), inclusive=(True, False), reverse=True)
+        else:
+            keys = self.offer_entries.irange(minimum=(price, _MAX_KEY_SUFFIX), inclusive=(False, True))
+        key = next(keys, None)
+        return key[0] if key is not None else None
 
-        matched_offers = list()
+    def get_price_levels(self, nof_levels, reverse=False):
+        """
+        Returns the first `nof_levels` distinct price levels as a list of (price, [offers]) tuples,
+        starting with the lowest price (or the highest price if `reverse` is set).
+        """
+        return list(islice(self.iter_price_levels(reverse), nof_levels))
 
-        for offer in self.offer_entries.values():
-            if offer.price == price:
-                matched_offers.append(offer)
-            if offer.price > price:
-                break
+    @property
+    def min_price(self):
+        if not self.offer_entries:
+            return None
+        return self.offer_entries.peekitem(0)[0][0]
 
-        return matched_offers
+    @property
+    def max_price(self):
+        if not self.offer_entries:
+            return None
+        return self.offer_entries.peekitem(-1)[0][0]
 
     def __len__(self):
         return len(self.offer_entries)
@@ -158,16 +261,20 @@ class OfferView(object):
         return iter(self.offer_entries)
 
     def values(self):
-        # returns list of all offers, sorted by (price, offer_id)
+        # returns list of all offers, sorted by (price_int, sequence)
         return self.offer_entries.values()
 
 
 class OfferBook(object):
 
-    def __init__(self):
-        self.buys = OfferView()
-        self.sells = OfferView()
+    def __init__(self, price_decimal=DEFAULT_PRICE_DECIMAL, price_group_precisions=(PRICE_GROUP_PRECISION,)):
+        self.buys = OfferView(price_group_precisions)
+        self.sells = OfferView(price_group_precisions)
         self.tasks = dict()
+        self.price_decimal = price_decimal
+
+    def to_fixed_point(self, price):
+        return to_fixed_point(price, self.price_decimal)
 
     def insert_offer(self, offer_entry):
         offer = offer_entry.offer
@@ -181,6 +288,22 @@ class OfferBook(object):
 
         return offer_entry.offer_id
 
+    def insert_offers(self, offer_entries):
+        """Inserts many entries at once, see `OfferView.add_offers`"""
+        buys = list()
+        sells = list()
+        for offer_entry in offer_entries:
+            offer = offer_entry.offer
+            assert isinstance(offer.type, OfferType)
+            if offer.type is OfferType.BUY:
+                buys.append(offer_entry)
+            elif offer.type is OfferType.SELL:
+                sells.append(offer_entry)
+            else:
+                raise Exception('unsupported offer-type')
+
+        return self.buys.add_offers(buys) + self.sells.add_offers(sells)
+
     def get_offer_by_id(self, offer_id):
         offer = self.buys.get_offer_by_id(offer_id)
         if offer is None:
@@ -200,9 +323,26 @@ class OfferBook(object):
 
         offer_view.remove_offer(offer_id)
 
+    def _opposite_view(self, offer_type):
+        return self.buys if offer_type == OfferType.SELL else self.sells
+
     def get_offers_by_price(self, price, offer_type):
-        offer_list = self.buys if offer_type == OfferType.SELL else self.sells
-        return offer_list.get_offers_by_price(price)
+        return self._opposite_view(offer_type).get_offers_by_price(price)
+
+    def get_offers_in_price_range(self, low, high, offer_type):
+        return self._opposite_view(offer_type).get_offers_in_price_range(low, high)
+
+    def iter_crossing_price_levels(self, price, offer_type):
+        # the levels of the opposite side an order at `price` crosses, best price first
+        if offer_type == OfferType.BUY:
+            return self.sells.iter_price_levels(limit=price)
+        return self.buys.iter_price_levels(reverse=True, limit=price)
+
+    def get_best_price_levels(self, nof_levels, offer_type):
+        # the best levels for a BUY are the cheapest sells, for a SELL the most expensive buys
+        if offer_type == OfferType.BUY:
+            return self.sells.get_price_levels(nof_levels)
+        return self.buys.get_price_levels(nof_levels, reverse=True)
 
     def __repr__(self):
         return "OfferBook<buys={} sells={}>".format(len(self.buys), len(self.sells))
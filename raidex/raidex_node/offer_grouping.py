@@ -3,6 +3,8 @@ from functools import total_ordering
 import decimal
 from decimal import Decimal, getcontext
 
+from sortedcontainers import SortedDict, SortedList
+
 from raidex.utils import timestamp
 
 PRICE_GROUP_PRECISION = 1  # default price-group precision are 1s digits after 0
@@ -20,7 +22,8 @@ class GroupedOffer(object):
     def __init__(self, price_decimal):
         self._price = price_decimal
         self.amount = 0
-        self._timeouts = list()
+        self._timeouts = SortedList()
+        self._timeout_sum = 0
 
     @property
     def price_string(self):
@@ -35,21 +38,31 @@ class GroupedOffer(object):
     def price(self):
         return float(self._price)
 
+    @property
+    def nof_offers(self):
+        return len(self._timeouts)
+
     @property
     def avg_timeout(self):
-        return sum(self._timeouts) / len(self._timeouts)
+        return self._timeout_sum / len(self._timeouts)
 
     @property
     def max_timeout(self):
-        return max(self._timeouts)
+        return self._timeouts[-1]
 
     @property
     def min_timeout(self):
-        return min(self._timeouts)
+        return self._timeouts[0]
 
     def add(self, amount, timeout):
         self.amount += amount
-        self._timeouts.append(timeout)
+        self._timeouts.add(timeout)
+        self._timeout_sum += timeout
+
+    def remove(self, amount, timeout):
+        self.amount -= amount
+        self._timeouts.remove(timeout)
+        self._timeout_sum -= timeout
 
     def __eq__(self, other):
         return self.price_decimal == other.price_decimal
@@ -58,22 +71,66 @@ class GroupedOffer(object):
         return self.price_decimal < other.price_decimal
 
 
+def quantize_amounts(base_amount, quote_amount, price_group_precision):
+    # floors quote_amount / base_amount to `price_group_precision` fractional digits, like the ROUND_FLOOR context
+    # above, the result is an integer with `price_group_precision` implicit fractional digits.
+    # The exact ratio is floored, not the already rounded fixed-point price, so a price just below a
+    # bucket boundary stays in the lower bucket
+    return quote_amount * 10 ** price_group_precision // base_amount
+
+
+class DepthLadder(object):
+    """
+    Aggregated market depth of one side of the offer book, grouped with a fixed price-group precision.
+
+    The ladder is updated on every insert and removal of an offer, which costs O(log L) in the number of
+    price levels, so readers get the grouped offers without regrouping the book. The sorted list of levels
+    is kept as a snapshot until the next change.
+    """
+
+    def __init__(self, price_group_precision=None):
+        if price_group_precision is None:
+            price_group_precision = PRICE_GROUP_PRECISION
+        self.price_group_precision = price_group_precision
+        self._levels = SortedDict()
+        self._snapshot = None
+
+    def _quantize(self, offer):
+        # groups on the integer amounts, no float or Decimal arithmetic per offer
+        return quantize_amounts(offer.base_amount, offer.quote_amount, self.price_group_precision)
+
+    def add(self, offer):
+        quantized = self._quantize(offer)
+        grouped_offer = self._levels.get(quantized)
+        if grouped_offer is None:
+            grouped_offer = GroupedOffer(Decimal(quantized).scaleb(-self.price_group_precision))
+            self._levels[quantized] = grouped_offer
+        grouped_offer.add(offer.base_amount, offer.timeout_date)
+        self._snapshot = None
+
+    def remove(self, offer):
+        quantized = self._quantize(offer)
+        grouped_offer = self._levels[quantized]
+        grouped_offer.remove(offer.base_amount, offer.timeout_date)
+        if grouped_offer.nof_offers == 0:
+            del self._levels[quantized]
+        self._snapshot = None
+
+    def levels(self):
+        # the grouped offers, sorted with lowest price first
+        if self._snapshot is None:
+            self._snapshot = list(self._levels.values())
+        return self._snapshot
+
+    def __len__(self):
+        return len(self._levels)
+
+
 def group_offers(offers, price_group_precision=None):
-    if price_group_precision is None:
-        price_group_precision = PRICE_GROUP_PRECISION
-    quantized_offers_by_price = dict()
+    depth_ladder = DepthLadder(price_group_precision)
     for offer in offers:
-        # converts the float to a decimal obj
-        quantized = Decimal(offer.price).quantize(Decimal(10) ** -price_group_precision)
-        grouped_offer = quantized_offers_by_price.get(quantized)
-        if grouped_offer is None:
-            grouped_offer = GroupedOffer(quantized)
-            grouped_offer.add(offer.base_amount, offer.timeout_date)
-            quantized_offers_by_price[quantized] = grouped_offer
-        else:
-            grouped_offer.add(offer.base_amount, offer.timeout_date)
-    unsorted_list = quantized_offers_by_price.values()
-    return sorted(unsorted_list)
+        depth_ladder.add(offer)
+    return depth_ladder.levels()
 
 @total_ordering
 class GroupedTrade(object):
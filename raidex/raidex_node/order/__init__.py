@@ -1,102 +1,136 @@
-__all__ = ['offer', 'fsm_offer', 'limit_order']
+__all__ = ['offer', 'limit_order', 'OFFER_TRANSITIONS', 'OfferStateError']
 
-from transitions.extensions.nesting import NestedState
-from transitions.extensions import HierarchicalMachine as Machine
+from collections import namedtuple
 
-from raidex.raidex_node.order.offer import Offer
+from raidex.raidex_node.order.offer import Offer, OFFER_INITIAL_STATE, OFFER_INITIAL_STATUS
 from raidex.raidex_node.order import events as dispatch
 
-ENTER_UNPROVED = dispatch.on_enter_unproved
-ENTER_PUBLISHED = dispatch.on_enter_published
-ENTER_PROVED = Offer.set_proof.__name__
-ENTER_CANCELLATION = dispatch.on_enter_cancellation
-ENTER_WAIT_FOR_REFUND = dispatch.initiate_refund
-AFTER_STATE_CHANGE = Offer.log_state.__name__
 
-
-class OfferMachine(Machine):
-
-    def set_state(self, state, model=None):
-        super(OfferMachine, self).set_state(state, model)
-        if isinstance(state, str):
-            state = self.get_state(state)
-        model.status = state.parent.name if state.parent else state.name
-
-
-class OfferState(NestedState):
-
-    def __repr__(self):
-        return self.name
-
-    @property
-    def initial(self):
-        if len(self.children) > 0:
-            return self.children[0]
-        return None
-
-    def name(self):
-        return self._name
-
-
-OPEN = OfferState('open')
-OPEN_CREATED = OfferState('created', parent=OPEN)
-OPEN_UNPROVED = OfferState('unproved', on_enter=[ENTER_UNPROVED], parent=OPEN)
-OPEN_PROVED = OfferState('proved', on_enter=[ENTER_PROVED], parent=OPEN)
-OPEN_PUBLISHED = OfferState('published', on_enter=[ENTER_PUBLISHED], parent=OPEN)
-OPEN_CANCELLATION_REQUESTED = OfferState('cancellation_requested', on_enter=[ENTER_CANCELLATION], parent=OPEN)
-
-PENDING = OfferState('pending')
-PENDING_EXCHANGING = OfferState('exchanging', parent=PENDING)
-PENDING_WAIT_FOR_REFUND = OfferState('wait_for_refund', on_enter=[ENTER_WAIT_FOR_REFUND], parent=PENDING)
-
-COMPLETED = OfferState('completed')
-CANCELED = OfferState('canceled')
+class OfferStateError(Exception):
+    """Raised when an offer is triggered with an event that isn't defined for its current state"""
 
 
+# the nested states, a parent state is entered in its first child
 OFFER_STATES = [
-    OPEN,
-    PENDING,
-    CANCELED,
-    COMPLETED,
+    ('open', ['created', 'unproved', 'proved', 'published', 'cancellation_requested']),
+    ('pending', ['exchanging', 'wait_for_refund']),
+    ('completed', []),
+    ('canceled', []),
 ]
 
+# called with (offer, trigger kwargs) when the state is entered, also when the transition returns into the same state
+ON_ENTER = {
+    'unproved': [dispatch.on_enter_unproved],
+    'proved': [Offer.set_proof],
+    'published': [dispatch.on_enter_published],
+    'cancellation_requested': [dispatch.on_enter_cancellation],
+    'wait_for_refund': [dispatch.initiate_refund],
+}
+
 TRANSITIONS = [
 
     {'trigger': 'initiating',
-     'source': OPEN_CREATED,
-     'dest': OPEN_UNPROVED},
+     'source': 'created',
+     'dest': 'unproved'},
     {'trigger': 'payment_failed',
-     'source': OPEN_UNPROVED,
-     'dest': OPEN_UNPROVED},
+     'source': 'unproved',
+     'dest': 'unproved'},
     {'trigger': 'timeout',
-     'source': OPEN,
-     'dest': OPEN_CANCELLATION_REQUESTED},
+     'source': 'open',
+     'dest': 'cancellation_requested'},
     {'trigger': 'receive_cancellation_proof',
-     'source': OPEN,
-     'dest': CANCELED},
+     'source': 'open',
+     'dest': 'canceled'},
     {'trigger': 'receive_commitment_proof',
-     'source': OPEN_UNPROVED,
-     'dest': OPEN_PROVED},
+     'source': 'unproved',
+     'dest': 'proved'},
     {'trigger': 'received_offer',
-     'source': OPEN_PROVED,
-     'dest': OPEN_PUBLISHED},
+     'source': 'proved',
+     'dest': 'published'},
     {'trigger': 'found_match',
-     'source': OPEN_PUBLISHED,
-     'dest': PENDING_EXCHANGING},
+     'source': 'published',
+     'dest': 'exchanging'},
     {'trigger': 'found_match',
-     'source': OPEN_PROVED,
-     'dest': PENDING_EXCHANGING},
+     'source': 'proved',
+     'dest': 'exchanging'},
     {'trigger': 'received_inbound',
-     'source': PENDING_EXCHANGING,
-     'dest': PENDING_WAIT_FOR_REFUND},
+     'source': 'exchanging',
+     'dest': 'wait_for_refund'},
     {'trigger': 'received_inbound',
-     'source': PENDING_WAIT_FOR_REFUND,
-     'dest': COMPLETED},
+     'source': 'wait_for_refund',
+     'dest': 'completed'},
 ]
 
-fsm_offer = OfferMachine(states=OFFER_STATES,
-                         transitions=TRANSITIONS,
-                         initial=OPEN,
-                         after_state_change=AFTER_STATE_CHANGE,
-                         send_event=True)
+# the destination of a transition in the table, with the status of the destination and its enter callbacks
+OfferTransition = namedtuple('OfferTransition', 'state status on_enter')
+
+
+def compile_transitions(states, transitions, on_enter):
+    """Flattens the nested states into a table (leaf state, trigger) -> `OfferTransition`.
+
+    A transition from a parent state applies to all of its children, a transition into a parent state enters its
+    first child.
+    """
+    children = {parent: leaves or [parent] for parent, leaves in states}
+    status = {leaf: parent for parent, leaves in children.items() for leaf in leaves}
+
+    def leaves_of(state):
+        return children.get(state, [state])
+
+    table = dict()
+    for transition in transitions:
+        dest = leaves_of(transition['dest'])[0]
+        target = OfferTransition(dest, status[dest], tuple(on_enter.get(dest, ())))
+        for source in leaves_of(transition['source']):
+            assert (source, transition['trigger']) not in table
+            table[(source, transition['trigger'])] = target
+    return table, status
+
+
+OFFER_TRANSITIONS, OFFER_STATUS = compile_transitions(OFFER_STATES, TRANSITIONS, ON_ENTER)
+assert OFFER_STATUS[OFFER_INITIAL_STATE] == OFFER_INITIAL_STATUS
+
+
+def fire(offer, trigger, kwargs):
+    try:
+        transition = OFFER_TRANSITIONS[(offer.state, trigger)]
+    except KeyError:
+        raise OfferStateError("Can't trigger event {} from state {} of offer {}".format(
+            trigger, offer.state, offer.offer_id))
+    offer.state = transition.state
+    offer.status = transition.status
+    for callback in transition.on_enter:
+        callback(offer, kwargs)
+    offer.log_state()
+    return True
+
+
+def set_state(offer, state, kwargs):
+    offer.state = state
+    offer.status = OFFER_STATUS[state]
+    for callback in ON_ENTER.get(state, ()):
+        callback(offer, kwargs)
+    offer.log_state()
+    return True
+
+
+def _trigger_method(trigger):
+    def method(self, *args, **kwargs):
+        return fire(self, trigger, kwargs)
+    method.__name__ = trigger
+    return method
+
+
+def _to_state_method(state):
+    def method(self, *args, **kwargs):
+        return set_state(self, state, kwargs)
+    method.__name__ = 'to_' + state
+    return method
+
 
+# the triggers are methods of the class, creating an offer doesn't register it anywhere
+for _trigger in {transition['trigger'] for transition in TRANSITIONS}:
+    setattr(Offer, _trigger, _trigger_method(_trigger))
+for _state in OFFER_STATUS:
+    setattr(Offer, 'to_' + _state, _to_state_method(_state))
+del _trigger, _state
@@ -36,18 +36,17 @@ class CommitmentProofStateChange(OfferStateChange):
         self.commitment_proof = commitment_proof
 
 
-def on_enter_unproved(event_data):
-    dispatch_events([CommitEvent(offer=event_data.model)])
+def on_enter_unproved(offer, kwargs):
+    dispatch_events([CommitEvent(offer=offer)])
 
 
-def on_enter_published(event_data):
-    dispatch_events([CommitmentProvedEvent(offer=event_data.model)])
+def on_enter_published(offer, kwargs):
+    dispatch_events([CommitmentProvedEvent(offer=offer)])
 
 
-def initiate_refund(event_data):
-    dispatch_events([ReceivedInboundEvent(offer=event_data.model,
-                                          raiden_event=event_data.kwargs['raiden_event'])])
+def initiate_refund(offer, kwargs):
+    dispatch_events([ReceivedInboundEvent(offer=offer, raiden_event=kwargs['raiden_event'])])
 
 
-def on_enter_cancellation(event_data):
-    dispatch_events([CancellationRequestEvent(offer=event_data.model)])
+def on_enter_cancellation(offer, kwargs):
+    dispatch_events([CancellationRequestEvent(offer=offer)])
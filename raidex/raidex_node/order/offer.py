@@ -27,6 +27,14 @@ class OfferType(Enum):
 
 class BasicOffer:
 
+    __slots__ = [
+        'offer_id',
+        'type',
+        'base_amount',
+        'quote_amount',
+        'timeout_date',
+    ]
+
     def __init__(self, offer_id, offer_type, base_amount, quote_amount, timeout_date):
         self.offer_id = offer_id
         self.type = offer_type
@@ -62,12 +70,28 @@ class BasicOffer:
         return True
 
 
+OFFER_INITIAL_STATE = 'created'
+OFFER_INITIAL_STATUS = 'open'
+
+
 class Offer(BasicOffer):
+    """An offer of the node. Its lifecycle is driven by the trigger methods, that the transition table in
+    `raidex.raidex_node.order` adds to the class, e.g. `offer.initiating()`.
+    """
+
+    __slots__ = [
+        'trader_role',
+        'proof',
+        'state',
+        'status',
+    ]
 
     def __init__(self, offer_id, offer_type, base_amount, quote_amount, timeout_date, trader_role):
         super(Offer, self).__init__(offer_id, offer_type, base_amount, quote_amount, timeout_date)
         self.trader_role = trader_role
         self.proof = None
+        self.state = OFFER_INITIAL_STATE
+        self.status = OFFER_INITIAL_STATUS
 
     @property
     def buy_amount(self):
@@ -100,16 +124,14 @@ class Offer(BasicOffer):
             return True
         return False
 
-    def set_proof(self, event_data):
+    def set_proof(self, kwargs):
 
-        if 'proof' in event_data.kwargs:
-            self.proof = event_data.kwargs['proof']
+        if 'proof' in kwargs:
+            self.proof = kwargs['proof']
 
-    def log_state(self, *args):
-        if hasattr(self, 'state'):
-            print(f'Offer {self.offer_id} - State Changed to: {self.state}')
-        if hasattr(self, 'status'):
-            print(f'Status: {self.status}')
+    def log_state(self):
+        print(f'Offer {self.offer_id} - State Changed to: {self.state}')
+        print(f'Status: {self.status}')
 
 
 class OfferFactory:
@@ -124,8 +146,6 @@ class OfferFactory:
                             quote_amount,
                             timeout_date,
                             trader_role)
-        from raidex.raidex_node.order import fsm_offer
-        fsm_offer.add_model(offer_model)
         return offer_model
 
     @staticmethod
@@ -137,11 +157,4 @@ class OfferFactory:
                             offer.quote_amount,
                             offer.timeout_date,
                             trader_role)
-        from raidex.raidex_node.order import fsm_offer
-        fsm_offer.add_model(offer_model)
         return offer_model
-
-
-
-
-
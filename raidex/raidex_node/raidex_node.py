@@ -1,14 +1,22 @@
 from __future__ import print_function
+import gevent
 from gevent import monkey
 import structlog
 
-from raidex.raidex_node.architecture.event_architecture import Processor
+from raidex.raidex_node.architecture.event_architecture import Processor, default_context
 from raidex.raidex_node.architecture.state_change import StateChange
 from raidex.raidex_node.offer_book import OfferBook
 from raidex.raidex_node.listener_tasks import OfferBookTask
 from raidex.raidex_node.trades import TradesView
-from raidex.raidex_node.offer_grouping import group_offers, group_trades_from, make_price_bins, get_n_recent_trades
+from raidex.raidex_node.offer_grouping import (
+    group_trades_from,
+    make_price_bins,
+    get_n_recent_trades,
+    PRICE_GROUP_PRECISION,
+)
 from raidex.raidex_node.architecture.data_manager import DataManager
+from raidex.raidex_node.handle_state_change import replay
+from raidex.constants import MATCHING_ALGORITHM
 
 monkey.patch_all()
 log = structlog.get_logger('node')
@@ -16,13 +24,14 @@ log = structlog.get_logger('node')
 
 class RaidexNode(Processor):
 
-    def __init__(self, address, token_pair, message_broker, trader_client):
+    def __init__(self, address, token_pair, message_broker, trader_client, matching_algorithm=MATCHING_ALGORITHM,
+                 journal=None):
         super(RaidexNode, self).__init__(StateChange)
         self.token_pair = token_pair
         self.address = address
         self.message_broker = message_broker
         self.trader_client = trader_client
-        self.offer_book = OfferBook()
+        self.offer_book = OfferBook(token_pair.price_decimal)
         # don't make this accessible in the constructor args for now, set attribute instead if needed
         self.default_offer_lifetime = 30
         self._trades_view = TradesView()
@@ -33,14 +42,36 @@ class RaidexNode(Processor):
         self._max_open_orders = 0
 
         self._get_trades = self._trades_view.trades
-        self.data_manager = DataManager(self.offer_book, token_pair)
+        self.data_manager = DataManager(self.offer_book, token_pair, matching_algorithm)
+        # optional `StateChangeJournal`, that records all handled state changes
+        self.journal = journal
+        # the `DispatchContext` of the node, set by the `App`
+        self.dispatch = default_context
+        self._tasks = list()
+
+    def restore(self):
+        """Rebuilds the state from the journal: the latest snapshot and the state changes recorded after it"""
+        if self.journal is None:
+            return
+        data_manager, entries = self.journal.load()
+        if data_manager is not None:
+            self.data_manager = data_manager
+            self.offer_book = data_manager.matching_engine.offer_book
+        replay(self.data_manager, entries)
+        log.info('Restored state from journal', state_changes=len(entries), snapshot=data_manager is not None)
 
     def start(self):
         log.info('Starting raidex node')
-        OfferBookTask(self.offer_book, self.token_pair, self.message_broker).start()
+        self._tasks.append(OfferBookTask(self.offer_book, self.token_pair, self.message_broker))
+        for task in self._tasks:
+            task.start()
         #OfferTakenTask(self.offer_book, self._trades_view, self.message_broker).start()
         #SwapCompletedTask(self._trades_view, self.message_broker).start()
 
+    def stop(self):
+        gevent.killall(self._tasks)
+        self._tasks = list()
+
     def _process_finished_limit_order(self, order_task):
         value = order_task.get(block=False)
         if value is True:
@@ -86,11 +117,11 @@ class RaidexNode(Processor):
     def sells(self):
         return self.offer_book.sells.values()
 
-    def grouped_buys(self):
-        return group_offers(self.buys())
+    def grouped_buys(self, price_group_precision=PRICE_GROUP_PRECISION):
+        return self.offer_book.buys.grouped(price_group_precision)
 
-    def grouped_sells(self):
-        return group_offers(self.sells())
+    def grouped_sells(self, price_group_precision=PRICE_GROUP_PRECISION):
+        return self.offer_book.sells.grouped(price_group_precision)
 
     def trades(self, from_timestamp=None):
         return self._get_trades(from_timestamp=from_timestamp)
@@ -7,7 +7,6 @@ from gevent import Greenlet
 from gevent.queue import Queue
 from polling import poll
 
-import requests
 from eth_utils import encode_hex
 from raidex.raidex_node.trader.events import TraderEvent
 from raidex.utils.address import encode_address
@@ -20,6 +19,7 @@ from raidex.trader_mock.trader import (
     BalanceUpdateTask
 )
 from raidex.utils.gevent_helpers import make_async
+from raidex.utils.http import default_session
 from raidex.raidex_node.architecture.event_architecture import Processor
 import structlog
 
@@ -29,9 +29,11 @@ log = structlog.get_logger('trader client')
 class TraderClient(Processor):
     """Handles the actual token swap. A client/server mock for now. Later will use a raiden node"""
 
-    def __init__(self, address, host='localhost', port=5001, market: TokenPair = None, api_version='v1' , commitment_amount=10):
+    def __init__(self, address, host='localhost', port=5001, market: TokenPair = None, api_version='v1' , commitment_amount=10,
+                 session=None):
         super(TraderClient, self).__init__(TraderEvent)
         self.address = address
+        self.session = session if session is not None else default_session()
         self.market = market
         self.port = port
         self.api_version = api_version
@@ -139,7 +141,9 @@ class TraderClient(Processor):
             body['secret_hash'] = encode_hex(secret_hash)
             log.debug(f'Secret Hash given: {body["secret_hash"]}')
 
-        result = requests.post('{}/payments/{}/{}'.format(self.apiUrl, encoded_token, encoded_target), json=body)
+        # raiden answers when the payment is completed, that can take long
+        result = self.session.post('{}/payments/{}/{}'.format(self.apiUrl, encoded_token, encoded_target), json=body,
+                                   timeout=None)
 
         log.debug(f'TOKEN: {encoded_token}, ADDRESS: {encoded_target}, AMOUNT: {amount}, IDENTIFIER: {identifier}')
 
@@ -167,7 +171,7 @@ class TraderClient(Processor):
 
         def request_events(events):
 
-            r = requests.get('{}/payments'.format(self.apiUrl))
+            r = self.session.get('{}/payments'.format(self.apiUrl), timeout=None)
 
             for line in r.iter_lines():
                 # filter out keep-alive new lines
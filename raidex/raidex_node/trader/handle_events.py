@@ -1,12 +1,9 @@
+from raidex.raidex_node.architecture.event_architecture import EventRouter
 from raidex.raidex_node.trader.events import *
 
 
 def handle_event(trader_client, event):
-
-    if isinstance(event, SwapInitEvent):
-        handle_swap_init(trader_client, event)
-    if isinstance(event, TransferEvent):
-        handle_transfer(trader_client, event)
+    event_router.handle(event, trader_client)
 
 
 def handle_swap_init(trader_client, event):
@@ -18,4 +15,10 @@ def handle_transfer(trader_client, event: TransferEvent):
     trader_client.transfer_async(token_address=event.token,
                                  target_address=event.target,
                                  amount=event.amount,
-                                 identifier=event.identifier)
\ No newline at end of file
+                                 identifier=event.identifier)
+
+
+event_router = EventRouter([
+    (SwapInitEvent, handle_swap_init),
+    (TransferEvent, handle_transfer),
+])
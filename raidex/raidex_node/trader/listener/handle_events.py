@@ -1,12 +1,22 @@
+from raidex.raidex_node.architecture.event_architecture import EventRouter
 from raidex.raidex_node.trader.listener.events import *
 from raidex.raidex_node.trader.listener.filter import TransferReceivedFilter
 
 
 def handle_event(raiden_listener, event):
+    event_router.handle(event, raiden_listener)
 
-    if isinstance(event, RaidenEvent):
-        raiden_listener.new_raiden_event(event)
 
-    if isinstance(event, ExpectInboundEvent):
-        new_listener = TransferReceivedFilter(event.initiator, event.identifier)
-        raiden_listener.add_event_filter(new_listener)
+def handle_raiden_event(raiden_listener, event: RaidenEvent):
+    raiden_listener.new_raiden_event(event)
+
+
+def handle_expect_inbound(raiden_listener, event: ExpectInboundEvent):
+    new_listener = TransferReceivedFilter(event.initiator, event.identifier)
+    raiden_listener.add_event_filter(new_listener)
+
+
+event_router = EventRouter([
+    (RaidenEvent, handle_raiden_event),
+    (ExpectInboundEvent, handle_expect_inbound),
+])
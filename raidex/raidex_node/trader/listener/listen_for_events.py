@@ -1,5 +1,4 @@
 import json
-import requests
 from gevent import Greenlet
 from polling import poll
 from raidex.raidex_node.trader.listener.events import PaymentReceivedEvent
@@ -14,7 +13,7 @@ def raiden_poll(trader, interval=RAIDEN_POLL_INTERVAL):
 
     def request_events(events):
 
-        r = requests.get('{}/payments'.format(trader.apiUrl))
+        r = trader.session.get('{}/payments'.format(trader.apiUrl), timeout=None)
 
         for line in r.iter_lines():
             # filter out keep-alive new lines
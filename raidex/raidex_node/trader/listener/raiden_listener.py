@@ -1,7 +1,12 @@
+from collections import deque
+
 from raidex.raidex_node.architecture.event_architecture import Processor, dispatch_state_changes
 from raidex.raidex_node.trader.listener.events import RaidenListenerEvent
 from raidex.raidex_node.trader.listener.filter import RaidenEventFilter
 
+# number of raiden events without a filter that are kept, for the filters that are added after the event arrived
+MAX_UNMATCHED_EVENTS = 1000
+
 
 class RaidenListener(Processor):
 
@@ -9,6 +14,8 @@ class RaidenListener(Processor):
         super(RaidenListener, self).__init__(RaidenListenerEvent)
         self.trader = trader
         self.event_filters = list()
+        # e.g. the transfer of a swap partner that was faster than our own match
+        self.unmatched_events = deque(maxlen=MAX_UNMATCHED_EVENTS)
 
     def new_raiden_event(self, event):
         state_changes = list()
@@ -19,7 +26,15 @@ class RaidenListener(Processor):
                 state_changes.append(state_change)
                 self.event_filters.remove(event_filter)
 
+        if not state_changes:
+            self.unmatched_events.append(event)
         dispatch_state_changes(state_changes)
 
     def add_event_filter(self, new_filter: RaidenEventFilter):
+        for event in self.unmatched_events:
+            state_change = new_filter.process(event)
+            if state_change is not None:
+                self.unmatched_events.remove(event)
+                dispatch_state_changes([state_change])
+                return
         self.event_filters.append(new_filter)
@@ -1,29 +1,78 @@
 from __future__ import print_function
 import structlog
 import json
-import requests
+import struct
+from itertools import count
+
 import gevent
-from gevent import monkey
+from gevent import monkey, socket
+from gevent.event import AsyncResult
+from gevent.lock import Semaphore
 from gevent.queue import Queue
 from raidex.utils.address import encode_topic
+from raidex.utils.http import default_session, CONNECT_TIMEOUT, REQUEST_TIMEOUT
 
-from raidex.message_broker.message_broker import Listener
+from raidex.message_broker.message_broker import Listener, TopicListeners
+from raidex.message_broker import wire
+from raidex.raidex_node.transport.signature_verifier import SignatureVerifier
 import raidex.messages as messages
 
 monkey.patch_socket()
 log = structlog.get_logger("TOPIC")
 
+# marks the end of the stream in the queue of messages waiting for verification
+END_OF_STREAM = object()
+
+# seconds a publish over the multiplexed connection waits for the acknowledgement of the broker
+PUBLISH_TIMEOUT = REQUEST_TIMEOUT[1]
+
+
+def iter_json_messages(response):
+    for line in response.iter_lines():
+        # filter out keep-alive new lines
+        if line:
+            decoded_line = line.decode('utf-8')
+            yield messages.LazyMessage.from_json(json.loads(decoded_line)['data'])
+
+
+def iter_frame_messages(response):
+
+    def read(size):
+        data = b''
+        while len(data) < size:
+            chunk = response.raw.read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    while True:
+        frame = messages.BinaryEnvelope.read(read)
+        if frame is None:
+            return
+        try:
+            yield messages.LazyMessage.from_frame(frame)
+        except ValueError as e:
+            log.debug('Dropping undecodable frame: {}'.format(e))
+
+
+def is_frame_stream(response):
+    return response.headers.get('Content-Type', '').startswith(messages.BinaryEnvelope.content_type)
+
 
 class StreamingRequestIterator(object):
 
     def __init__(self, response):
         self.response = response
-        self._line_generator = response.iter_lines()
+        if is_frame_stream(response):
+            self._message_generator = iter_frame_messages(response)
+        else:
+            self._message_generator = iter_json_messages(response)
         self.closed = False
 
     def __next__(self):
         if self.closed is False:
-            return next(self._line_generator)
+            return next(self._message_generator)
         if self.closed is True:
             self.response.close()
             raise StopIteration
@@ -45,37 +94,91 @@ def iter_streaming_response(response):
 
 class StreamingRequestTask(gevent.Greenlet):
 
-    def __init__(self, api_url, topic, transform_func=None):
-        self.listeners = []
+    def __init__(self, api_url, topic, transform_func=None, verifier=None, max_batch_size=256, binary_envelope=False,
+                 session=None):
+        self.listeners = TopicListeners()
         self.api_url = api_url
+        self.session = session if session is not None else default_session()
+        self.binary_envelope = binary_envelope
         self.topic = topic
         self.transform = transform_func
         self.response_iter = None
+        self.verifier = verifier
+        self.max_batch_size = max_batch_size
+        self._inbox = Queue()
         gevent.Greenlet.__init__(self)
 
     @property
     def has_listeners(self):
         return bool(self.listeners)
 
-    def _run(self):
-        # this initially blocks until something is sent on that topic
-        response = requests.get('{0}/topics/{1}'.format(self.api_url, self.topic), stream=True)
+    def _iter_messages(self):
+        headers = dict()
+        if self.binary_envelope:
+            # the server answers with a frame stream if it supports it, with json lines otherwise
+            headers['Accept'] = '{}, application/x-json-stream'.format(messages.BinaryEnvelope.content_type)
+
+        # this initially blocks until something is sent on that topic, so there is no read timeout
+        response = self.session.get('{0}/topics/{1}'.format(self.api_url, self.topic), headers=headers, stream=True,
+                                    timeout=(CONNECT_TIMEOUT, None))
         self.response_iter = iter_streaming_response(response)
-        for line in self.response_iter:
-            # filter out keep-alive new lines
-            if line:
-                decoded_line = line.decode('utf-8')
-                message = decode(json.loads(decoded_line)['data'])
-                for listener in self.listeners:
-                    message_for_listener = message
-                    if listener.transform is not None:
-                        message_for_listener = listener.transform(message_for_listener)
-                    if message_for_listener is not None:
-                        listener.message_queue_async.put(message_for_listener)
-
-    def create_listener(self, transform=None):
+        return self.response_iter
+
+    def _run(self):
+        lazy_messages = self._iter_messages()
+
+        if self.verifier is not None:
+            verifying_task = gevent.spawn(self._verify_and_dispatch)
+
+        for lazy_message in lazy_messages:
+            # only decode messages that at least one listener is interested in
+            if not self._is_wanted(lazy_message.message_type):
+                continue
+            try:
+                message = lazy_message.message
+            except ValueError as e:
+                log.debug('Dropping undecodable message: {}'.format(e))
+                continue
+
+            if self.verifier is None:
+                self._dispatch(message)
+            else:
+                self._inbox.put(message)
+
+        if self.verifier is not None:
+            # the messages that are still queued for verification are handed on before the task ends
+            self._inbox.put(END_OF_STREAM)
+            verifying_task.join()
+
+    def _verify_and_dispatch(self):
+        # collect everything that arrived while the last batch was verified,
+        # and hand it to the listeners in the order it was received
+        while True:
+            batch = [self._inbox.get()]
+            while len(batch) < self.max_batch_size and not self._inbox.empty():
+                batch.append(self._inbox.get_nowait())
+            end = batch[-1] is END_OF_STREAM
+            if end:
+                batch.pop()
+            for message in self.verifier.verify(batch):
+                self._dispatch(message)
+            if end:
+                return
+
+    def _is_wanted(self, message_type):
+        return bool(self.listeners.for_type(message_type))
+
+    def _dispatch(self, message):
+        for listener in self.listeners.for_type(type(message)):
+            message_for_listener = message
+            if listener.transform is not None:
+                message_for_listener = listener.transform(message_for_listener)
+            if message_for_listener is not None:
+                listener.message_queue_async.put(message_for_listener)
+
+    def create_listener(self, transform=None, message_types=None):
         message_queue_async = Queue()
-        listener = Listener(self.topic, message_queue_async, transform)
+        listener = Listener(self.topic, message_queue_async, transform, message_types)
         self.listeners.append(listener)
         return listener
 
@@ -91,16 +194,169 @@ class StreamingRequestTask(gevent.Greenlet):
             self.response_iter = None
 
 
+class MultiplexedTopicTask(StreamingRequestTask):
+    """Dispatches the messages of one topic, that arrive over the shared `MultiplexedConnection`"""
+
+    def __init__(self, connection, topic, transform_func=None, verifier=None):
+        self.connection = connection
+        self._deliveries = Queue()
+        super(MultiplexedTopicTask, self).__init__(None, topic, transform_func, verifier)
+
+    def deliver(self, lazy_message):
+        self._deliveries.put(lazy_message)
+
+    def _iter_messages(self):
+        return iter(self._deliveries)
+
+    def stop(self):
+        self.connection.unsubscribe(self.topic)
+        self._deliveries.put(StopIteration)
+
+
+class MultiplexedConnection(object):
+    """One persistent connection to the message broker, that carries the subscriptions and
+    publishes of all topics of a `MessageBrokerClient`, instead of one HTTP request each.
+
+    Publishes are acknowledged by the broker, the acknowledgement is matched by the request id.
+    A publish fails with a `ValueError` if the broker rejects it as malformed, with a
+    `ConnectionError` if the connection is lost before it is acknowledged, and with a `TimeoutError`
+    if the acknowledgement doesn't arrive within the timeout, in which case the connection is given up.
+    When the connection is lost, it is reestablished on the next publish or subscription and
+    all topics are subscribed again. If the broker keeps a topic log, the deliveries carry their
+    offset and the topics are resubscribed from the offset after the last delivered message, so
+    the messages sent in between are not lost.
+    """
+
+    def __init__(self, host, port):
+        self.address = (host, port)
+        self.topic_tasks = dict()  # topic -> MultiplexedTopicTask
+        self.offsets = dict()  # topic -> offset of the last delivered message in the topic log
+        self._pending = dict()  # request_id -> AsyncResult
+        self._request_ids = count(1)
+        self._socket = None
+        self._write_lock = Semaphore()
+
+    def _connect(self):
+        """Returns the socket and if it was just connected, the write lock has to be held.
+
+        Connecting yields, holding the lock keeps a concurrent writer from opening a second connection.
+        A new connection subscribes all topics.
+        """
+        sock = self._socket
+        if sock is not None:
+            return sock, False
+        sock = socket.create_connection(self.address)
+        self._socket = sock
+        gevent.spawn(self._read, sock)
+        for topic in self.topic_tasks:
+            sock.sendall(self._subscribe_frame(topic))
+        return sock, True
+
+    def _subscribe_frame(self, topic):
+        offset = self.offsets.get(topic)
+        payload = b'' if offset is None else struct.pack('>Q', offset + 1)
+        return wire.encode_frame(wire.SUBSCRIBE, topic, payload)
+
+    def _write(self, frame):
+        with self._write_lock:
+            sock, _ = self._connect()
+            sock.sendall(frame)
+
+    def _read(self, sock):
+        reader = sock.makefile('rb')
+        try:
+            while True:
+                frame = wire.read_frame(reader.read)
+                if frame is None:
+                    break
+                op, request_id, topic, payload = frame
+                if op == wire.DELIVER:
+                    if request_id:
+                        self.offsets[topic] = request_id - 1
+                    task = self.topic_tasks.get(topic)
+                    if task is not None:
+                        task.deliver(messages.LazyMessage.from_frame(payload))
+                elif op == wire.ACK:
+                    result = self._pending.pop(request_id, None)
+                    if result is not None:
+                        result.set(payload == b'\x01')
+                elif op == wire.ERROR:
+                    result = self._pending.pop(request_id, None)
+                    if result is not None:
+                        result.set_exception(ValueError(payload.decode('utf-8', 'replace')))
+        finally:
+            log.debug('Multiplexed connection to {} closed'.format(self.address))
+            reader.close()
+            if self._socket is sock:
+                self._socket = None
+            # a new connection is only made once `_socket` is reset, all pending publishes went over this one
+            error = ConnectionError('Multiplexed connection to {} lost'.format(self.address))
+            for result in self._pending.values():
+                result.set_exception(error)
+            self._pending.clear()
+
+    def _disconnect(self):
+        # the reader ends and resets the connection
+        sock = self._socket
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def subscribe(self, task):
+        with self._write_lock:
+            # registered under the lock, so a connect that is under way doesn't subscribe it as well
+            self.topic_tasks[task.topic] = task
+            sock, connected = self._connect()
+            # a new connection already subscribed the topic
+            if not connected:
+                sock.sendall(self._subscribe_frame(task.topic))
+
+    def unsubscribe(self, topic):
+        self.offsets.pop(topic, None)
+        if self.topic_tasks.pop(topic, None) is not None and self._socket is not None:
+            self._write(wire.encode_frame(wire.UNSUBSCRIBE, topic))
+
+    def publish(self, topic, frame, timeout=PUBLISH_TIMEOUT):
+        request_id = next(self._request_ids)
+        result = AsyncResult()
+        self._pending[request_id] = result
+        try:
+            self._write(wire.encode_frame(wire.PUBLISH, topic, frame, request_id))
+            return result.get(timeout=timeout)
+        except gevent.Timeout:
+            self._disconnect()
+            raise TimeoutError('No acknowledgement of the publish on {} within {}s'.format(topic, timeout))
+        finally:
+            self._pending.pop(request_id, None)
+
+
 class MessageBrokerClient:
     """Handles the communication with other nodes"""
 
-    def __init__(self, host='localhost', port=5000, address=''):
+    def __init__(self, host='localhost', port=5000, address='', parallel_verification=False, verifier_threads=None,
+                 binary_envelope=True, multiplex_port=None, session=None, send_queue_size=100, send_concurrency=1):
         self.port = port
         self.host = host
         self.apiUrl = 'http://{}:{}/api'.format(host, port)
         self.topic_task_map = {}
         self.listener_task_map = {}
         self.address = address
+        # recover the senders of inbound messages in a threadpool instead of the gevent loop
+        self.verifier = SignatureVerifier(verifier_threads) if parallel_verification else None
+        # use the binary envelope (v2) as long as the server doesn't reject it
+        self.binary_envelope = binary_envelope
+        # carry all topics over one persistent connection instead of one HTTP request per message / topic
+        self.connection = MultiplexedConnection(host, multiplex_port) if multiplex_port is not None else None
+        # keep-alive connections to the broker, shared with the other clients by default
+        self.session = session if session is not None else default_session()
+        # bounded pipeline of `send_async`, messages are only sent in order with a single sender
+        self.send_queue = Queue(maxsize=send_queue_size)
+        self.send_concurrency = send_concurrency
+        self._senders = list()
+        # topic -> url the broker redirected the topic to, e.g. the worker of a partitioned broker
+        self.topic_urls = dict()
 
     def send(self, topic, message):
         # HACK, allow 'broadcast' as non-binary input, everything else should be
@@ -108,6 +364,31 @@ class MessageBrokerClient:
         encoded_topic = encode_topic(topic)
         return self._send(encoded_topic, message)
 
+    def send_async(self, topic, message):
+        """Queues the message for sending and returns immediately, unless the pipeline is full.
+
+        Returns:
+            AsyncResult: the result of `send`
+        """
+        self._ensure_senders()
+        result_async = AsyncResult()
+        self.send_queue.put((topic, message, result_async))
+        return result_async
+
+    def _ensure_senders(self):
+        self._senders = [sender for sender in self._senders if not sender.dead]
+        while len(self._senders) < self.send_concurrency:
+            self._senders.append(gevent.spawn(self._process_send_queue))
+
+    def _process_send_queue(self):
+        while True:
+            topic, message, result_async = self.send_queue.get()
+            try:
+                result_async.set(self.send(topic, message))
+            except Exception as e:
+                log.debug('Sending failed: msg={}, topic={}, error={}'.format(message, topic, e))
+                result_async.set_exception(e)
+
     def _send(self, topic, message):
         """Sends a message to all listeners of the topic
 
@@ -117,17 +398,39 @@ class MessageBrokerClient:
 
         """
 
+        if self.connection is not None:
+            return {'data': self.connection.publish(topic, encode_frame(message))}
+
+        url = self.topic_urls.get(topic) or '{0}/topics/{1}'.format(self.apiUrl, topic)
+
+        if self.binary_envelope:
+            result = self.session.post(url, data=encode_frame(message),
+                                       headers={'Content-Type': messages.BinaryEnvelope.content_type},
+                                       timeout=REQUEST_TIMEOUT)
+            if result.status_code == 200:
+                self._remember_redirect(topic, result)
+                return result.json()
+            # the server doesn't understand frames, fall back to the json envelope
+            log.debug('Binary envelope rejected by the message broker, falling back to json')
+            self.binary_envelope = False
+
         body = {'message': encode(message)}
-        result = requests.post('{0}/topics/{1}'.format(self.apiUrl, topic), json=body)
+        result = self.session.post(url, json=body, timeout=REQUEST_TIMEOUT)
+        self._remember_redirect(topic, result)
         return result.json()
 
-    def listen_on(self, topic, transform=None):
+    def _remember_redirect(self, topic, result):
+        # skip the redirect on the next send of the topic
+        if result.history:
+            self.topic_urls[topic] = result.url
+
+    def listen_on(self, topic, transform=None, message_types=None):
         # HACK, allow 'broadcast' as non-binary input, everything else should be
         # binary data/ decoded addresses
         topic = encode_topic(topic)
-        return self._listen_on(topic, transform)
+        return self._listen_on(topic, transform, message_types)
 
-    def _listen_on(self, topic, transform=None):
+    def _listen_on(self, topic, transform=None, message_types=None):
         """Starts listening for new messages on this topic
 
         Args:
@@ -135,6 +438,8 @@ class MessageBrokerClient:
             transform : A function that filters and transforms the message
                         should return None if not interested in the message, message will not be returned,
                         otherwise should return the message in a format as needed
+            message_types (tuple): the message classes the listener wants, None for all messages.
+                        Messages of other types are neither decoded nor passed to `transform`
 
         Returns:
             Listener: an object gathering all settings of this listener
@@ -142,11 +447,16 @@ class MessageBrokerClient:
         """
         task = self.topic_task_map.get(topic)
         if task is None:
-            task = StreamingRequestTask(self.apiUrl, topic, transform)
+            if self.connection is not None:
+                task = MultiplexedTopicTask(self.connection, topic, transform, self.verifier)
+                self.connection.subscribe(task)
+            else:
+                task = StreamingRequestTask(self.apiUrl, topic, transform, self.verifier,
+                                            binary_envelope=self.binary_envelope, session=self.session)
             self.topic_task_map[topic] = task
             task.start()
 
-        listener = task.create_listener(transform)
+        listener = task.create_listener(transform, message_types)
         self.listener_task_map[listener] = task
 
         return listener
@@ -168,6 +478,7 @@ class MessageBrokerClient:
         del self.listener_task_map[listener]
         if not task.has_listeners:
             task.stop()
+            del self.topic_task_map[task.topic]
 
 
 def encode(message):
@@ -179,6 +490,13 @@ def encode(message):
         raise Exception("not supported type")
 
 
+def encode_frame(message):
+    if isinstance(message, (str, messages.Signed)):
+        return messages.BinaryEnvelope.envelop(message)
+    else:
+        raise Exception("not supported type")
+
+
 def decode(message):
     try:
         message = messages.Envelope.open(message)
@@ -1,11 +1,19 @@
+from raidex.raidex_node.architecture.event_architecture import EventRouter
 from raidex.raidex_node.transport.events import *
 from raidex.raidex_node.transport.transport import Transport
 
 
 def handle_event(transport: Transport, event: TransportEvent):
+    event_router.handle(event, transport)
 
-    if isinstance(event, SignMessageEvent) and isinstance(event, SendMessageEvent):
+
+def handle_send_message(transport: Transport, event: SendMessageEvent):
+    # only the messages that are sent get signed, `BroadcastEvent` is a `SendMessageEvent` as well
+    if isinstance(event, SignMessageEvent):
         transport.sign_message(event.message)
+    transport.send_message(event)
+
 
-    if isinstance(event, (SendMessageEvent, BroadcastEvent)):
-        transport.send_message(event)
\ No newline at end of file
+event_router = EventRouter([
+    (SendMessageEvent, handle_send_message),
+])
\ No newline at end of file
@@ -0,0 +1,90 @@
+import multiprocessing
+
+import structlog
+from gevent.threadpool import ThreadPool
+
+from raidex import messages
+
+log = structlog.get_logger('transport.verifier')
+
+
+def signed_parts(message):
+    """Yields the message and all signed messages nested in it, whose sender is not known yet"""
+    if not isinstance(message, messages.Signed):
+        return
+    for field, _ in message.fields:
+        value = getattr(message, field)
+        if isinstance(value, messages.RLPHashable):
+            yield from signed_parts(value)
+    if message.signature and not message._sender:
+        yield message
+
+
+def _recover_senders(work):
+    senders = list()
+    for hash_without_signature, signature in work:
+        try:
+            senders.append(messages.recover_sender(hash_without_signature, signature))
+        except Exception:
+            senders.append(None)
+    return senders
+
+
+class SignatureVerifier(object):
+    """Recovers the senders of batches of inbound messages in a pool of native threads.
+
+    The public key recovery of `Signed.sender` is cpu bound and would otherwise block the gevent loop. It runs
+    in a gevent threadpool, the secp256k1 backend of eth_keys (coincurve) releases the GIL during the recovery,
+    so the threads recover in parallel and other greenlets keep running meanwhile. A process pool doesn't work
+    in the monkey patched node: its result handler would block the gevent loop. After `verify` the senders are
+    set on the messages, so `message.sender` doesn't recover them again.
+    """
+
+    def __init__(self, threads=None, min_chunk_size=8):
+        self.threads = threads or multiprocessing.cpu_count()
+        self.min_chunk_size = min_chunk_size
+        self._pool = None
+
+    def start(self):
+        if self._pool is None:
+            self._pool = ThreadPool(self.threads)
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.kill()
+            self._pool = None
+
+    def _recover(self, work):
+        if len(work) < self.min_chunk_size:
+            return _recover_senders(work)
+
+        self.start()
+        chunk_size = max(self.min_chunk_size, -(-len(work) // self.threads))
+        chunks = [work[i:i + chunk_size] for i in range(0, len(work), chunk_size)]
+        results = [self._pool.spawn(_recover_senders, chunk) for chunk in chunks]
+        return [sender for result in results for sender in result.get()]
+
+    def verify(self, batch):
+        """Recovers the senders of all signed messages in the batch.
+
+        Returns the messages of the batch in their original order, without the messages that carry
+        a signature that couldn't be recovered.
+        """
+        parts_by_message = [list(signed_parts(message)) for message in batch]
+        work = [(part._hash_without_signature, part.signature) for parts in parts_by_message for part in parts]
+        senders = iter(self._recover(work))
+
+        verified = list()
+        for message, parts in zip(batch, parts_by_message):
+            valid = True
+            for part in parts:
+                sender = next(senders)
+                if sender is None:
+                    valid = False
+                else:
+                    part._sender = sender
+            if valid:
+                verified.append(message)
+            else:
+                log.debug('Dropping message with invalid signature: msg={}'.format(message))
+        return verified
@@ -16,5 +16,6 @@ class Transport(Processor):
         self._send_message(send_message_event.target, send_message_event.message)
 
     def _send_message(self, target, message):
-        self.message_broker_client.send(target, message)
+        # don't block the event consumer while the message is on its way
+        self.message_broker_client.send_async(target, message)
 
@@ -1,15 +1,10 @@
 import pytest
-import structlog
 
 from raidex.utils.random import create_random_32_bytes_id
 from raidex.utils.timestamp import time_plus
 from raidex.raidex_node.order.offer import OfferType, BasicOffer, OfferFactory, TraderRole
 
 
-@pytest.fixture(autouse=True)
-def logging_level():
-    structlog.configure(':DEBUG')
-
 @pytest.fixture
 def random_id():
     return create_random_32_bytes_id()
@@ -1,6 +1,7 @@
 import pytest
 
 from raidex.messages import CommitmentProof
+from raidex.raidex_node.order import OfferStateError
 from raidex.utils import random_secret, keccak
 
 
@@ -45,3 +46,19 @@ def test_receive_published_offer(internal_offer):
     internal_offer.received_offer()
     assert internal_offer.state == 'published'
     assert internal_offer.status == 'open'
+
+
+def test_offer_is_not_registered(internal_offer, commitment_proof):
+    assert not hasattr(internal_offer, '__dict__')
+    internal_offer.initiating()
+    internal_offer.receive_commitment_proof(proof=commitment_proof)
+    assert internal_offer.proof is commitment_proof
+    internal_offer.found_match()
+    assert internal_offer.state == 'exchanging'
+    assert internal_offer.status == 'pending'
+
+
+def test_undefined_trigger_raises(internal_offer):
+    with pytest.raises(OfferStateError):
+        internal_offer.received_offer()
+    assert internal_offer.state == 'created'
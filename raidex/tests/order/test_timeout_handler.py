@@ -1,13 +1,13 @@
 import pytest
 import gevent
-from raidex.utils.greenlet_helper import TimeoutHandler
+from raidex.utils.greenlet_helper import TimeoutHandler, TimeoutScheduler
 from raidex.utils.timestamp import seconds_to_timeout
 from raidex.exceptions import AlreadyTimedOutException
 
 
 @pytest.fixture
 def timeout_handler():
-    return TimeoutHandler()
+    return TimeoutHandler(TimeoutScheduler())
 
 
 def test_create_new_timeout(timeout_handler, basic_offer):
@@ -15,30 +15,31 @@ def test_create_new_timeout(timeout_handler, basic_offer):
     success = timeout_handler.create_new_timeout(basic_offer)
 
     assert success
-    assert timeout_handler._has_greenlet(basic_offer.offer_id)
-    assert not timeout_handler.timeout_greenlets[basic_offer.offer_id].dead
-    assert not timeout_handler.timeout_greenlets[basic_offer.offer_id].ready()
+    assert timeout_handler._has_timeout(basic_offer.offer_id)
+    assert timeout_handler.timeouts[basic_offer.offer_id].pending
+    assert not timeout_handler.timeouts[basic_offer.offer_id].fired
 
 
 def test_create_new_timeout_of_existing(timeout_handler, basic_offer):
 
     success = timeout_handler.create_new_timeout(basic_offer, 10)
     assert success
-    old_timeout_greenlet = timeout_handler.timeout_greenlets[basic_offer.offer_id]
+    old_timeout = timeout_handler.timeouts[basic_offer.offer_id]
 
     success = timeout_handler.create_new_timeout(basic_offer)
     assert success
 
-    assert not timeout_handler.timeout_greenlets[basic_offer.offer_id].dead
-    assert old_timeout_greenlet.dead
+    assert timeout_handler.timeouts[basic_offer.offer_id].pending
+    assert old_timeout.cancelled
+    assert len(timeout_handler.scheduler) == 1
 
 
 def test_create_new_timeout_of_timeouted_offer(timeout_handler, basic_offer):
     success = timeout_handler.create_new_timeout(basic_offer, seconds_to_timeout(basic_offer.timeout_date))
     assert success
-    timeout_greenlet = timeout_handler.timeout_greenlets[basic_offer.offer_id]
-    gevent.wait([timeout_greenlet])
-    assert timeout_greenlet.dead
+    timeout = timeout_handler.timeouts[basic_offer.offer_id]
+    gevent.sleep(0.05)
+    assert timeout.fired
 
     with pytest.raises(AlreadyTimedOutException):
         timeout_handler.create_new_timeout(basic_offer)
@@ -48,11 +49,53 @@ def test_clean_up_timeout(timeout_handler, basic_offer):
     offer_id = basic_offer.offer_id
 
     timeout_handler.create_new_timeout(basic_offer)
-    timeout_greenlet = timeout_handler.timeout_greenlets[offer_id]
+    timeout = timeout_handler.timeouts[offer_id]
     timeout_handler.clean_up_timeout(offer_id)
 
-    assert not timeout_handler._has_greenlet(offer_id)
-    assert timeout_greenlet.dead
+    assert not timeout_handler._has_timeout(offer_id)
+    assert timeout.cancelled
 
 
+def test_scheduler_fires_due_timers_in_one_batch():
+    scheduler = TimeoutScheduler()
+    batches = list()
 
+    scheduler.schedule(0.01, batches.append, 'first')
+    scheduler.schedule(0.01, batches.append, 'second')
+    cancelled = scheduler.schedule(0.01, batches.append, 'cancelled')
+    scheduler.schedule(10, batches.append, 'later')
+    scheduler.cancel(cancelled)
+
+    gevent.sleep(0.05)
+
+    assert batches == [['first', 'second']]
+    assert len(scheduler) == 1
+
+
+def test_scheduler_wakes_up_for_earlier_deadline():
+    scheduler = TimeoutScheduler()
+    fired = list()
+
+    scheduler.schedule(10, fired.extend, 'late')
+    gevent.sleep(0)
+    scheduler.schedule(0, fired.extend, 'early')
+    gevent.sleep(0.01)
+
+    assert fired == ['early']
+
+
+def test_scheduler_survives_failing_callback():
+    scheduler = TimeoutScheduler()
+    fired = list()
+
+    def fail(args):
+        raise RuntimeError('callback failed')
+
+    scheduler.schedule(0, fail, 'failing')
+    scheduler.schedule(0, fired.extend, 'same batch')
+    gevent.sleep(0.01)
+    scheduler.schedule(0, fired.extend, 'later')
+    gevent.sleep(0.01)
+
+    assert fired == ['same batch', 'later']
+    assert not scheduler._greenlet.dead
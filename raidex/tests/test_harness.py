@@ -0,0 +1,20 @@
+import pytest
+
+from raidex.harness import MultiNodeHarness
+
+
+@pytest.fixture
+def harness():
+    harness = MultiNodeHarness(4)
+    harness.start()
+    yield harness
+    harness.stop()
+
+
+def test_nodes_trade_in_their_own_dispatch_contexts(harness):
+    result = harness.run(4, timeout=10)
+
+    assert result['orders'] == 8
+    assert result['completed'] == 8
+    contexts = set(id(app.dispatch) for app in harness.apps)
+    assert len(contexts) == 4
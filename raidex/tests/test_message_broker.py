@@ -1,6 +1,26 @@
+import gevent
 import pytest
+from eth_utils import keccak
 
-from raidex.message_broker.message_broker import MessageBroker
+from raidex.message_broker.message_broker import (
+    MessageBroker,
+    TopicListeners,
+    Listener,
+    OverflowPolicy,
+    DISCONNECTED,
+)
+from raidex.message_broker.benchmark import benchmark_broadcast
+from raidex.message_broker.retained import RetainedOffers
+from raidex.message_broker.wire import WireMessage
+from raidex.messages import (
+    BinaryEnvelope,
+    Cancellation,
+    CommitmentProof,
+    OfferTaken,
+    ProvenOffer,
+    SwapOffer,
+)
+from raidex.utils import timestamp
 
 
 @pytest.fixture()
@@ -43,3 +63,135 @@ def test_stop_listen(message_broker):
     message_broker.stop_listen(listener)
     message_broker.send('test1', 'testmessage')
     assert listener.message_queue_async.empty(), 'Did receive a message it should not'
+
+
+def test_listen_on_message_types(message_broker):
+    all_messages = message_broker.listen_on('test1')
+    text_only = message_broker.listen_on('test1', message_types=(str,))
+    bytes_only = message_broker.listen_on('test1', transform=lambda message: 1 / 0, message_types=(bytes,))
+
+    message_broker.send('test1', 'testmessage')
+    message_broker.send('test1', 42)
+
+    assert all_messages.message_queue_async.qsize() == 2
+    assert text_only.message_queue_async.get() == 'testmessage'
+    assert text_only.message_queue_async.empty()
+    # the transform is never called for messages of other types
+    assert bytes_only.message_queue_async.empty()
+
+
+def test_topic_listeners_index():
+    topic_listeners = TopicListeners()
+    generic = Listener('test', None, None)
+    numbers = Listener('test', None, None, (int,))
+    topic_listeners.append(generic)
+    topic_listeners.append(numbers)
+
+    assert topic_listeners.for_type(str) == [generic]
+    assert topic_listeners.for_type(bool) == [generic, numbers]
+
+    topic_listeners.remove(generic)
+    assert topic_listeners.for_type(str) == []
+    assert topic_listeners.for_type(bool) == [numbers]
+
+
+def test_broadcast_encodes_once_per_message():
+    few = benchmark_broadcast(nof_subscribers=4, nof_messages=10)
+    many = benchmark_broadcast(nof_subscribers=200, nof_messages=10)
+
+    # json data and json line for the json streams, the frame is reused as is
+    assert few['encodings_per_message'] == many['encodings_per_message'] == 2
+
+
+@pytest.mark.parametrize('policy, expected, dropped', [
+    (OverflowPolicy.DROP_OLDEST, [2, 3, 4], 2),
+    (OverflowPolicy.DROP_NEWEST, [0, 1, 2], 2),
+    # the queued messages are dropped together with the listener
+    (OverflowPolicy.DISCONNECT, [DISCONNECTED], 4),
+])
+def test_bounded_listener_queue(policy, expected, dropped):
+    message_broker = MessageBroker(max_queue_size=3, overflow_policy=policy)
+    slow = message_broker.listen_on('test1')
+    other = message_broker.listen_on('test1', message_types=(str,))
+
+    for i in range(5):
+        message_broker.send('test1', i)
+
+    queued = [slow.message_queue_async.get_nowait() for _ in range(slow.message_queue_async.qsize())]
+    assert queued == expected
+
+    metrics = message_broker.metrics()['test1']
+    assert metrics['dropped'] == dropped
+    assert metrics['disconnected'] == (1 if policy is OverflowPolicy.DISCONNECT else 0)
+    assert metrics['listeners'] == (1 if policy is OverflowPolicy.DISCONNECT else 2)
+
+
+def make_proven_offer(assets, account, offer_id, timeout):
+    offer = SwapOffer(assets[0], 100, assets[1], 110, offer_id, timeout)
+    proof = CommitmentProof(keccak(text='sig') * 2 + b'\x00', keccak(text='secret'), keccak(text='secret hash'), offer_id)
+    proof.sign(account.privatekey)
+    return ProvenOffer(offer, proof).sign(account.privatekey)
+
+
+def test_retained_offers_are_replayed_to_late_listeners(assets, accounts):
+    message_broker = MessageBroker(retain_offers=True)
+    live = [make_proven_offer(assets, accounts[0], offer_id, timestamp.time_plus(60)) for offer_id in range(4)]
+
+    message_broker.broadcast(make_proven_offer(assets, accounts[0], 10, timestamp.time_plus(milliseconds=1)))
+    for proven_offer in live:
+        message_broker.broadcast(proven_offer)
+    message_broker.broadcast(OfferTaken(1).sign(accounts[1].privatekey))
+    message_broker.broadcast(Cancellation(2).sign(accounts[1].privatekey))  # not a CancellationProof
+    gevent.sleep(0.01)
+
+    listener = message_broker.listen_on_broadcast(message_types=(ProvenOffer,))
+    message_broker.broadcast('live message')
+    snapshot = [listener.message_queue_async.get_nowait() for _ in range(listener.message_queue_async.qsize())]
+
+    assert snapshot == [live[0], live[2], live[3]]
+
+
+def test_retained_wire_messages_are_replayed(assets, accounts):
+    message_broker = MessageBroker(retain_offers=True)
+    proven_offer = make_proven_offer(assets, accounts[0], 1, timestamp.time_plus(60))
+    wire_message = WireMessage(frame=BinaryEnvelope.envelop(proven_offer))
+
+    message_broker.send('broadcast', wire_message)
+    message_broker.send('broadcast', WireMessage(json_data='not an envelope'))
+
+    listener = message_broker.listen_on('broadcast')
+    assert listener.message_queue_async.get_nowait() is wire_message
+    assert listener.message_queue_async.empty()
+
+    message_broker.send('broadcast', WireMessage(frame=BinaryEnvelope.envelop(OfferTaken(1).sign(accounts[1].privatekey))))
+    assert len(message_broker.retained_offers) == 0
+
+
+def test_retained_offers_are_streamed_into_bounded_queue(assets, accounts):
+    message_broker = MessageBroker(max_queue_size=4, retain_offers=True)
+    live = [make_proven_offer(assets, accounts[0], offer_id, timestamp.time_plus(60)) for offer_id in range(10)]
+    for proven_offer in live:
+        message_broker.broadcast(proven_offer)
+
+    listener = message_broker.listen_on_broadcast()
+    message_broker.broadcast('live message')
+    received = [listener.message_queue_async.get(timeout=1) for _ in range(len(live) + 1)]
+
+    assert received == live + ['live message']
+    assert message_broker.dropped['broadcast'] == 0
+    assert listener.message_queue_async.empty()
+
+
+def test_retained_offers_are_pruned_on_update(assets, accounts):
+    message_broker = MessageBroker(retain_offers=True)
+    message_broker.broadcast(make_proven_offer(assets, accounts[0], 1, timestamp.time_plus(milliseconds=1)))
+    gevent.sleep(0.01)
+    message_broker.broadcast(make_proven_offer(assets, accounts[0], 2, timestamp.time_plus(60)))
+
+    assert list(message_broker.retained_offers._offers) == [2]
+
+
+def test_retained_offers_ignore_truncated_frames():
+    retained = RetainedOffers()
+    retained.update(WireMessage(frame=b'\x00\x00'))
+    assert len(retained) == 0
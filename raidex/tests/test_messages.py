@@ -1,3 +1,4 @@
+import io
 import json
 from operator import attrgetter
 
@@ -13,9 +14,12 @@ from raidex.messages import (
     ProvenCommitment,
     ProvenOffer,
     Envelope,
+    BinaryEnvelope,
+    LazyMessage,
     SwapCompleted,
     SwapExecution,
-    CommitmentServiceAdvertisement
+    CommitmentServiceAdvertisement,
+    recover_sender
 )
 from raidex.utils import timestamp, ETHER_TOKEN_ADDRESS, random_secret
 
@@ -184,3 +188,103 @@ def assert_envelope_serialization(message):
         envelope_dict = json.loads(envelope)
         envelope_dict['version'] = 2
         Envelope.open(json.dumps(envelope_dict))
+
+
+def test_cached_hash_on_immutable_message(assets, accounts):
+    commitment = Commitment(offer_id=10, offer_hash=keccak(text='offer id'), timeout=timestamp.time_plus(1),
+                            amount=10)
+    # mutable messages are never cached
+    hash_before = commitment.hash
+    commitment.amount = 11
+    assert commitment.hash != hash_before
+    assert commitment._cached_hash is None
+
+    commitment.sign(accounts[0].privatekey)
+    assert not commitment.is_mutable()
+    assert commitment.hash == keccak(commitment.encoded)
+    assert commitment._cached_hash is not None
+    assert commitment._cached_hash_without_signature is not None
+    assert len(commitment) == len(commitment.encoded)
+
+    with pytest.raises(ValueError):
+        commitment.amount = 12
+
+    assert commitment.sender == accounts[0].address
+    signed_hash = commitment.hash
+
+    commitment.make_mutable()
+    assert commitment._cached_hash is None
+    commitment.amount = 12
+    assert commitment.hash != signed_hash
+    assert commitment.hash == keccak(commitment.encoded)
+    assert commitment.sender != accounts[0].address
+
+
+def test_deserialized_message_is_cached(assets, accounts):
+    offer = SwapOffer(assets[0], 100, assets[1], 110, big_endian_to_int(keccak(text='offer id')), 10)
+    deserialized = SwapOffer.deserialize(offer.serialize(offer))
+
+    assert not deserialized.is_mutable()
+    assert deserialized.hash == offer.hash
+    assert deserialized._cached_hash == offer.hash
+    assert {deserialized: 1}[offer] == 1
+
+
+def test_sender_recovery_is_cached(accounts):
+    commitment = Commitment(offer_id=10, offer_hash=keccak(text='offer id'), timeout=timestamp.time_plus(1),
+                            amount=10)
+    commitment.sign(accounts[0].privatekey)
+
+    recover_sender.cache_clear()
+    copies = [Commitment.deserialize(commitment.serialize(commitment)) for _ in range(3)]
+
+    assert all(copy.sender == accounts[0].address for copy in copies)
+    info = recover_sender.cache_info()
+    assert info.misses == 1
+    assert info.hits == 2
+
+
+def test_binary_envelope(assets, accounts):
+    offer = SwapOffer(assets[0], 100, assets[1], 110, big_endian_to_int(keccak(text='offer id')), 10)
+    commitment = Commitment(offer.offer_id, offer.hash, offer.timeout, 42)
+    commitment.sign(accounts[0].privatekey)
+
+    for message in (offer, commitment, 'plain text'):
+        frame = BinaryEnvelope.envelop(message)
+        assert BinaryEnvelope.open(frame) == message
+        if not isinstance(message, str):
+            assert len(frame) < len(Envelope.envelop(message))
+
+        # both envelopes transcode into each other without touching the rlp data
+        json_data = BinaryEnvelope.to_json(frame)
+        assert BinaryEnvelope.from_json(json_data) == frame
+        if not isinstance(message, str):
+            assert Envelope.open(json_data) == message
+
+    assert BinaryEnvelope.open(BinaryEnvelope.envelop(commitment)).sender == accounts[0].address
+
+
+def test_binary_envelope_read_frames(assets):
+    offer = SwapOffer(assets[0], 100, assets[1], 110, big_endian_to_int(keccak(text='offer id')), 10)
+    stream = io.BytesIO(BinaryEnvelope.envelop(offer) + BinaryEnvelope.envelop('text'))
+
+    assert BinaryEnvelope.open(BinaryEnvelope.read(stream.read)) == offer
+    assert BinaryEnvelope.open(BinaryEnvelope.read(stream.read)) == 'text'
+    assert BinaryEnvelope.read(stream.read) is None
+
+    with pytest.raises(ValueError):
+        BinaryEnvelope.open(BinaryEnvelope.envelop(offer)[:-1])
+
+
+def test_lazy_message(assets):
+    offer = SwapOffer(assets[0], 100, assets[1], 110, big_endian_to_int(keccak(text='offer id')), 10)
+
+    for lazy in (LazyMessage.from_frame(BinaryEnvelope.envelop(offer)), LazyMessage.from_json(Envelope.envelop(offer))):
+        assert lazy.message_type is SwapOffer
+        assert lazy._message is None
+        assert lazy.message == offer
+        assert lazy.message is lazy.message
+
+    text = LazyMessage.from_json('no envelope')
+    assert text.message_type is str
+    assert text.message == 'no envelope'
@@ -0,0 +1,174 @@
+import io
+import socket
+
+import gevent
+import pytest
+from gevent.server import StreamServer
+
+from raidex.message_broker import wire
+from raidex.message_broker.message_broker import MessageBroker
+from raidex.message_broker.topic_log import TopicLog
+from raidex.messages import OfferTaken, BinaryEnvelope
+from raidex.raidex_node.transport.client import MessageBrokerClient, MultiplexedConnection, MultiplexedTopicTask
+
+
+@pytest.fixture()
+def message_broker():
+    return MessageBroker()
+
+
+@pytest.fixture()
+def multiplex_server(message_broker):
+    server = StreamServer(('127.0.0.1', 0), wire.multiplex_handler(message_broker))
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture()
+def client(multiplex_server):
+    return MessageBrokerClient(host='127.0.0.1', multiplex_port=multiplex_server.server_port)
+
+
+def test_frame_roundtrip():
+    stream = io.BytesIO(wire.encode_frame(wire.PUBLISH, 'topic', b'payload', 7) + wire.encode_frame(wire.SUBSCRIBE, 'b'))
+
+    assert wire.read_frame(stream.read) == (wire.PUBLISH, 7, 'topic', b'payload')
+    assert wire.read_frame(stream.read) == (wire.SUBSCRIBE, 0, 'b', b'')
+    assert wire.read_frame(stream.read) is None
+
+
+def test_topics_share_one_connection(client, message_broker, accounts):
+    offer_taken = OfferTaken(1).sign(accounts[0].privatekey)
+
+    broadcast_listener = client.listen_on('broadcast')
+    direct_listener = client.listen_on('direct')
+    gevent.sleep(0.05)
+
+    assert client.send('broadcast', offer_taken) == {'data': True}
+    assert client.send('direct', 'text') == {'data': True}
+
+    assert broadcast_listener.message_queue_async.get(timeout=1) == offer_taken
+    assert direct_listener.message_queue_async.get(timeout=1) == 'text'
+    assert len(client.connection.topic_tasks) == 2
+
+    client.stop_listen(direct_listener)
+    gevent.sleep(0.05)
+    assert not message_broker.listeners['direct']
+    assert client.send('direct', offer_taken) == {'data': False}
+
+
+def test_send_async_keeps_order(client):
+    listener = client.listen_on('pipeline')
+    gevent.sleep(0.05)
+
+    results = [client.send_async('pipeline', 'message {}'.format(i)) for i in range(5)]
+
+    assert [result.get(timeout=1) for result in results] == [{'data': True}] * 5
+    assert [listener.message_queue_async.get(timeout=1) for _ in range(5)] == ['message {}'.format(i) for i in range(5)]
+
+
+def test_resubscribe_resumes_from_topic_log(message_broker, accounts, tmpdir):
+    topic_log = TopicLog(str(tmpdir))
+    server = StreamServer(('127.0.0.1', 0), wire.multiplex_handler(message_broker, topic_log))
+    server.start()
+    client = MessageBrokerClient(host='127.0.0.1', multiplex_port=server.server_port)
+    offers_taken = [OfferTaken(i).sign(accounts[0].privatekey) for i in range(3)]
+
+    listener = client.listen_on('resume')
+    gevent.sleep(0.05)
+    assert client.send('resume', offers_taken[0]) == {'data': True}
+    assert listener.message_queue_async.get(timeout=1) == offers_taken[0]
+    assert client.connection.offsets['resume'] == 0
+
+    # the connection is lost, the next message is only logged
+    client.connection._socket.shutdown(socket.SHUT_RDWR)
+    gevent.sleep(0.05)
+    wire.publish(message_broker, topic_log, 'resume', wire.WireMessage(frame=BinaryEnvelope.envelop(offers_taken[1])))
+
+    assert client.send('resume', offers_taken[2]) == {'data': True}
+    assert listener.message_queue_async.get(timeout=1) == offers_taken[1]
+    assert listener.message_queue_async.get(timeout=1) == offers_taken[2]
+    assert client.connection.offsets['resume'] == 2
+
+    server.stop()
+    topic_log.close()
+
+
+def test_deliver_frame_carries_large_offsets():
+    message = wire.WireMessage(frame=b'frame')
+    message.offset = 2 ** 32
+    op, request_id, topic, payload = wire.read_frame(io.BytesIO(message.deliver_frame('topic')).read)
+    assert (op, request_id - 1, topic, payload) == (wire.DELIVER, 2 ** 32, 'topic', b'frame')
+
+
+@pytest.mark.parametrize('drop_connection', [True, False])
+def test_unacknowledged_publish_fails(drop_connection):
+    def handle(sock, address):
+        sock.recv(1024)
+        if drop_connection:
+            sock.close()
+        else:
+            gevent.sleep(1)
+
+    server = StreamServer(('127.0.0.1', 0), handle)
+    server.start()
+    connection = MultiplexedConnection('127.0.0.1', server.server_port)
+
+    expected_error = ConnectionError if drop_connection else TimeoutError
+    with pytest.raises(expected_error):
+        connection.publish('topic', b'frame', timeout=0.1)
+    assert not connection._pending
+    gevent.sleep(0.01)
+    # the connection is given up and reestablished on the next use
+    assert connection._socket is None
+    server.stop()
+
+
+def test_concurrent_use_opens_one_connection():
+    connections = list()
+    frames = list()
+
+    def handle(sock, address):
+        connections.append(address)
+        reader = sock.makefile('rb')
+        while True:
+            frame = wire.read_frame(reader.read)
+            if frame is None:
+                return
+            frames.append(frame[:3])
+            if frame[0] == wire.PUBLISH:
+                sock.sendall(wire.encode_frame(wire.ACK, frame[2], b'\x01', frame[1]))
+
+    server = StreamServer(('127.0.0.1', 0), handle)
+    server.start()
+    connection = MultiplexedConnection('127.0.0.1', server.server_port)
+
+    task = MultiplexedTopicTask(connection, 'topic')
+    publishes = [gevent.spawn(connection.publish, 'other', b'frame', timeout=1) for _ in range(3)]
+    gevent.spawn(connection.subscribe, task).join()
+    assert [publish.get() for publish in publishes] == [True] * 3
+
+    assert len(connections) == 1
+    # the topic is subscribed once, by the connect or by the subscription
+    assert [frame for frame in frames if frame[0] == wire.SUBSCRIBE] == [(wire.SUBSCRIBE, 0, 'topic')]
+    server.stop()
+
+
+@pytest.mark.parametrize('payload', [b'', b'\x00\x00', BinaryEnvelope.envelop('text')[:-1]])
+def test_malformed_publish_is_rejected(accounts, payload):
+    message_broker = MessageBroker(retain_offers=True)
+    server = StreamServer(('127.0.0.1', 0), wire.multiplex_handler(message_broker))
+    server.start()
+    client = MessageBrokerClient(host='127.0.0.1', multiplex_port=server.server_port)
+    offer_taken = OfferTaken(1).sign(accounts[0].privatekey)
+
+    listener = client.listen_on('broadcast')
+    gevent.sleep(0.05)
+    with pytest.raises(ValueError):
+        client.connection.publish('broadcast', payload, timeout=1)
+
+    # the session and its subscriptions survive
+    assert client.send('broadcast', offer_taken) == {'data': True}
+    assert listener.message_queue_async.get(timeout=1) == offer_taken
+    server.stop()
@@ -0,0 +1,132 @@
+import os
+import socket
+
+import gevent
+import pytest
+import requests
+from gevent.pywsgi import WSGIServer
+
+from raidex.message_broker.partitioned import (
+    PartitionMap,
+    create_front_door,
+    partition_for,
+    start_workers,
+    worker_command,
+)
+import raidex
+from raidex.messages import OfferTaken
+from raidex.raidex_node.transport.client import MessageBrokerClient
+
+
+def free_base_port(nof_ports):
+    # the workers need consecutive ports
+    for base_port in range(20000, 30000, nof_ports):
+        sockets = list()
+        try:
+            for port in range(base_port, base_port + nof_ports):
+                sock = socket.socket()
+                sockets.append(sock)
+                sock.bind(('127.0.0.1', port))
+            return base_port
+        except OSError:
+            continue
+        finally:
+            for sock in sockets:
+                sock.close()
+    raise RuntimeError('No free ports')
+
+
+def wait_until_serving(port, worker, timeout=30):
+    with gevent.Timeout(timeout):
+        while True:
+            assert worker.poll() is None, 'worker exited'
+            try:
+                requests.get('http://127.0.0.1:{}/api/metrics'.format(port), timeout=1)
+                return
+            except requests.ConnectionError:
+                gevent.sleep(0.1)
+
+
+@pytest.fixture()
+def partitioned_broker(monkeypatch):
+    # the workers import the same raidex package as the tests
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(raidex.__file__)))
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join(filter(None, [package_root, os.environ.get('PYTHONPATH')])))
+    partition_map = PartitionMap(2, host='127.0.0.1', base_port=free_base_port(3))
+    workers = start_workers(partition_map)
+    front_door = WSGIServer(('127.0.0.1', 0), create_front_door(partition_map), log=None)
+    front_door.start()
+    try:
+        for port, worker in zip(partition_map.ports, workers):
+            wait_until_serving(port, worker)
+        yield partition_map, front_door.server_port
+    finally:
+        front_door.stop()
+        for worker in workers:
+            worker.terminate()
+            worker.wait()
+
+
+def test_partition_for_is_stable():
+    topics = ['0x{:040x}'.format(i) for i in range(100)]
+    partitions = [partition_for(topic, 4) for topic in topics]
+
+    assert partitions == [partition_for(topic, 4) for topic in topics]
+    assert set(partitions) == {0, 1, 2, 3}
+
+
+def test_broadcast_has_its_own_worker():
+    partition_map = PartitionMap(3, base_port=6000)
+
+    assert partition_map.ports == [6000, 6001, 6002, 6003]
+    assert partition_map.port_for('broadcast') == 6000
+    assert all(partition_map.port_for('0x{:040x}'.format(i)) in (6001, 6002, 6003) for i in range(20))
+
+
+def test_front_door_redirects_to_worker():
+    partition_map = PartitionMap(2, host='broker', base_port=6000)
+    client = create_front_door(partition_map).test_client()
+    topic = '0x{:040x}'.format(1)
+
+    response = client.post('/api/topics/{}'.format(topic), json={'message': 'x'})
+    assert response.status_code == 307
+    assert response.headers['Location'] == partition_map.url_for(topic)
+
+    response = client.get('/api/topics/broadcast?from_offset=3')
+    assert response.headers['Location'] == 'http://broker:6000/api/topics/broadcast?from_offset=3'
+
+    assert client.get('/api/partitions').get_json()['data']['broadcast'] == 'http://broker:6000/api'
+
+
+def test_worker_command_passes_arguments():
+    command = worker_command(6001, log_dir='/tmp/log', extra_args=['--queue-size', '10'])
+
+    assert command[1:] == ['-m', 'raidex.message_broker.server', '--port', '6001', '--multiplex-port', '0',
+                           '--log-dir', '/tmp/log/6001', '--queue-size', '10']
+
+    # the workers serve HTTP only
+    with pytest.raises(ValueError):
+        worker_command(6001, extra_args=['--multiplex-port', '5010'])
+
+
+def test_messages_are_routed_through_workers(partitioned_broker, accounts):
+    partition_map, front_door_port = partitioned_broker
+    client = MessageBrokerClient(host='127.0.0.1', port=front_door_port)
+    topic = '0x{:040x}'.format(1)
+    offer_taken = OfferTaken(1).sign(accounts[0].privatekey)
+
+    direct_listener = client.listen_on(topic)
+    broadcast_listener = client.listen_on('broadcast')
+    gevent.sleep(0.5)
+
+    assert client.send(topic, offer_taken) == {'data': True}
+    assert client.send('broadcast', offer_taken) == {'data': True}
+
+    assert direct_listener.message_queue_async.get(timeout=5) == offer_taken
+    assert broadcast_listener.message_queue_async.get(timeout=5) == offer_taken
+    # the sends went to the workers that own the topics
+    assert client.topic_urls[topic] == partition_map.url_for(topic)
+    assert client.topic_urls['broadcast'] == partition_map.url_for('broadcast')
+
+    for listener in (direct_listener, broadcast_listener):
+        client.stop_listen(listener)
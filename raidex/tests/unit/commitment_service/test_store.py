@@ -0,0 +1,145 @@
+import time
+
+import gevent
+import pytest
+from gevent.queue import PriorityQueue, Queue
+
+from raidex import messages
+from raidex.commitment_service.node import CommitmentService
+from raidex.commitment_service.store import CommitmentServiceStore
+from raidex.commitment_service.swap import SwapFactory
+from raidex.harness import LocalMessageBrokerClient, LocalTraderClient
+from raidex.message_broker.message_broker import MessageBroker
+from raidex.signing import Signer
+from raidex.trader_mock.trader import Trader, TransferReceipt
+from raidex.utils import timestamp
+
+OFFER_ID = 123
+
+
+@pytest.fixture
+def maker():
+    return Signer.random()
+
+
+def open_store(tmpdir):
+    store = CommitmentServiceStore(str(tmpdir.join('commitment_service.db')))
+    loaded = store.load()
+    factory = SwapFactory(dict(), PriorityQueue(), Queue(), store)
+    return store, factory, loaded
+
+
+def committed_swap(factory, maker, seconds_to_timeout):
+    swap = factory.make_swap(OFFER_ID)
+    commitment = messages.Commitment(OFFER_ID, b'\x01' * 32, timestamp.time_plus(seconds_to_timeout), 10)
+    maker.sign(commitment)
+    swap.hand_maker_commitment_msg(commitment)
+    swap.hand_transfer_receipt(TransferReceipt(maker.address, 10, OFFER_ID, timestamp.time()))
+    return swap
+
+
+def test_resume_swap(tmpdir, maker):
+    store, factory, _ = open_store(tmpdir)
+    swap = committed_swap(factory, maker, 60)
+    assert swap.state == 'wait_for_taker'
+    swap.cancel_timeout()
+    store.close()
+
+    store, factory, (swap_records, refunds, queued_messages) = open_store(tmpdir)
+    assert refunds == []
+    assert [(type(msg), recipient) for msg, recipient, _ in queued_messages] == [
+        (messages.CommitmentProof, maker.address)]
+
+    restored = factory.restore_swap(swap_records[0])
+    assert factory.swaps[OFFER_ID] is restored
+    assert restored.state == 'wait_for_taker'
+    assert restored.secret == swap.secret
+    assert restored.maker_commitment_msg == swap.maker_commitment_msg
+    assert restored._state_machine.timeout_task is not None
+    restored.cancel_timeout()
+    store.close()
+
+
+def test_resumed_timeout_fires(tmpdir, maker):
+    store, factory, _ = open_store(tmpdir)
+    committed_swap(factory, maker, 0.05).cancel_timeout()
+    store.close()
+
+    gevent.sleep(0.1)
+    store, factory, (swap_records, _, _) = open_store(tmpdir)
+    swap = factory.restore_swap(swap_records[0])
+    gevent.sleep(0.01)
+
+    # the timed out swap refunds the maker and is deleted
+    assert swap.terminated_state == 'untraded'
+    assert OFFER_ID not in factory.swaps
+    store.close()
+
+    store, factory, (swap_records, refunds, queued_messages) = open_store(tmpdir)
+    assert swap_records == []
+    assert [refund.receipt.initiator for refund in refunds] == [maker.address]
+    assert len(queued_messages) == 2
+
+    store.remove_refund(refunds[0])
+    for _, _, key in queued_messages:
+        store.remove_message(key)
+    store.close()
+    assert open_store(tmpdir)[2] == ([], [], [])
+
+
+def test_group_commit(tmpdir, maker):
+    store, factory, _ = open_store(tmpdir)
+    store.commit_interval = 60
+    committed_swap(factory, maker, 60).cancel_timeout()
+
+    # nothing is written before the group is committed
+    assert CommitmentServiceStore(store.path).load() == ([], [], [])
+    store.commit()
+    assert len(CommitmentServiceStore(store.path).load()[0]) == 1
+    store.close()
+
+
+def test_close_waits_for_running_commit(tmpdir, maker):
+    store, factory, _ = open_store(tmpdir)
+    store.commit_interval = 60
+    committed_swap(factory, maker, 60).cancel_timeout()
+
+    write = store._write
+
+    def slow_write(pending):
+        # runs on a thread of the threadpool
+        time.sleep(0.05)
+        write(pending)
+
+    store._write = slow_write
+    commit_task = gevent.spawn(store.commit)
+    gevent.sleep(0.01)
+    store.close()
+    commit_task.get()
+
+    assert len(open_store(tmpdir)[2][0]) == 1
+
+
+def test_service_resumes(tmpdir, maker):
+    store, factory, _ = open_store(tmpdir)
+    committed_swap(factory, maker, 60).cancel_timeout()
+    store.close()
+
+    message_broker = MessageBroker()
+    trader = Trader()
+    signer = Signer.random()
+    service = CommitmentService(signer, LocalMessageBrokerClient(message_broker, signer.checksum_address),
+                                LocalTraderClient(signer.checksum_address, trader), fee_rate=0.01,
+                                store=CommitmentServiceStore(store.path))
+    service.start()
+    try:
+        swap = service.swaps[OFFER_ID]
+        assert swap.state == 'wait_for_taker'
+        assert swap._state_machine.timeout_task is not None
+        gevent.sleep(0.01)
+        assert service.message_queue.empty()
+    finally:
+        service.stop()
+
+    # the queued commitment proof went out
+    assert open_store(tmpdir)[2][2] == []
@@ -0,0 +1,91 @@
+from collections import namedtuple
+
+from raidex.commitment_service.swap_state_machine import SwapStateMachine, SWAP_TRANSITIONS
+
+Msg = namedtuple('Msg', 'sender timeout')
+Receipt = namedtuple('Receipt', 'initiator')
+
+MAKER = b'\x01' * 20
+TAKER = b'\x02' * 20
+OTHER = b'\x03' * 20
+
+
+class SwapStub(object):
+
+    def __init__(self):
+        self.offer_id = 123
+        self.calls = []
+        self.refunds = []
+        self.terminated_state = None
+        self.maker_commitment_msg = None
+
+    def is_maker(self, address):
+        return address == MAKER
+
+    def is_taker(self, address):
+        return address == TAKER
+
+    def queue_refund(self, transfer_receipt, priority=1, claim_fee=False):
+        self.refunds.append(transfer_receipt)
+
+    def __getattr__(self, name):
+        # records the swap actions called by the machine, e.g. send_offer_taken
+        return lambda: self.calls.append(name)
+
+
+def test_machines_share_the_table():
+    machine = SwapStateMachine(SwapStub(), auto_spawn_timeout=False)
+    assert not hasattr(machine, '__dict__')
+    assert ('initializing', 'maker_commitment_msg') in SWAP_TRANSITIONS
+
+
+def test_traded_swap():
+    swap = SwapStub()
+    machine = SwapStateMachine(swap, auto_spawn_timeout=False)
+
+    assert machine.maker_commitment_msg(msg=Msg(MAKER, 0))
+    assert machine.state == 'wait_for_maker'
+    assert machine.transfer_receipt(receipt=Receipt(MAKER))
+    assert machine.state == 'wait_for_taker'
+    assert machine.taker_commitment_msg(msg=Msg(TAKER, 0))
+    assert machine.transfer_receipt(receipt=Receipt(TAKER))
+    assert machine.state == 'wait_for_execution'
+    assert machine.swap_execution_msg(msg=Msg(MAKER, 0))
+    assert machine.state == 'wait_for_taker_execution'
+    assert machine.swap_execution_msg(msg=Msg(TAKER, 0))
+
+    assert machine.state == 'processed'
+    assert swap.terminated_state == 'traded'
+    assert swap.calls == ['send_maker_commitment_proof', 'send_offer_taken', 'send_taker_commitment_proof',
+                          'send_swap_completed', 'refund_maker_with_fee', 'refund_taker_with_fee', 'cleanup']
+    assert swap.refunds == []
+
+
+def test_refunds_receipts_without_state_change():
+    swap = SwapStub()
+    machine = SwapStateMachine(swap, auto_spawn_timeout=False)
+    machine.set_state('wait_for_taker')
+
+    # no taker commitment was sent before the transfer
+    assert machine.transfer_receipt(receipt=Receipt(OTHER))
+    assert machine.state == 'wait_for_taker'
+    assert swap.refunds == [Receipt(OTHER)]
+
+
+def test_guards_fail():
+    machine = SwapStateMachine(SwapStub(), auto_spawn_timeout=False)
+    machine.set_state('wait_for_execution')
+    assert machine.swap_execution_msg(msg=Msg(OTHER, 0)) is False
+    assert machine.state == 'wait_for_execution'
+
+
+def test_ignores_undefined_trigger():
+    swap = SwapStub()
+    machine = SwapStateMachine(swap, auto_spawn_timeout=False)
+    machine.set_state('wait_for_taker')
+    assert machine.timeout()
+    assert machine.state == 'processed'
+    assert swap.terminated_state == 'untraded'
+
+    assert machine.timeout() is False
+    assert machine.state == 'processed'
@@ -0,0 +1,101 @@
+import gevent
+from gevent.queue import Queue
+
+from raidex.raidex_node.architecture.event_architecture import (
+    EventRouter,
+    Dispatch,
+    DispatchContext,
+    Processor,
+    Consumer,
+    current_context,
+    default_context,
+    dispatch_state_changes,
+)
+from raidex.raidex_node.architecture.state_change import (
+    StateChange,
+    OfferStateChange,
+    OfferTimeoutStateChange,
+    NewLimitOrderStateChange,
+)
+
+
+def test_router_follows_mro_in_registration_order():
+    calls = list()
+    router = EventRouter([
+        (OfferStateChange, lambda target, event: calls.append((target, 'offer'))),
+        (OfferTimeoutStateChange, lambda target, event: calls.append((target, 'timeout'))),
+    ])
+
+    router.handle(OfferTimeoutStateChange(1, 2), 'node')
+    router.handle(OfferStateChange(1), 'node')
+    router.handle(NewLimitOrderStateChange({}), 'node')
+
+    assert calls == [('node', 'offer'), ('node', 'timeout'), ('node', 'offer')]
+    assert len(router.handlers_for(OfferTimeoutStateChange)) == 2
+    assert router.handlers_for(NewLimitOrderStateChange) == ()
+
+    router.register(StateChange, lambda target, event: calls.append((target, 'any')))
+    assert len(router.handlers_for(NewLimitOrderStateChange)) == 1
+
+
+def test_dispatch_routes_by_class():
+    dispatch = Dispatch()
+
+    dispatch.connect_consumer(Processor(OfferStateChange), None)
+    assert dispatch.consumers_for(NewLimitOrderStateChange) == ()
+    dispatch.connect_consumer(Processor(StateChange), None)
+
+    assert len(dispatch.consumers_for(OfferTimeoutStateChange)) == 2
+    assert len(dispatch.consumers_for(NewLimitOrderStateChange)) == 1
+
+
+def test_contexts_are_separate():
+    received = {'first': list(), 'second': list()}
+    contexts = dict()
+    for name in received:
+        context = DispatchContext()
+        context.state_change_dispatch.connect_consumer(
+            Processor(StateChange), lambda processor, event, name=name: received[name].append(event))
+        context.start_consumer_tasks()
+        contexts[name] = context
+
+    state_change = OfferStateChange(1)
+    # spawned greenlets dispatch within the context of the greenlet that spawned them
+    contexts['first'].spawn(lambda: gevent.spawn(dispatch_state_changes, [state_change]).join()).join()
+    gevent.sleep(0.01)
+
+    assert received == {'first': [state_change], 'second': []}
+    assert current_context() is default_context
+
+
+def test_consumer_drains_batches():
+    batches = list()
+    queue = Queue()
+    for i in range(5):
+        queue.put(i)
+
+    consumer = Consumer(queue, Processor(int), None, lambda processor, batch: batches.append(batch),
+                        max_batch_size=3)
+    consumer.start()
+    gevent.sleep(0.01)
+    queue.put(5)
+    gevent.sleep(0.01)
+    consumer.kill()
+
+    assert batches == [[0, 1, 2], [3, 4], [5]]
+
+
+def test_consumer_waits_for_batch_timeout():
+    events = list()
+    queue = Queue()
+
+    consumer = Consumer(queue, Processor(int), lambda processor, event: events.append(event), batch_timeout=0.05)
+    consumer.handle_batch = lambda batch: events.append(batch)
+    consumer.start()
+    queue.put(0)
+    gevent.sleep(0.01)
+    queue.put(1)
+    gevent.sleep(0.1)
+    consumer.kill()
+
+    assert events == [[0, 1]]
@@ -0,0 +1,54 @@
+import gevent
+import requests
+
+from raidex.utils.http import DEFAULT_TIMEOUT, PooledSession, default_session, configure_default_session
+
+
+def test_pooled_session_defaults(monkeypatch):
+    timeouts = list()
+
+    def request(self, method, url, **kwargs):
+        timeouts.append(kwargs['timeout'])
+
+    monkeypatch.setattr(requests.Session, 'request', request)
+    session = PooledSession(pool_maxsize=2, timeout=(1, 5))
+
+    session.get('http://localhost/')
+    session.get('http://localhost/', timeout=None)
+
+    assert timeouts == [(1, 5), None]
+    assert session.get_adapter('http://localhost/')._pool_maxsize == 2
+    # raiden answers payments only when they are completed
+    assert PooledSession().timeout is DEFAULT_TIMEOUT is None
+
+
+def test_requests_per_host_are_bounded(monkeypatch):
+    running = dict(now=0, most=0)
+
+    def request(self, method, url, **kwargs):
+        running['now'] += 1
+        running['most'] = max(running['most'], running['now'])
+        gevent.sleep(0.01)
+        running['now'] -= 1
+
+    monkeypatch.setattr(requests.Session, 'request', request)
+    session = PooledSession(pool_maxsize=2)
+
+    gevent.joinall([gevent.spawn(session.get, 'http://localhost/') for _ in range(5)], raise_error=True)
+    assert running['most'] == 2
+
+    # streaming responses and other hosts don't wait for a slot
+    running['most'] = 0
+    tasks = [gevent.spawn(session.get, 'http://localhost/') for _ in range(2)]
+    tasks += [gevent.spawn(session.get, 'http://localhost/', stream=True),
+              gevent.spawn(session.get, 'http://otherhost/')]
+    gevent.joinall(tasks, raise_error=True)
+    assert running['most'] == 4
+
+
+def test_default_session_is_shared():
+    assert default_session() is default_session()
+
+    session = configure_default_session(pool_maxsize=3)
+    assert default_session() is session
+    configure_default_session()
@@ -0,0 +1,189 @@
+from types import SimpleNamespace
+
+import gevent
+import pytest
+
+from raidex.raidex_node.architecture.data_manager import DataManager
+from raidex.raidex_node.architecture.journal import JournalEntry, StateChangeJournal, deterministic
+from raidex.raidex_node.architecture.state_change import (
+    CancelLimitOrderStateChange,
+    NewLimitOrderStateChange,
+    OfferPublishedStateChange,
+)
+from raidex.raidex_node.architecture.event_architecture import replaying
+from raidex.raidex_node import handle_state_change
+from raidex.raidex_node.handle_state_change import apply_state_changes, handle_state_changes, replay
+from raidex.raidex_node.offer_book import OfferBook, OfferBookEntry
+from raidex.raidex_node.order.offer import BasicOffer, OfferType
+from raidex.utils import timestamp
+from raidex.utils.random import create_random_32_bytes_id
+from raidex.utils.timestamp import time_plus
+
+
+def make_node(market, journal):
+    return SimpleNamespace(data_manager=DataManager(OfferBook(), market), journal=journal)
+
+
+def new_limit_order(order_id, order_type='BUY', price=2):
+    return NewLimitOrderStateChange({'order_id': order_id, 'order_type': order_type, 'amount': 10, 'price': price,
+                                     'lifetime': 60})
+
+
+def offer_published(offer_id):
+    offer = BasicOffer(offer_id, OfferType.SELL, 10, 50, time_plus(seconds=60))
+    return OfferPublishedStateChange(OfferBookEntry(offer, b'\x01' * 20, None))
+
+
+def node_state(data_manager):
+    return dict(
+        orders={order_id: {offer_id: (offer.state, offer.timeout_date)
+                           for offer_id, offer in order.corresponding_offers.items()}
+                for order_id, order in data_manager.orders.items()},
+        offers=sorted(data_manager.offer_manager.offers),
+        sells=[entry.offer_id for entry in data_manager.matching_engine.offer_book.sells.values()],
+        timeouts=sorted(data_manager.timeout_handler.timeouts),
+    )
+
+
+def restore(market, directory, **kwargs):
+    journal = StateChangeJournal(directory, **kwargs)
+    snapshot, entries = journal.load()
+    data_manager = snapshot if snapshot is not None else DataManager(OfferBook(), market)
+    replay(data_manager, entries)
+    return journal, data_manager, entries
+
+
+@pytest.mark.parametrize('snapshot_interval', [0, 2])
+def test_replay_rebuilds_state(market, tmpdir, snapshot_interval):
+    node = make_node(market, StateChangeJournal(str(tmpdir), snapshot_interval=snapshot_interval))
+    node.journal.load()
+
+    handle_state_changes(node, [new_limit_order(1), offer_published(100)])
+    handle_state_changes(node, [offer_published(101), new_limit_order(2, 'SELL', 8)])
+    handle_state_changes(node, [new_limit_order(3)])
+    node.journal.close()
+    expected = node_state(node.data_manager)
+
+    journal, data_manager, entries = restore(market, str(tmpdir), snapshot_interval=snapshot_interval)
+
+    assert node_state(data_manager) == expected
+    assert len(entries) == (1 if snapshot_interval else 5)
+    assert journal.sequence == 5
+
+    # the restored offers keep their state and can still be triggered
+    offer = next(iter(data_manager.orders[1].corresponding_offers.values()))
+    offer.timeout()
+    assert offer.state == 'cancellation_requested'
+    journal.close()
+
+
+def test_incomplete_record_is_dropped(market, tmpdir):
+    node = make_node(market, StateChangeJournal(str(tmpdir)))
+    node.journal.load()
+    handle_state_changes(node, [new_limit_order(1), new_limit_order(2)])
+    node.journal.close()
+
+    segment = tmpdir.join('journal-{:020d}.log'.format(0))
+    segment.write_binary(segment.read_binary()[:-3])
+
+    journal, data_manager, entries = restore(market, str(tmpdir))
+    assert list(data_manager.orders) == [1]
+    assert journal.sequence == 1
+
+    handle_state_changes(SimpleNamespace(data_manager=data_manager, journal=journal), [new_limit_order(3)])
+    journal.close()
+    assert [entry.state_change.data['order_id'] for entry in restore(market, str(tmpdir))[2]] == [1, 3]
+
+
+def test_replay_skips_failed_entry(market, tmpdir):
+    node = make_node(market, StateChangeJournal(str(tmpdir)))
+    node.journal.load()
+    handle_state_changes(node, [new_limit_order(1)])
+    # the entry is recorded before it fails
+    with pytest.raises(KeyError):
+        handle_state_changes(node, [CancelLimitOrderStateChange({'order_id': 99})])
+    handle_state_changes(node, [new_limit_order(2)])
+    node.journal.close()
+    expected = node_state(node.data_manager)
+
+    journal, data_manager, entries = restore(market, str(tmpdir))
+    assert len(entries) == 3
+    assert node_state(data_manager) == expected
+    journal.close()
+
+
+def test_deterministic_is_scoped_to_greenlet():
+    entry = JournalEntry(timestamp.time_minus(seconds=3600), 42, None)
+
+    def in_entry():
+        with deterministic(entry):
+            gevent.sleep(0.01)
+            return timestamp.time(), create_random_32_bytes_id()
+
+    replaying_task = gevent.spawn(in_entry)
+    gevent.sleep(0)
+    # the other greenlets keep the real clock and random ids, while the entry is handled
+    assert timestamp.time() > entry.timestamp + 1000
+    assert create_random_32_bytes_id() != create_random_32_bytes_id()
+
+    assert replaying_task.get() == (entry.timestamp, in_entry()[1])
+
+
+def test_records_while_snapshot_is_written(market, tmpdir):
+    node = make_node(market, StateChangeJournal(str(tmpdir), snapshot_interval=0))
+    node.journal.load()
+    handle_state_changes(node, [new_limit_order(1)])
+
+    # the snapshot is written off the hub, the node goes on recording meanwhile
+    snapshot_task = gevent.spawn(node.journal.snapshot, node.data_manager)
+    gevent.sleep(0)
+    assert not snapshot_task.ready()
+    handle_state_changes(node, [new_limit_order(2)])
+    snapshot_task.get()
+    node.journal.close()
+
+    journal, data_manager, entries = restore(market, str(tmpdir))
+    assert [entry.state_change.data['order_id'] for entry in entries] == [2]
+    assert sorted(data_manager.orders) == [1, 2]
+    journal.close()
+
+
+def test_without_journal_nothing_is_recorded(market, monkeypatch):
+    def deterministic(entry):
+        raise AssertionError('handled in the context of an entry')
+
+    monkeypatch.setattr(handle_state_change, 'deterministic', deterministic)
+    node = make_node(market, None)
+    handle_state_changes(node, [new_limit_order(1), offer_published(100)])
+
+    assert list(node.data_manager.orders) == [1]
+    assert node.data_manager.timeout_handler.timeouts[100].scheduled
+
+
+def test_published_offers_are_replayed_at_recorded_time(market, tmpdir):
+    node = make_node(market, StateChangeJournal(str(tmpdir)))
+    node.journal.load()
+    handle_state_changes(node, [offer_published(100), offer_published(101)])
+    node.journal.close()
+    gevent.sleep(0.01)
+
+    journal = StateChangeJournal(str(tmpdir))
+    _, entries = journal.load()
+    data_manager = DataManager(OfferBook(), market)
+    timeout_handler = data_manager.timeout_handler
+    create_new_timeout = timeout_handler.create_new_timeout
+    times = list()
+
+    def recording_create_new_timeout(offer, threshold=0):
+        times.append(timestamp.time())
+        return create_new_timeout(offer, threshold)
+
+    timeout_handler.create_new_timeout = recording_create_new_timeout
+    with replaying():
+        apply_state_changes(data_manager, [entry.state_change for entry in entries], entries)
+        # the timeouts are scheduled when the replay is done, measured on the real clock
+        assert not any(timer.scheduled for timer in timeout_handler.timeouts.values())
+
+    assert times == [entry.timestamp for entry in entries]
+    assert all(timer.scheduled and timer.pending for timer in timeout_handler.timeouts.values())
+    journal.close()
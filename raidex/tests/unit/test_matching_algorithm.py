@@ -0,0 +1,77 @@
+import pytest
+
+from raidex.raidex_node.offer_book import OfferBook, OfferBookEntry
+from raidex.raidex_node.order.offer import OfferType, BasicOffer
+from raidex.raidex_node.order.limit_order import LimitOrder
+from raidex.raidex_node.matching.matching_algorithm import match_limit, match_limit_price_time
+from raidex.utils.random import create_random_32_bytes_id
+from raidex.utils.timestamp import time_plus
+
+
+def make_entry(offer_type, base_amount, price):
+    offer = BasicOffer(offer_id=create_random_32_bytes_id(),
+                       offer_type=offer_type,
+                       base_amount=base_amount,
+                       quote_amount=base_amount * price,
+                       timeout_date=time_plus(seconds=60))
+    return OfferBookEntry(offer, None, None)
+
+
+@pytest.fixture
+def offer_book():
+    return OfferBook()
+
+
+def test_buy_sweeps_multiple_levels(offer_book):
+    cheap = make_entry(OfferType.SELL, 10, 99)
+    middle = make_entry(OfferType.SELL, 10, 100)
+    expensive = make_entry(OfferType.SELL, 10, 102)
+    for entry in (expensive, middle, cheap):
+        offer_book.insert_offer(entry)
+
+    order = LimitOrder(create_random_32_bytes_id(), OfferType.BUY, 25, 101)
+
+    assert match_limit(offer_book, order) == ([], 25)
+
+    take_offers, amount_left = match_limit_price_time(offer_book, order)
+    assert take_offers == [cheap, middle]
+    assert amount_left == 5
+
+
+def test_sell_sweeps_from_highest_buy(offer_book):
+    low = make_entry(OfferType.BUY, 10, 98)
+    high = make_entry(OfferType.BUY, 10, 101)
+    for entry in (low, high):
+        offer_book.insert_offer(entry)
+
+    order = LimitOrder(create_random_32_bytes_id(), OfferType.SELL, 20, 99)
+
+    take_offers, amount_left = match_limit_price_time(offer_book, order)
+    assert take_offers == [high]
+    assert amount_left == 10
+
+
+def test_time_priority_within_level(offer_book):
+    first = make_entry(OfferType.BUY, 10, 100)
+    second = make_entry(OfferType.BUY, 10, 100)
+    offer_book.insert_offer(first)
+    offer_book.insert_offer(second)
+
+    order = LimitOrder(create_random_32_bytes_id(), OfferType.SELL, 10, 100)
+
+    take_offers, amount_left = match_limit_price_time(offer_book, order)
+    assert take_offers == [first]
+    assert amount_left == 0
+
+
+def test_skips_offers_bigger_than_amount_left(offer_book):
+    big = make_entry(OfferType.SELL, 30, 99)
+    small = make_entry(OfferType.SELL, 5, 100)
+    offer_book.insert_offer(big)
+    offer_book.insert_offer(small)
+
+    order = LimitOrder(create_random_32_bytes_id(), OfferType.BUY, 10, 100)
+
+    take_offers, amount_left = match_limit_price_time(offer_book, order)
+    assert take_offers == [small]
+    assert amount_left == 5
@@ -0,0 +1,154 @@
+from fractions import Fraction
+
+import pytest
+
+from raidex.raidex_node.offer_book import OfferBook, OfferBookEntry
+from raidex.raidex_node.order.offer import OfferType, BasicOffer
+from raidex.raidex_node.offer_grouping import group_offers
+from raidex.utils.price import fixed_point_price, to_fixed_point
+from raidex.utils.random import create_random_32_bytes_id
+from raidex.utils.timestamp import time_plus
+
+
+def make_entry(offer_type, base_amount, quote_amount):
+    offer = BasicOffer(offer_id=create_random_32_bytes_id(),
+                       offer_type=offer_type,
+                       base_amount=base_amount,
+                       quote_amount=quote_amount,
+                       timeout_date=time_plus(seconds=60))
+    return OfferBookEntry(offer, None, None)
+
+
+@pytest.fixture
+def offer_book():
+    offer_book = OfferBook()
+    for price in (1, 2, 2, 3, 4):
+        offer_book.insert_offer(make_entry(OfferType.SELL, 10, 10 * price))
+        offer_book.insert_offer(make_entry(OfferType.BUY, 10, 10 * price))
+    return offer_book
+
+
+def test_get_offers_by_price(offer_book):
+
+    offers = offer_book.get_offers_by_price(to_fixed_point(2), OfferType.BUY)
+
+    assert len(offers) == 2
+    assert all(offer.price == 2 for offer in offers)
+    assert all(offer.offer.type == OfferType.SELL for offer in offers)
+    assert offer_book.get_offers_by_price(to_fixed_point(5), OfferType.BUY) == []
+
+
+def test_get_offers_in_price_range(offer_book):
+
+    offers = offer_book.sells.get_offers_in_price_range(to_fixed_point(2), to_fixed_point(3))
+    assert [offer.price for offer in offers] == [2, 2, 3]
+
+    offers = offer_book.buys.get_offers_in_price_range(to_fixed_point(2), to_fixed_point(3), reverse=True)
+    assert [offer.price for offer in offers] == [3, 2, 2]
+
+    assert offer_book.sells.get_offers_in_price_range(to_fixed_point(4.5), to_fixed_point(10)) == []
+
+
+def test_get_best_price_levels(offer_book):
+
+    levels = offer_book.get_best_price_levels(2, OfferType.BUY)
+    assert [price for price, _ in levels] == [to_fixed_point(1), to_fixed_point(2)]
+    assert len(levels[1][1]) == 2
+
+    levels = offer_book.get_best_price_levels(2, OfferType.SELL)
+    assert [price for price, _ in levels] == [to_fixed_point(4), to_fixed_point(3)]
+
+
+def test_min_max_price(offer_book):
+
+    assert offer_book.sells.min_price == to_fixed_point(1)
+    assert offer_book.sells.max_price == to_fixed_point(4)
+    assert OfferBook().buys.min_price is None
+
+
+def test_fixed_point_price_is_exact():
+    # amounts with the same ratio always map to the same integer price key
+    first = make_entry(OfferType.SELL, 3, 1)
+    second = make_entry(OfferType.SELL, 6, 2)
+
+    assert first.price_int == second.price_int == 333333333333333333
+    assert to_fixed_point(0.1) == 10 ** 17
+
+
+def test_fixed_point_rounding_is_consistent():
+    # amounts and a limit price of the same ratio get the same key, both are rounded half to even
+    assert fixed_point_price(3, 2) == to_fixed_point(Fraction(2, 3)) == to_fixed_point('2/3') == 666666666666666667
+    assert fixed_point_price(2, 1, 0) == to_fixed_point(0.5, 0) == 0
+    assert fixed_point_price(2, 3, 0) == to_fixed_point(1.5, 0) == 2
+
+
+def test_group_offers(offer_book):
+
+    offer_book.insert_offer(make_entry(OfferType.SELL, 10, 25))
+
+    grouped = group_offers(offer_book.sells.values(), price_group_precision=0)
+
+    assert [group.price_string for group in grouped] == ['1', '2', '3', '4']
+    assert [group.amount for group in grouped] == [10, 30, 10, 10]
+
+    grouped = group_offers(offer_book.sells.values(), price_group_precision=1)
+
+    assert [group.price_string for group in grouped] == ['1.0', '2.0', '2.5', '3.0', '4.0']
+
+
+def test_group_offers_floors_prices():
+    # prices are floored into their bucket, as with the ROUND_FLOOR Decimal context of the offer grouping
+    entries = [
+        make_entry(OfferType.SELL, 10, 3),  # 0.3, a float of it would floor to 0.2
+        make_entry(OfferType.SELL, 20, 23),  # 1.15, would round half to even to 1.2
+        make_entry(OfferType.SELL, 100, 299),  # 2.99
+        make_entry(OfferType.SELL, 10 ** 19, 10 ** 19 - 1),  # just below 1, its fixed-point price is 1.0
+    ]
+
+    grouped = group_offers(entries, price_group_precision=1)
+
+    assert [group.price_string for group in grouped] == ['0.3', '0.9', '1.1', '2.9']
+
+
+def test_depth_ladder_follows_inserts_and_removals(offer_book):
+
+    ladder = offer_book.sells.depth_ladders[1]
+
+    assert ladder.levels() == group_offers(offer_book.sells.values(), price_group_precision=1)
+    assert [group.amount for group in ladder.levels()] == [10, 20, 10, 10]
+
+    entry = make_entry(OfferType.SELL, 5, 10)
+    offer_book.insert_offer(entry)
+    assert [group.amount for group in ladder.levels()] == [10, 25, 10, 10]
+    assert ladder.levels()[1].avg_timeout <= entry.timeout_date
+
+    offer_book.remove_offer(entry.offer_id)
+    assert [group.amount for group in ladder.levels()] == [10, 20, 10, 10]
+
+    for offer in offer_book.get_offers_by_price(to_fixed_point(1), OfferType.BUY):
+        offer_book.remove_offer(offer.offer_id)
+    assert [group.price_string for group in ladder.levels()] == ['2.0', '3.0', '4.0']
+
+
+def test_grouped_without_configured_ladder(offer_book):
+
+    assert offer_book.sells.grouped(0) == group_offers(offer_book.sells.values(), price_group_precision=0)
+    assert 0 not in offer_book.sells.depth_ladders
+
+
+def test_insert_offers_matches_single_inserts(offer_book):
+
+    entries = [make_entry(OfferType.SELL, 10, 10 * price) for price in (3, 1, 2)]
+    entries.append(make_entry(OfferType.BUY, 10, 20))
+    # the repeated offer is ordered by its last occurrence
+    entries.append(entries[1])
+
+    single = OfferBook()
+    for entry in entries:
+        single.insert_offer(entry)
+    batched = OfferBook()
+    assert sorted(batched.insert_offers(entries)) == sorted({entry.offer_id for entry in entries})
+
+    for view in ('buys', 'sells'):
+        assert list(getattr(batched, view).offer_entries.values()) == list(getattr(single, view).offer_entries.values())
+        assert getattr(batched, view).depth_ladders[1].levels() == getattr(single, view).depth_ladders[1].levels()
@@ -0,0 +1,59 @@
+from eth_utils import keccak
+
+from raidex.messages import Commitment, CommitmentProof
+from raidex.raidex_node.transport.client import StreamingRequestTask
+from raidex.raidex_node.transport.signature_verifier import SignatureVerifier
+from raidex.utils import timestamp
+
+
+def make_commitment(account, offer_id):
+    commitment = Commitment(offer_id=offer_id, offer_hash=keccak(text='offer id'), timeout=timestamp.time_plus(1),
+                            amount=10)
+    commitment.sign(account.privatekey)
+    return Commitment.deserialize(commitment.serialize(commitment))
+
+
+def test_verify_keeps_order_and_sets_senders(accounts):
+    batch = [make_commitment(accounts[i % 2], i) for i in range(6)]
+    batch.insert(3, 'not a signed message')
+
+    verifier = SignatureVerifier(threads=2, min_chunk_size=2)
+    try:
+        verified = verifier.verify(batch)
+    finally:
+        verifier.stop()
+
+    assert verified == batch
+    for i, message in enumerate(m for m in verified if isinstance(m, Commitment)):
+        assert message._sender == accounts[i % 2].address
+
+
+def test_verify_drops_invalid_signatures(accounts):
+    valid = make_commitment(accounts[0], 1)
+    proof = CommitmentProof(valid.signature, keccak(text='secret'), keccak(text='secret hash'), 1,
+                            signature=b'\x00' * 65)
+
+    verified = SignatureVerifier(threads=1).verify([proof, valid])
+
+    assert verified == [valid]
+    assert valid.sender == accounts[0].address
+
+
+class DecodedMessage(object):
+
+    def __init__(self, message):
+        self.message = message
+        self.message_type = type(message)
+
+
+def test_end_of_stream_hands_on_queued_messages(accounts):
+    batch = [make_commitment(accounts[0], i) for i in range(3)]
+    task = StreamingRequestTask('http://localhost:5000/api', 'topic', verifier=SignatureVerifier(threads=1))
+    task._iter_messages = lambda: iter([DecodedMessage(message) for message in batch])
+    listener = task.create_listener()
+
+    task.start()
+    task.join(timeout=5)
+
+    assert task.dead
+    assert [listener.message_queue_async.get_nowait() for _ in batch] == batch
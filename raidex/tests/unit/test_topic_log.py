@@ -0,0 +1,111 @@
+import pytest
+
+from raidex.message_broker.topic_log import TopicLog
+
+
+@pytest.fixture()
+def topic_log(tmpdir):
+    log = TopicLog(str(tmpdir), segment_size=64)
+    yield log
+    log.close()
+
+
+def test_append_and_read(topic_log):
+    assert topic_log.next_offset('broadcast') == 0
+    assert topic_log.append('broadcast', b'first') == 0
+    assert topic_log.append('broadcast', b'second') == 1
+    assert topic_log.append('0xabc/direct', b'other') == 0
+
+    assert topic_log.read('broadcast', 1) == b'second'
+    assert topic_log.read('0xabc/direct', 0) == b'other'
+    assert topic_log.next_offset('broadcast') == 2
+    with pytest.raises(IndexError):
+        topic_log.read('broadcast', 2)
+
+
+def test_segments_roll_over(topic_log):
+    records = [bytes([i]) * 20 for i in range(1, 10)]
+    for record in records:
+        topic_log.append('broadcast', record)
+
+    assert len(topic_log._segments['broadcast']) > 1
+    assert [topic_log.read('broadcast', offset) for offset in range(len(records))] == records
+    assert list(topic_log.iter_from('broadcast', 3)) == list(enumerate(records))[3:]
+    assert list(topic_log.iter_from('broadcast', 2, end=5)) == list(enumerate(records))[2:5]
+
+    with pytest.raises(ValueError):
+        topic_log.append('broadcast', b'x' * 64)
+
+
+def test_reopen_rebuilds_index(tmpdir):
+    records = [bytes([i]) * 20 for i in range(1, 10)]
+    topic_log = TopicLog(str(tmpdir), segment_size=64)
+    for record in records:
+        topic_log.append('broadcast', record)
+    topic_log.close()
+
+    reopened = TopicLog(str(tmpdir), segment_size=64)
+    assert reopened.next_offset('broadcast') == len(records)
+    assert [data for _, data in reopened.iter_from('broadcast', 0)] == records
+    assert reopened.append('broadcast', b'next') == len(records)
+    reopened.close()
+
+
+def test_segment_grows_and_is_sealed(tmpdir):
+    topic_log = TopicLog(str(tmpdir), segment_size=256, initial_segment_size=64)
+    segment_file = tmpdir.join('broadcast', '{:020d}.log'.format(0))
+
+    topic_log.append('broadcast', b'x' * 20)
+    assert segment_file.size() == 64
+
+    for _ in range(5):
+        topic_log.append('broadcast', b'x' * 20)
+    assert segment_file.size() == 256
+
+    # the full segment is truncated to its records, when the next one is started
+    for _ in range(5):
+        topic_log.append('broadcast', b'x' * 20)
+    assert len(topic_log._segments['broadcast']) == 2
+    assert segment_file.size() == 10 * 24
+    topic_log.close()
+
+
+def test_retention_deletes_old_segments(tmpdir):
+    records = [bytes([i]) * 20 for i in range(1, 10)]
+    topic_log = TopicLog(str(tmpdir), segment_size=64, retention_segments=2)
+    replay = topic_log.iter_from('broadcast', 0, end=len(records))
+    for record in records:
+        topic_log.append('broadcast', record)
+
+    first_offset = topic_log.first_offset('broadcast')
+    assert first_offset > 0
+    assert len(tmpdir.join('broadcast').listdir()) == 2
+    with pytest.raises(IndexError):
+        topic_log.read('broadcast', first_offset - 1)
+    # a replay starts at the oldest retained message
+    assert list(replay) == list(enumerate(records))[first_offset:]
+    topic_log.close()
+
+
+def test_least_recently_used_topics_are_closed(tmpdir):
+    topic_log = TopicLog(str(tmpdir), max_open_topics=2)
+    topic_log.append('first', b'first')
+    replay = topic_log.iter_from('first', 0)
+    topic_log.append('second', b'second')
+    topic_log.append('third', b'third')
+    assert list(topic_log._segments) == ['second', 'third']
+
+    # the topic is opened again when it is used
+    assert list(replay) == [(0, b'first')]
+    assert topic_log.append('first', b'again') == 1
+    assert list(topic_log._segments) == ['third', 'first']
+    topic_log.close()
+
+
+def test_reopen_empty_segment(tmpdir):
+    tmpdir.mkdir('broadcast').join('{:020d}.log'.format(0)).write_binary(b'')
+
+    topic_log = TopicLog(str(tmpdir), segment_size=64)
+    assert topic_log.next_offset('broadcast') == 0
+    assert topic_log.append('broadcast', b'first') == 0
+    topic_log.close()
@@ -266,6 +266,7 @@ class EventListener(object):
         """Stops listening for new events"""
         if self.listener is not None:
             self.trader_client.stop_listen(self.listener)
+            self.listener = None
 
 
 class TransferReceivedListener(EventListener):
@@ -1,51 +1,221 @@
-from gevent import spawn_later, kill
+from heapq import heappush, heappop, heapify
+from itertools import count
+from time import monotonic
+
+import gevent
+import structlog
+from gevent.event import Event
 
 from raidex.raidex_node.architecture.state_change import OfferTimeoutStateChange
 from raidex.exceptions import AlreadyTimedOutException
 from raidex.utils.timestamp import seconds_to_timeout
-from raidex.raidex_node.architecture.event_architecture import dispatch_state_changes
+from raidex.raidex_node.architecture.event_architecture import current_context, defer_while_replaying
 
+log = structlog.get_logger('timeout_scheduler')
 
-def future_timeout(offer_id, timeout, threshold=0):
 
-    lifetime = seconds_to_timeout(timeout) - threshold
-    return spawn_later(lifetime, dispatch_state_changes, OfferTimeoutStateChange(offer_id, timeout))
+class Timer:
 
+    __slots__ = [
+        'deadline',
+        'callback',
+        'arg',
+        'cancelled',
+        'fired',
+        'threshold',
+    ]
 
-def kill_greenlet(greenlet):
-    kill(greenlet)
+    def __init__(self, deadline, callback, arg):
+        self.deadline = deadline
+        self.callback = callback
+        self.arg = arg
+        self.cancelled = False
+        self.fired = False
+        # seconds the timer fires before the timeout, for offer timeouts
+        self.threshold = 0
 
+    @property
+    def pending(self):
+        return not self.cancelled and not self.fired
 
-class TimeoutHandler:
+    @property
+    def scheduled(self):
+        return self.deadline is not None
+
+
+class TimeoutScheduler:
+    """
+    Runs all timers of the process in one greenlet, instead of one greenlet per timer.
+
+    Timers are kept in a heap ordered by deadline. Cancelling only flags the timer, which is O(1),
+    the flagged timers are dropped once they reach the top of the heap (or when they make up the
+    larger part of the heap). All timers that are due at the same time are fired in one batch:
+    every callback is called once with the list of args of its due timers. A callback that raises
+    is logged, the other callbacks of the batch and the later timers still fire.
+    """
 
     def __init__(self):
-        self.timeout_greenlets = dict()
+        self._heap = list()
+        self._sequence = count()
+        self._nof_cancelled = 0
+        self._wakeup = Event()
+        self._greenlet = None
+
+    def schedule(self, seconds, callback, arg):
+        return self.schedule_timer(Timer(None, callback, arg), seconds)
+
+    def schedule_timer(self, timer, seconds):
+        """Schedules a timer that was created unscheduled, i.e. with a deadline of None"""
+        timer.deadline = monotonic() + seconds
+        heappush(self._heap, (timer.deadline, next(self._sequence), timer))
+
+        # the scheduler is sleeping until the old earliest deadline
+        if self._heap[0][2] is timer:
+            self._wakeup.set()
+        self._ensure_running()
+        return timer
+
+    def cancel(self, timer):
+        if not timer.pending:
+            return
+        timer.cancelled = True
+        if not timer.scheduled:
+            return
+        self._nof_cancelled += 1
+
+        if self._nof_cancelled > len(self._heap) // 2:
+            self._compact()
+
+    def __len__(self):
+        return len(self._heap) - self._nof_cancelled
+
+    def _compact(self):
+        self._heap = [item for item in self._heap if not item[2].cancelled]
+        heapify(self._heap)
+        self._nof_cancelled = 0
+
+    def _ensure_running(self):
+        if self._greenlet is None or self._greenlet.dead:
+            self._greenlet = gevent.spawn(self._run)
+
+    def _pop_due_timers(self, now):
+        due_timers = list()
+
+        while self._heap and self._heap[0][0] <= now:
+            _, _, timer = heappop(self._heap)
+            if timer.cancelled:
+                self._nof_cancelled -= 1
+                continue
+            timer.fired = True
+            due_timers.append(timer)
+
+        return due_timers
+
+    def _run(self):
+        while True:
+            self._wakeup.clear()
+
+            due_timers = self._pop_due_timers(monotonic())
+            if due_timers:
+                self._fire(due_timers)
+                continue
+
+            if self._heap:
+                self._wakeup.wait(self._heap[0][0] - monotonic())
+            else:
+                self._wakeup.wait()
+
+    @staticmethod
+    def _fire(timers):
+        # there are only a few distinct callbacks, and bound methods are not necessarily hashable
+        batches = list()
+        for timer in timers:
+            for callback, args in batches:
+                if callback == timer.callback:
+                    args.append(timer.arg)
+                    break
+            else:
+                batches.append((timer.callback, [timer.arg]))
+
+        for callback, args in batches:
+            try:
+                callback(args)
+            except Exception:
+                log.exception('Timeout callback failed', callback=callback, nof_timers=len(args))
+
+
+_default_scheduler = TimeoutScheduler()
+
+
+def future_timeout(offer_id, timeout, threshold=0, scheduler=None):
+
+    if scheduler is None:
+        scheduler = _default_scheduler
+
+    # the timers fire in the scheduler's greenlet, dispatch in the context of the node that set the timeout
+    dispatch_state_changes = current_context().dispatch_state_changes
+    timer = Timer(None, dispatch_state_changes, OfferTimeoutStateChange(offer_id, timeout))
+    timer.threshold = threshold
+
+    def schedule():
+        # the lifetime is measured on the real clock, not on the frozen time of a replayed state change
+        if not timer.cancelled:
+            scheduler.schedule_timer(timer, seconds_to_timeout(timeout) - threshold)
+
+    # a replay schedules the timers that are still set once it is done
+    if not defer_while_replaying(schedule):
+        schedule()
+    return timer
+
+
+class TimeoutHandler:
+
+    def __init__(self, scheduler=None):
+        self.scheduler = scheduler if scheduler is not None else _default_scheduler
+        self.timeouts = dict()
 
     def create_new_timeout(self, offer, threshold=0):
 
         offer_id = offer.offer_id
 
-        if self._has_greenlet(offer_id) and not self._is_still_alive(offer_id):
+        if self._has_timeout(offer_id) and not self._is_still_alive(offer_id):
             raise AlreadyTimedOutException()
 
         self.clean_up_timeout(offer_id)
-        timeout_greenlet = future_timeout(offer_id, offer.timeout_date, threshold)
-        self.timeout_greenlets[offer_id] = timeout_greenlet
+        self.timeouts[offer_id] = future_timeout(offer_id, offer.timeout_date, threshold, self.scheduler)
         return True
 
-    def _has_greenlet(self, offer_id):
-        if offer_id in self.timeout_greenlets:
+    def __getstate__(self):
+        # the timers belong to the running scheduler, only what is needed to schedule them again is kept
+        timeouts = dict()
+        for offer_id, timer in self.timeouts.items():
+            timeouts[offer_id] = (timer.arg.timeout_date, timer.threshold) if timer.pending else None
+        return {'timeouts': timeouts}
+
+    def __setstate__(self, state):
+        self.scheduler = _default_scheduler
+        self.timeouts = dict()
+        for offer_id, timeout in state['timeouts'].items():
+            if timeout is None:
+                timer = Timer(0, None, None)
+                timer.fired = True
+                self.timeouts[offer_id] = timer
+            else:
+                timeout_date, threshold = timeout
+                self.timeouts[offer_id] = future_timeout(offer_id, timeout_date, threshold, self.scheduler)
+
+    def _has_timeout(self, offer_id):
+        if offer_id in self.timeouts:
             return True
         return False
 
     def _is_still_alive(self, offer_id):
 
-        if offer_id in self.timeout_greenlets and not self.timeout_greenlets[offer_id].dead:
+        if offer_id in self.timeouts and self.timeouts[offer_id].pending:
             return True
         return False
 
     def clean_up_timeout(self, offer_id):
 
-        if offer_id in self.timeout_greenlets:
-            kill_greenlet(self.timeout_greenlets[offer_id])
-            del self.timeout_greenlets[offer_id]
\ No newline at end of file
+        if offer_id in self.timeouts:
+            self.scheduler.cancel(self.timeouts.pop(offer_id))
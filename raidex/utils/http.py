@@ -0,0 +1,67 @@
+from urllib.parse import urlsplit
+
+import requests
+from gevent.lock import BoundedSemaphore
+from requests.adapters import HTTPAdapter
+
+# seconds to wait for a connection to be established
+CONNECT_TIMEOUT = 3.05
+# (connect, read) timeouts in seconds of requests that are answered right away, e.g. publishing a message
+REQUEST_TIMEOUT = (CONNECT_TIMEOUT, 30)
+# no timeout by default, raiden answers a payment only when it is completed and long-polls its events
+DEFAULT_TIMEOUT = None
+# number of hosts with a connection pool, and number of kept-alive connections per host
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+
+class PooledSession(requests.Session):
+    """A `requests.Session` with a keep-alive connection pool per host and a default timeout.
+
+    At most `pool_maxsize` requests per host are in flight, further requests wait for a free slot. The wait is a
+    gevent semaphore, urllib3's blocking pool would block the whole thread in processes whose threading isn't
+    monkey-patched. Streaming requests (`stream=True`) keep their connection as long as they are read and are not
+    counted, so long-lived subscriptions don't starve the other requests.
+
+    Requests that are passed an explicit `timeout` keep it.
+    """
+
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                 timeout=DEFAULT_TIMEOUT, max_retries=0):
+        super(PooledSession, self).__init__()
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self._host_slots = dict()  # (scheme, host) -> BoundedSemaphore
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=max_retries)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if kwargs.get('stream'):
+            return super(PooledSession, self).request(method, url, **kwargs)
+        host = urlsplit(url)[:2]
+        slots = self._host_slots.get(host)
+        if slots is None:
+            slots = self._host_slots[host] = BoundedSemaphore(self.pool_maxsize)
+        with slots:
+            return super(PooledSession, self).request(method, url, **kwargs)
+
+
+_default_session = None
+
+
+def configure_default_session(**kwargs):
+    """Replaces the process wide session, for parameters see `PooledSession`"""
+    global _default_session
+    if _default_session is not None:
+        _default_session.close()
+    _default_session = PooledSession(**kwargs)
+    return _default_session
+
+
+def default_session():
+    """The process wide session, shared by all clients that don't bring their own"""
+    if _default_session is None:
+        return configure_default_session()
+    return _default_session
@@ -0,0 +1,37 @@
+from decimal import Decimal
+from fractions import Fraction
+
+# default number of digits after the decimal point of a fixed-point price
+DEFAULT_PRICE_DECIMAL = 18
+
+
+def _round_half_even(numerator, denominator):
+    quotient, remainder = divmod(numerator, denominator)
+    if 2 * remainder > denominator or (2 * remainder == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+def fixed_point_price(base_amount, quote_amount, price_decimal=DEFAULT_PRICE_DECIMAL):
+    """
+    Returns quote_amount / base_amount as an integer with `price_decimal` implicit fractional digits.
+    The exact ratio is rounded half to even, like `to_fixed_point`, so two offers with the same amounts ratio
+    and a limit price of exactly that ratio all get the same price.
+    """
+    return _round_half_even(quote_amount * 10 ** price_decimal, base_amount)
+
+
+def to_fixed_point(price, price_decimal=DEFAULT_PRICE_DECIMAL):
+    """
+    Returns the price as an integer with `price_decimal` implicit fractional digits, rounded half to even.
+    The price can be an int, float, Decimal, Fraction or a string like '2/3'.
+    """
+    if isinstance(price, float):
+        # the str() round trip keeps the shortest decimal representation of a float, e.g. 0.1 stays 0.1
+        price = Decimal(str(price))
+    price = Fraction(price)
+    return _round_half_even(price.numerator * 10 ** price_decimal, price.denominator)
+
+
+def from_fixed_point(price_int, price_decimal=DEFAULT_PRICE_DECIMAL):
+    return Decimal(price_int).scaleb(-price_decimal)
@@ -1,5 +1,31 @@
+import random
+from contextlib import contextmanager
 from uuid import uuid4
 
+from gevent.local import local
+
+
+class _SeededIds(local):
+    # source of the ids of the greenlet while inside `seeded_ids`, None otherwise
+    random = None
+
+
+_seeded = _SeededIds()
+
+
+@contextmanager
+def seeded_ids(seed):
+    """Derives the ids created by `create_random_32_bytes_id` from the seed, so they can be reproduced"""
+    previous = _seeded.random
+    _seeded.random = random.Random(seed)
+    try:
+        yield
+    finally:
+        _seeded.random = previous
+
 
 def create_random_32_bytes_id():
-    return int(uuid4().int % (2 ** 32 - 1))
\ No newline at end of file
+    seeded_random = _seeded.random
+    if seeded_random is not None:
+        return seeded_random.randrange(2 ** 32 - 1)
+    return int(uuid4().int % (2 ** 32 - 1))
@@ -1,7 +1,18 @@
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+
+from gevent.local import local
 # TODO test the timestamp and roundings
 
 
+class _FrozenTime(local):
+    # the current time of the greenlet while inside `frozen_time`, None otherwise
+    now = None
+
+
+_frozen = _FrozenTime()
+
+
 def _dt_to_ms_timestamp(dt, epoch=datetime(1970, 1, 1)):
     td = dt - epoch
     return int(round(td.total_seconds() * 1000.0))
@@ -23,18 +34,40 @@ def to_milliseconds(s):
     return s * 1000.
 
 
+def _utcnow():
+    now = _frozen.now
+    if now is not None:
+        return now
+    return datetime.utcnow()
+
+
+@contextmanager
+def frozen_time(timestamp):
+    """Makes the current time of `time`, `time_plus`, `time_minus` and `timed_out` the ms timestamp.
+
+    Used to handle a state change at the time it was originally recorded, so that replaying it gives the same
+    result. `seconds_to_timeout` keeps using the real clock, as it is used for scheduling.
+    """
+    previous = _frozen.now
+    _frozen.now = _ms_timestamp_to_dt(timestamp)
+    try:
+        yield
+    finally:
+        _frozen.now = previous
+
+
 def time_plus(seconds=0, milliseconds=0, microseconds=0):
     td = timedelta(seconds=seconds, milliseconds=milliseconds, microseconds=microseconds)
-    return _dt_to_ms_timestamp(datetime.utcnow() + td)
+    return _dt_to_ms_timestamp(_utcnow() + td)
 
 
 def time_minus(seconds=0, milliseconds=0, microseconds=0):
     td = timedelta(seconds=seconds, milliseconds=milliseconds, microseconds=microseconds)
-    return _dt_to_ms_timestamp(datetime.utcnow() - td)
+    return _dt_to_ms_timestamp(_utcnow() - td)
 
 
 def time():
-    now = datetime.utcnow()
+    now = _utcnow()
     return _dt_to_ms_timestamp(now)
 
 
@@ -50,7 +83,7 @@ def seconds_to_timeout(timeout):
 
 def timed_out(timeout):
     timeout_dt = _ms_timestamp_to_dt(timeout)
-    return timeout_dt < datetime.utcnow()
+    return timeout_dt < _utcnow()
 
 
 